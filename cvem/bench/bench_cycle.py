@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+End to end benchmark of the monitor loops of MonitorONE against the fake ONE server (bench/fake_one.py).
+For each number of VMs it measures the latency of the loops, the ONE calls per loop,
+the peak RSS of the monitor and the VMs evaluated per second. The memory changes are
+really executed using the sink of the fake server.
+
+The results are printed in JSON in the stdout (and a summary in the stderr).
+Any Config value can be set with KEY=VALUE (i.e. BATCH_SIZING=True MAX_THREADS=8).
+
+Usage: python bench/bench_cycle.py [--cycles N] [--output FILE] [num_vms ...] [KEY=VALUE ...]
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+import xmlrpclib
+from optparse import OptionParser
+
+CHILD_HELP = "internal option used to run the monitor in a child process"
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_PATH, ".."))
+
+def get_calls_diff(before, after):
+	return dict((key, after.get(key, 0) - before.get(key, 0)) for key in after if after.get(key, 0) != before.get(key, 0))
+
+def percentile(values, pct):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+def run_monitor(port, sink_file, data_dir, cycles, config_values):
+	"""
+	Run the monitor loops (in the benchmark child process)
+
+	Return: dict with the results
+	"""
+	from cvem.config import Config, logger
+	import fake_one
+	for key, value in fake_one.get_sink_config(sink_file).items():
+		setattr(Config, key, value)
+	Config.DATA_FILE = os.path.join(data_dir, "cvem.dat")
+	Config.ONLY_TEST = False
+	Config.DELAY = 1
+	for key, value in config_values.items():
+		setattr(Config, key, value)
+
+	from connectors.one.config_one import ConfigONE
+	ConfigONE.ONE_SERVER = "127.0.0.1"
+	ConfigONE.ONE_PORT = port
+	ConfigONE.ONE_ID = "bench:bench"
+	from connectors.one.OpenNebula import MonitorONE
+	from multiprocessing.pool import ThreadPool
+
+	fake_server = xmlrpclib.ServerProxy("http://127.0.0.1:%d/RPC2" % port)
+	monitor = MonitorONE()
+	monitor.start_shard_pool()
+	pool = ThreadPool(processes=Config.MAX_THREADS)
+
+	latencies = []
+	calls = fake_server.fake.get_calls()
+	first_calls = None
+	for cycle in range(cycles):
+		start = time.time()
+		monitor.run_cycle(pool)
+		latencies.append(time.time() - start)
+		if cycle == 0:
+			first_calls = fake_server.fake.get_calls()
+		if cycle < cycles - 1:
+			time.sleep(Config.DELAY)
+
+	# Let the background threads (i.e. the MemInfoPublisher) finish their calls
+	time.sleep(max(1.0, Config.DELAY))
+	steady_calls = get_calls_diff(first_calls, fake_server.fake.get_calls())
+	if monitor.shard_pool:
+		monitor.shard_pool.stop()
+	first_calls = get_calls_diff(calls, first_calls)
+	steady_cycles = max(1, cycles - 1)
+	memory_changes = first_calls.pop('memory_changes', 0) + steady_calls.pop('memory_changes', 0)
+	evaluations = monitor.metrics.vm_evaluations.values
+	evaluated = evaluations.get(("evaluated",), 0)
+	skipped = evaluations.get(("skipped",), 0)
+	logger.info("Benchmark finished")
+
+	return {'cycles': cycles,
+		'latency': {'first': latencies[0], 'mean': sum(latencies) / len(latencies), 'p50': percentile(latencies, 50),
+			'p95': percentile(latencies, 95), 'max': max(latencies),
+			'steady_mean': sum(latencies[1:]) / steady_cycles if cycles > 1 else latencies[0]},
+		'rpc_first_cycle': first_calls,
+		'rpc_per_cycle': dict((key, float(value) / steady_cycles) for key, value in steady_calls.items()),
+		'memory_changes': memory_changes,
+		'skipped_ratio': float(skipped) / (evaluated + skipped) if evaluated + skipped else 0.0,
+		'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+		# Only the VMs evaluated (not the skipped or deferred ones) are decisions
+		'decisions_per_sec': evaluated / sum(latencies)}
+
+def run_size(num_vms, cycles, config_args, publish_rate = 1.0):
+	"""
+	Start a fake ONE server with num_vms VMs and run the monitor against it in a new process
+
+	Return: dict with the results
+	"""
+	data_dir = tempfile.mkdtemp(prefix="cvem_bench_")
+	sink_file = os.path.join(data_dir, "sink")
+	num_hosts = max(1, num_vms / 20)
+	server = subprocess.Popen([sys.executable, os.path.join(BENCH_PATH, "fake_one.py"), "--vms", str(num_vms),
+			"--hosts", str(num_hosts), "--port", "0", "--sink", sink_file, "--publish-rate", str(publish_rate)],
+			stdout=subprocess.PIPE)
+	try:
+		port = server.stdout.readline().strip()
+		out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", port,
+				"--sink", sink_file, "--data-dir", data_dir, "--cycles", str(cycles)] + config_args)
+		res = json.loads(out)
+		res['vms'] = num_vms
+		res['hosts'] = num_hosts
+		return res
+	finally:
+		server.terminate()
+		server.wait()
+		shutil.rmtree(data_dir, True)
+
+def parse_config_values(args):
+	res = {}
+	for arg in args:
+		key, value = arg.split("=", 1)
+		try:
+			res[key] = eval(value, {})
+		except Exception:
+			res[key] = value
+	return res
+
+def main():
+	parser = OptionParser(usage="%prog [options] [num_vms ...] [KEY=VALUE ...]")
+	parser.add_option("--cycles", type="int", default=5, help="number of monitor loops of each size")
+	parser.add_option("--output", default=None, help="file to write the JSON results")
+	parser.add_option("--publish-rate", type="float", default=1.0, help="fraction of the VMs that publish new metrics in each loop")
+	parser.add_option("--run", type="int", default=None, help=CHILD_HELP)
+	parser.add_option("--sink", default=None, help=CHILD_HELP)
+	parser.add_option("--data-dir", default=None, help=CHILD_HELP)
+	(options, args) = parser.parse_args()
+
+	config_args = [arg for arg in args if "=" in arg]
+	config_values = parse_config_values(config_args)
+	if options.run is not None:
+		res = run_monitor(options.run, options.sink, options.data_dir, options.cycles, config_values)
+		print json.dumps(res)
+		return
+
+	sizes = [int(arg) for arg in args if "=" not in arg] or [100, 1000, 10000]
+	results = []
+	sys.stderr.write("%8s %10s %10s %10s %14s %12s %12s\n" % ("VMs", "first (s)", "mean (s)", "max (s)", "RPC/loop", "RSS (KB)", "VMs/sec"))
+	for num_vms in sizes:
+		res = run_size(num_vms, options.cycles, config_args, options.publish_rate)
+		results.append(res)
+		sys.stderr.write("%8d %10.3f %10.3f %10.3f %14.1f %12d %12.1f\n" % (num_vms, res['latency']['first'],
+				res['latency']['mean'], res['latency']['max'], sum(res['rpc_per_cycle'].values()),
+				res['peak_rss_kb'], res['decisions_per_sec']))
+
+	report = {'benchmark': 'cycle', 'timestamp': int(time.time()), 'python': platform.python_version(),
+		'platform': platform.platform(), 'cycles': options.cycles, 'publish_rate': options.publish_rate,
+		'config': config_values, 'results': results}
+	out = json.dumps(report, indent=1, sort_keys=True)
+	if options.output:
+		with open(options.output, "w") as f:
+			f.write(out + "\n")
+	print out
+
+if __name__ == "__main__":
+	main()
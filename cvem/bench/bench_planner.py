@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Benchmark of the MigrationPlanner against the greedy per-VM migration
+(the smallest VM of the host to the host with more free memory)
+on a synthetic cluster.
+
+Usage: python bench/bench_planner.py [num_hosts] [num_vms] [pressure_ratio]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cvem.CMPInfo import VirtualMachineInfo, HostInfo, VMIndex
+from cvem.MigrationPlanner import MigrationPlanner, MigrationRequest
+
+MEM_MARGIN = 102400
+
+def build_cluster(num_hosts, num_vms, pressure_ratio, seed = 0):
+	"""
+	Create the hosts and VMs of the cluster and the memory requests
+	of the VMs of the hosts under memory pressure
+	"""
+	rnd = random.Random(seed)
+	hosts = []
+	for host_id in range(num_hosts):
+		host = HostInfo(host_id, "host%d" % host_id)
+		host.free_cpus = rnd.choice([2, 4, 8, 16])
+		hosts.append(host)
+
+	vms = []
+	used = dict((host.id, 0) for host in hosts)
+	for vm_id in range(num_vms):
+		host = hosts[rnd.randrange(num_hosts)]
+		vm = VirtualMachineInfo(vm_id, host, rnd.choice([1, 2, 4, 8]) * 1048576)
+		vm.total_memory = int(vm.allocated_memory * rnd.uniform(0.3, 1.0))
+		vm.cpus = rnd.choice([0.5, 1, 2])
+		used[host.id] += vm.total_memory
+		vms.append(vm)
+
+	requests = []
+	pressured = set(rnd.sample(range(num_hosts), int(num_hosts * pressure_ratio)))
+	for host in hosts:
+		capacity = int(used[host.id] * 1.1) + 4 * 1048576
+		host.free_memory = capacity - used[host.id]
+		if host.id in pressured:
+			host.free_memory = rnd.randrange(0, MEM_MARGIN * 2)
+
+	index = VMIndex(vms)
+	for host_id in pressured:
+		host_vms = index.get_host_vms(host_id)
+		for vm in rnd.sample(host_vms, min(len(host_vms), 3)):
+			requests.append(MigrationRequest(vm, hosts[host_id], vm.allocated_memory - vm.total_memory + 1))
+	return hosts, index, requests
+
+def greedy(hosts, index, requests):
+	"""
+	The per-VM migration: each request migrates the smallest VM of its host to the host
+	with more free memory of the snapshot, without knowing the rest of the decisions
+	"""
+	migrations = []
+	migrated = set()
+	for request in requests:
+		candidates = [vm for vm in index.get_host_vms(request.host.id) if vm.id != request.vm.id and vm.id not in migrated]
+		if not candidates:
+			continue
+		vm = min(candidates, key=MigrationPlanner.get_vm_memory)
+		for host in sorted(hosts, key=lambda h: h.free_memory, reverse=True):
+			if host.id != request.host.id and host.free_memory > vm.total_memory and host.free_cpus > vm.cpus:
+				migrations.append((vm, request.host, host))
+				migrated.add(vm.id)
+				break
+	return migrations
+
+def evaluate(hosts, requests, migrations):
+	"""
+	Get the number of target hosts overcommitted and of source hosts
+	whose memory deficit is not covered by the migrations
+	"""
+	incoming = {}
+	freed = {}
+	for vm, source, target in migrations:
+		incoming[target.id] = incoming.get(target.id, 0) + MigrationPlanner.get_vm_memory(vm)
+		freed[source.id] = freed.get(source.id, 0) + MigrationPlanner.get_vm_memory(vm)
+	host_by_id = dict((host.id, host) for host in hosts)
+	overcommitted = sum(1 for host_id, mem in incoming.items() if host_by_id[host_id].free_memory - mem < MEM_MARGIN)
+
+	needed = {}
+	for request in requests:
+		needed[request.host.id] = needed.get(request.host.id, 0) + request.memory
+	uncovered = 0
+	for host_id, mem in needed.items():
+		if freed.get(host_id, 0) + host_by_id[host_id].free_memory - MEM_MARGIN < mem:
+			uncovered += 1
+	return overcommitted, uncovered
+
+def main():
+	num_hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+	num_vms = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+	pressure_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+	hosts, index, requests = build_cluster(num_hosts, num_vms, pressure_ratio)
+	print "Hosts: %d, VMs: %d, memory requests: %d" % (num_hosts, num_vms, len(requests))
+	print "%-8s %10s %12s %14s %14s" % ("method", "secs", "migrations", "overcommitted", "uncovered")
+
+	start = time.time()
+	migrations = greedy(hosts, index, requests)
+	elapsed = time.time() - start
+	overcommitted, uncovered = evaluate(hosts, requests, migrations)
+	print "%-8s %10.4f %12d %14d %14d" % ("greedy", elapsed, len(migrations), overcommitted, uncovered)
+
+	start = time.time()
+	planner = MigrationPlanner(hosts, MEM_MARGIN)
+	migrations = planner.plan(requests, lambda host: index.get_host_vms(host.id))
+	elapsed = time.time() - start
+	overcommitted, uncovered = evaluate(hosts, requests, migrations)
+	print "%-8s %10.4f %12d %14d %14d" % ("planner", elapsed, len(migrations), overcommitted, uncovered)
+	print "VMs without target host (planner): %d" % len(planner.unplaced)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Benchmark of the computation of the new memory size of the VMs: size_vm for each VM
+against size_vms in one vectorized pass (it requires NumPy).
+It also checks that both give the same results.
+
+Usage: python bench/bench_sizing.py [num_vms ...]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cvem.config import Config
+from cvem import BatchSizing
+
+def build_inputs(num_vms, now, seed = 0):
+	"""
+	Create the sizing inputs of the VMs covering all the cases: in and out of the band,
+	never modified, in cooldown, without free memory and with the exponential backoff steps
+	"""
+	rnd = random.Random(seed)
+	inputs = []
+	for _ in range(num_vms):
+		allocated = rnd.choice([1, 2, 4, 8]) * 1048576
+		total = rnd.randint(Config.MEM_MIN, allocated)
+		free = rnd.choice([rnd.randint(0, Config.MIN_FREE_MEMORY), rnd.randint(1, total)])
+		real = total + rnd.randint(0, 102400)
+		min_free = rnd.choice([Config.MIN_FREE_MEMORY, 50000])
+		mem_over = rnd.choice([Config.MEM_OVER, 20, 45.5])
+		if rnd.random() < 0.2:
+			mem_diff, last_set_mem, original_mem, count = None, None, None, 0
+		else:
+			mem_diff = real - total
+			last_set_mem = now - rnd.uniform(0, Config.COOLDOWN * 3)
+			original_mem = allocated
+			count = rnd.randint(0, 3)
+		forecast = rnd.choice([None, None, rnd.randint(0, total)])
+		inputs.append((free, total, real, allocated, min_free, mem_over, mem_diff, last_set_mem, original_mem, count, forecast))
+	return inputs
+
+def main():
+	sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+	if BatchSizing.numpy is None:
+		print "NumPy is not installed: size_vms uses size_vm for each VM."
+
+	now = time.time()
+	print "%8s %12s %12s %8s %16s %10s %10s" % ("VMs", "scalar secs", "batch secs", "speedup", "+decisions secs", "changes", "identical")
+	for num_vms in sizes:
+		inputs = build_inputs(num_vms, now)
+
+		start = time.time()
+		scalar = [BatchSizing.size_vm(vm_inputs, now) for vm_inputs in inputs]
+		scalar_time = time.time() - start
+
+		start = time.time()
+		batch = BatchSizing.size_vms(inputs, now)
+		batch_time = time.time() - start
+		# Time to create all the SizingDecision objects (made by each thread in the monitor)
+		start = time.time()
+		batch_decisions = list(batch)
+		decisions_time = time.time() - start
+
+		changes = sum(1 for decision in scalar if decision.change)
+		print "%8d %12.4f %12.4f %7.1fx %16.4f %10d %10s" % (num_vms, scalar_time, batch_time, scalar_time / batch_time,
+															decisions_time, changes, scalar == batch_decisions)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Memory benchmark of the monitoring information of the VMs:
+the old representation (a dict of VMMonitorData objects with __dict__)
+against the VMDataStore of slotted VMMonitorData objects.
+
+Usage: python bench/bench_vm_data.py [num_vms]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+class LegacyVMMonitorData:
+	""" Copy of the old VMMonitorData class """
+	def __init__(self, vm_id):
+		self.id = vm_id
+		self.last_set_mem = None
+		self.original_mem = None
+		self.mem_diff = None
+		self.no_free_memory_count = 0
+
+def get_rss():
+	""" Current resident set size of the process (in KB) """
+	statm = open("/proc/self/statm").read().split()
+	return int(statm[1]) * os.sysconf("SC_PAGE_SIZE") / 1024
+
+def fill(vm_data, factory, num_vms):
+	for vm_id in range(num_vms):
+		data = factory(vm_id)
+		data.last_set_mem = time.time()
+		data.original_mem = 2097152 + vm_id
+		data.mem_diff = 97152
+		data.no_free_memory_count = vm_id % 3
+		vm_data[vm_id] = data
+
+def measure(kind, num_vms):
+	if kind == "legacy":
+		before = get_rss()
+		vm_data = {}
+		fill(vm_data, LegacyVMMonitorData, num_vms)
+		rss = get_rss() - before
+
+		current = range(0, num_vms, 2)
+		start = time.time()
+		# The old clean_old_data (only for a part of the VMs, it is O(n^2))
+		sample = min(num_vms, 20000)
+		for vmid in vm_data.keys()[:sample]:
+			if vmid not in current:
+				pass
+		clean = (time.time() - start) * num_vms / sample
+	else:
+		from cvem.Monitor import VMMonitorData
+		from cvem.VMDataStore import VMDataStore
+		before = get_rss()
+		vm_data = VMDataStore(VMMonitorData)
+		fill(vm_data, VMMonitorData, num_vms)
+		rss = get_rss() - before
+
+		start = time.time()
+		vm_data.retain(set(range(0, num_vms, 2)))
+		clean = time.time() - start
+	print "%s %d %.3f" % (kind, rss, clean)
+
+def main():
+	num_vms = 100000
+	if len(sys.argv) > 1:
+		num_vms = int(sys.argv[1])
+
+	if len(sys.argv) > 2:
+		measure(sys.argv[2], num_vms)
+		return
+
+	print "VMs: %d" % num_vms
+	print "%-8s %12s %12s %16s" % ("kind", "RSS (KB)", "bytes/VM", "cleanup (secs)")
+	for kind in ["legacy", "store"]:
+		# Each representation is measured in a new process
+		out = subprocess.check_output([sys.executable, os.path.abspath(__file__), str(num_vms), kind])
+		_, rss, clean = out.split()
+		print "%-8s %12s %12d %16s" % (kind, rss, int(rss) * 1024 / num_vms, clean)
+
+if __name__ == "__main__":
+	main()
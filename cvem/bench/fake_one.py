@@ -0,0 +1,283 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Fake OpenNebula XML-RPC server with a synthetic pool of VMs and hosts, to benchmark the monitor.
+It implements one.vmpool.info, one.vm.info, one.host.info, one.hostpool.info, one.vm.update
+and one.vm.migrate, and the used memory of the VMs changes in each request of the VM pool.
+
+The memory changes are received through a sink file: CHANGE_MEMORY_CMD (see get_sink_config)
+appends a line "vmid newmemory" to the file, and the server applies them before returning the VMs.
+The server also has the fake.get_calls method to get the number of calls of each method.
+
+Usage: python bench/fake_one.py [--vms N] [--hosts N] [--port N] [--sink FILE] [--seed N]
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+import collections
+from optparse import OptionParser
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import ThreadingMixIn
+
+HOST_MEMORY = 64 * 1048576
+""" Memory of each host (in KB) """
+HOST_CPU = 1600
+""" CPU of each host (ONE percentage, 100 per core) """
+
+def get_sink_config(sink_file):
+	"""
+	Get the Config values to send the memory changes of the monitor to the sink file
+
+	Return: dict with the CHANGE_MEMORY_* Config values
+	"""
+	line = "echo {vmid} {newmemory} | tee -a " + sink_file
+	return {'CHANGE_MEMORY_CMD': line, 'CHANGE_MEMORY_BATCH_CMD': "sh", 'CHANGE_MEMORY_BATCH_LINE': line}
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+	# Keep the connections open as ONE does
+	protocol_version = "HTTP/1.1"
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class FakeCloud:
+	"""
+	Synthetic pool of VMs and hosts: each VM has an allocated memory, the memory currently
+	set to it and a used memory that follows a random walk (some of them with fast growths).
+	In each request of the VM pool only a publish_rate fraction of the VMs publish new metrics.
+	"""
+
+	def __init__(self, num_vms, num_hosts, sink_file = None, seed = 0, publish_rate = 1.0):
+		self.rnd = random.Random(seed)
+		self.publish_rate = publish_rate
+		self.num_hosts = max(1, num_hosts)
+		self.sink_file = sink_file
+		self._sink_offset = 0
+		self._lock = threading.Lock()
+		self.calls = collections.Counter()
+		""" Number of calls of each method """
+		self.memory_changes = 0
+		""" Number of memory changes received in the sink """
+		self.start_time = int(time.time()) - 86400
+
+		self.vm_host = []
+		self.vm_allocated = []
+		""" Memory allocated to each VM in the template (in MB) """
+		self.vm_total = []
+		""" Memory currently set to each VM (in KB) """
+		self.vm_used = []
+		self.vm_published = []
+		""" Time of the last metrics published by each VM """
+		self.vm_user_template = []
+		for vm_id in range(num_vms):
+			allocated = self.rnd.choice([1024, 2048, 2048, 4096, 8192])
+			total = allocated * 1024
+			self.vm_host.append(vm_id % self.num_hosts)
+			self.vm_allocated.append(allocated)
+			self.vm_total.append(total)
+			self.vm_used.append(int(total * self.rnd.uniform(0.2, 0.9)))
+			self.vm_published.append(int(time.time()))
+			self.vm_user_template.append({})
+
+	def _apply_sink(self):
+		if not self.sink_file or not os.path.isfile(self.sink_file):
+			return
+		sink = open(self.sink_file)
+		try:
+			sink.seek(self._sink_offset)
+			data = sink.read()
+		finally:
+			sink.close()
+		# Only process complete lines
+		data = data[:data.rfind("\n") + 1]
+		self._sink_offset += len(data)
+		for line in data.splitlines():
+			parts = line.split()
+			if len(parts) == 2:
+				vm_id, new_mem = int(parts[0]), int(parts[1])
+				if 0 <= vm_id < len(self.vm_total):
+					self.vm_total[vm_id] = new_mem
+					self.vm_used[vm_id] = min(self.vm_used[vm_id], new_mem - 10240)
+					self.memory_changes += 1
+
+	def _step(self):
+		""" Change the used memory of the VMs """
+		rnd = self.rnd
+		now = int(time.time())
+		for vm_id in range(len(self.vm_used)):
+			if self.publish_rate < 1 and rnd.random() >= self.publish_rate:
+				continue
+			self.vm_published[vm_id] = now
+			total = self.vm_total[vm_id]
+			if rnd.random() < 0.02:
+				# Fast growth
+				used = self.vm_used[vm_id] + int(total * rnd.uniform(0.1, 0.3))
+			else:
+				used = self.vm_used[vm_id] + int(total * rnd.gauss(0, 0.02))
+			self.vm_used[vm_id] = max(102400, min(used, total - 10240))
+
+	def vm_xml(self, vm_id, now):
+		host = self.vm_host[vm_id]
+		total = self.vm_total[vm_id]
+		user_template = "".join("<%s><![CDATA[%s]]></%s>" % (k, v, k) for k, v in self.vm_user_template[vm_id].items())
+		return ("<VM><ID>%d</ID><UID>%d</UID><GID>0</GID><UNAME>user%d</UNAME><GNAME>users</GNAME><NAME>vm-%d</NAME>"
+			"<PERMISSIONS><OWNER_U>1</OWNER_U><OWNER_M>1</OWNER_M><OWNER_A>0</OWNER_A></PERMISSIONS>"
+			"<LAST_POLL>%d</LAST_POLL><STATE>3</STATE><LCM_STATE>3</LCM_STATE><PREV_STATE>3</PREV_STATE><PREV_LCM_STATE>3</PREV_LCM_STATE>"
+			"<RESCHED>0</RESCHED><STIME>%d</STIME><ETIME>0</ETIME><DEPLOY_ID>one-%d</DEPLOY_ID><MEMORY>%d</MEMORY><CPU>3</CPU>"
+			"<NET_TX>123456</NET_TX><NET_RX>654321</NET_RX>"
+			"<TEMPLATE><AUTOMATIC_REQUIREMENTS><![CDATA[!(PUBLIC_CLOUD = YES)]]></AUTOMATIC_REQUIREMENTS>"
+			"<CONTEXT><DISK_ID><![CDATA[1]]></DISK_ID><NETWORK><![CDATA[YES]]></NETWORK><TARGET><![CDATA[hdb]]></TARGET></CONTEXT>"
+			"<CPU><![CDATA[1]]></CPU><DISK><CLONE><![CDATA[YES]]></CLONE><DATASTORE><![CDATA[default]]></DATASTORE>"
+			"<DISK_ID><![CDATA[0]]></DISK_ID><IMAGE><![CDATA[ubuntu]]></IMAGE><READONLY><![CDATA[NO]]></READONLY>"
+			"<SAVE><![CDATA[NO]]></SAVE><SOURCE><![CDATA[/var/lib/one/datastores/1/3f6a]]></SOURCE><TARGET><![CDATA[hda]]></TARGET></DISK>"
+			"<GRAPHICS><LISTEN><![CDATA[0.0.0.0]]></LISTEN><PORT><![CDATA[%d]]></PORT><TYPE><![CDATA[VNC]]></TYPE></GRAPHICS>"
+			"<MEMORY><![CDATA[%d]]></MEMORY><NIC><BRIDGE><![CDATA[br0]]></BRIDGE><IP><![CDATA[10.0.%d.%d]]></IP>"
+			"<MAC><![CDATA[02:00:0a:00:%02x:%02x]]></MAC><NETWORK><![CDATA[private]]></NETWORK><VNID><![CDATA[0]]></VNID></NIC>"
+			"<OS><BOOT><![CDATA[hd]]></BOOT></OS><REALMEMORY><![CDATA[%d]]></REALMEMORY><VMID><![CDATA[%d]]></VMID></TEMPLATE>"
+			"<USER_TEMPLATE><MEM_FREE><![CDATA[%d]]></MEM_FREE><MEM_TOTAL><![CDATA[%d]]></MEM_TOTAL>"
+			"<TIMESTAMP><![CDATA[%d]]></TIMESTAMP>%s</USER_TEMPLATE>"
+			"<HISTORY_RECORDS><HISTORY><OID>%d</OID><SEQ>0</SEQ><HOSTNAME>host-%d</HOSTNAME><HID>%d</HID><CID>0</CID>"
+			"<STIME>%d</STIME><ETIME>0</ETIME><VMMMAD>kvm</VMMMAD><VNMMAD>dummy</VNMMAD><TM_MAD>shared</TM_MAD><DS_ID>0</DS_ID>"
+			"<PSTIME>%d</PSTIME><PETIME>%d</PETIME><RSTIME>%d</RSTIME><RETIME>0</RETIME><ESTIME>0</ESTIME><EETIME>0</EETIME>"
+			"<REASON>0</REASON><ACTION>0</ACTION></HISTORY></HISTORY_RECORDS></VM>") % (
+			vm_id, vm_id % 50, vm_id % 50, vm_id, self.vm_published[vm_id], self.start_time, vm_id, self.vm_allocated[vm_id],
+			5900 + vm_id % 60000, self.vm_allocated[vm_id], (vm_id >> 8) & 255, vm_id & 255, (vm_id >> 8) & 255, vm_id & 255,
+			total + 10240, vm_id, total - self.vm_used[vm_id], total, self.vm_published[vm_id], user_template,
+			vm_id, host, host, self.start_time, self.start_time, self.start_time, self.start_time)
+
+	def host_xml(self, host_id, vms_by_host, now):
+		vm_ids = vms_by_host.get(host_id, [])
+		used = sum(self.vm_total[vm_id] + 10240 for vm_id in vm_ids)
+		cpu_usage = min(HOST_CPU, 100 * len(vm_ids))
+		return ("<HOST><ID>%d</ID><NAME>host-%d</NAME><STATE>2</STATE><IM_MAD><![CDATA[kvm]]></IM_MAD>"
+			"<VM_MAD><![CDATA[kvm]]></VM_MAD><LAST_MON_TIME>%d</LAST_MON_TIME><CLUSTER_ID>0</CLUSTER_ID><CLUSTER>default</CLUSTER>"
+			"<HOST_SHARE><DISK_USAGE>0</DISK_USAGE><MEM_USAGE>%d</MEM_USAGE><CPU_USAGE>%d</CPU_USAGE>"
+			"<MAX_DISK>0</MAX_DISK><MAX_MEM>%d</MAX_MEM><MAX_CPU>%d</MAX_CPU><FREE_DISK>0</FREE_DISK>"
+			"<FREE_MEM>%d</FREE_MEM><FREE_CPU>%d</FREE_CPU><USED_DISK>0</USED_DISK><USED_MEM>%d</USED_MEM>"
+			"<USED_CPU>%d</USED_CPU><RUNNING_VMS>%d</RUNNING_VMS></HOST_SHARE><VMS>%s</VMS>"
+			"<TEMPLATE><ARCH><![CDATA[x86_64]]></ARCH><CPUSPEED><![CDATA[2400]]></CPUSPEED>"
+			"<HOSTNAME><![CDATA[host-%d]]></HOSTNAME><HYPERVISOR><![CDATA[kvm]]></HYPERVISOR></TEMPLATE></HOST>") % (
+			host_id, host_id, now, used, cpu_usage, HOST_MEMORY, HOST_CPU, max(0, HOST_MEMORY - used),
+			HOST_CPU - cpu_usage, used, cpu_usage, len(vm_ids), "".join("<ID>%d</ID>" % vm_id for vm_id in vm_ids), host_id)
+
+	def _get_vms_by_host(self):
+		vms_by_host = {}
+		for vm_id, host_id in enumerate(self.vm_host):
+			vms_by_host.setdefault(host_id, []).append(vm_id)
+		return vms_by_host
+
+	def vmpool_info(self, session, vm_filter, start, end, state):
+		with self._lock:
+			self.calls['one.vmpool.info'] += 1
+			self._apply_sink()
+			self._step()
+			now = int(time.time())
+			return (True, "<VM_POOL>" + "".join(self.vm_xml(vm_id, now) for vm_id in range(len(self.vm_total))) + "</VM_POOL>", 0)
+
+	def vm_info(self, session, vm_id):
+		with self._lock:
+			self.calls['one.vm.info'] += 1
+			if not 0 <= vm_id < len(self.vm_total):
+				return (False, "[one.vm.info] Error getting virtual machine [%d]." % vm_id, 0)
+			self._apply_sink()
+			return (True, self.vm_xml(vm_id, int(time.time())), 0)
+
+	def host_info(self, session, host_id):
+		with self._lock:
+			self.calls['one.host.info'] += 1
+			if not 0 <= host_id < self.num_hosts:
+				return (False, "[one.host.info] Error getting host [%d]." % host_id, 0)
+			return (True, self.host_xml(host_id, self._get_vms_by_host(), int(time.time())), 0)
+
+	def hostpool_info(self, session):
+		with self._lock:
+			self.calls['one.hostpool.info'] += 1
+			self._apply_sink()
+			vms_by_host = self._get_vms_by_host()
+			now = int(time.time())
+			return (True, "<HOST_POOL>" + "".join(self.host_xml(host_id, vms_by_host, now) for host_id in range(self.num_hosts)) + "</HOST_POOL>", 0)
+
+	def vm_update(self, session, vm_id, template, merge):
+		with self._lock:
+			self.calls['one.vm.update'] += 1
+			if not 0 <= vm_id < len(self.vm_total):
+				return (False, "[one.vm.update] Error getting virtual machine [%d]." % vm_id, 0)
+			for line in template.splitlines():
+				if "=" in line:
+					key, value = line.split("=", 1)
+					self.vm_user_template[vm_id][key.strip()] = value.strip()
+			return (True, vm_id, 0)
+
+	def vm_migrate(self, session, vm_id, host_id, live, enforce):
+		with self._lock:
+			self.calls['one.vm.migrate'] += 1
+			if not 0 <= vm_id < len(self.vm_total) or not 0 <= host_id < self.num_hosts:
+				return (False, "[one.vm.migrate] Error migrating virtual machine [%d]." % vm_id, 0)
+			self.vm_host[vm_id] = host_id
+			return (True, vm_id, 0)
+
+	def get_calls(self):
+		""" Get the number of calls of each method and the memory changes received """
+		with self._lock:
+			self._apply_sink()
+			res = dict(self.calls)
+			res['memory_changes'] = self.memory_changes
+			return res
+
+def create_server(cloud, address = "127.0.0.1", port = 0):
+	"""
+	Create the XML-RPC server of the FakeCloud
+
+	Return: the ThreadingXMLRPCServer (call serve_forever to start it)
+	"""
+	server = ThreadingXMLRPCServer((address, port), requestHandler=RequestHandler, logRequests=False, allow_none=True)
+	server.register_function(cloud.vmpool_info, 'one.vmpool.info')
+	server.register_function(cloud.vm_info, 'one.vm.info')
+	server.register_function(cloud.host_info, 'one.host.info')
+	server.register_function(cloud.hostpool_info, 'one.hostpool.info')
+	server.register_function(cloud.vm_update, 'one.vm.update')
+	server.register_function(cloud.vm_migrate, 'one.vm.migrate')
+	server.register_function(cloud.get_calls, 'fake.get_calls')
+	return server
+
+def main():
+	parser = OptionParser(usage="%prog [options]")
+	parser.add_option("--vms", type="int", default=1000, help="number of VMs")
+	parser.add_option("--hosts", type="int", default=0, help="number of hosts (by default one per 20 VMs)")
+	parser.add_option("--port", type="int", default=2633, help="port to listen (0 to select a free one)")
+	parser.add_option("--sink", default=None, help="sink file of the memory changes")
+	parser.add_option("--seed", type="int", default=0, help="seed of the synthetic pool")
+	parser.add_option("--publish-rate", type="float", default=1.0, help="fraction of the VMs that publish new metrics in each request")
+	(options, _) = parser.parse_args()
+
+	num_hosts = options.hosts or max(1, options.vms / 20)
+	server = create_server(FakeCloud(options.vms, num_hosts, options.sink, options.seed, options.publish_rate), port=options.port)
+	# The port is printed to let the caller connect when it is selected by the OS
+	print server.server_address[1]
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,106 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import threading
+from cvem.config import logger
+
+class MemInfoPublisher:
+	"""
+	Publish the MEM properties to the user template of the VMs in a background thread.
+	It remembers the template published to each VM, so it is not sent again
+	in every monitor loop while the CMP has not reflected the change.
+	Pending updates are coalesced per VM and flushed in batches.
+	"""
+
+	def __init__(self, update_function, batch_size = 50, interval = 1.0):
+		self.update_function = update_function
+		""" Function to update the template of a VM: update_function(vm_ids_templates) -> list of failed VM IDs """
+		self.batch_size = max(1, batch_size)
+		""" Maximum number of updates sent in each batch """
+		self.interval = interval
+		""" Time (in secs) to wait between each batch """
+		self.published = {}
+		""" Dict with the template published (or queued) for each VM ID """
+		self.pending = {}
+		""" Dict with the templates pending to be published for each VM ID """
+		self._cond = threading.Condition()
+		self._thread = None
+
+	def publish(self, vm_id, template):
+		"""
+		Queue the update of the template of a VM (if it has not been published before)
+
+		Args:
+		- vm_id: ID of the VM.
+		- template: Template to add to the user template of the VM.
+		"""
+		with self._cond:
+			if not template:
+				# The CMP already shows the values
+				self.published.pop(vm_id, None)
+				return
+			if self.published.get(vm_id) == template:
+				return
+			self.published[vm_id] = template
+			self.pending[vm_id] = template
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._run)
+				self._thread.daemon = True
+				self._thread.start()
+			self._cond.notify()
+
+	def clean(self, current_vm_ids):
+		"""
+		Delete the data of the VMs that do not appear in the CMP
+
+		Args:
+		- current_vm_ids: set with the IDs of the current VMs.
+		"""
+		with self._cond:
+			for vm_id in self.published.keys():
+				if vm_id not in current_vm_ids:
+					del self.published[vm_id]
+					self.pending.pop(vm_id, None)
+
+	def _next_batch(self):
+		with self._cond:
+			while not self.pending:
+				self._cond.wait()
+			batch = []
+			for vm_id in self.pending.keys()[:self.batch_size]:
+				batch.append((vm_id, self.pending.pop(vm_id)))
+			return batch
+
+	def _run(self):
+		while True:
+			batch = self._next_batch()
+			try:
+				failed = set(self.update_function(batch))
+			except:
+				logger.exception("Error publishing the mem info of the VMs.")
+				failed = set(vm_id for vm_id, _ in batch)
+
+			if failed:
+				with self._cond:
+					# Forget them to try again in the next monitor loop
+					for vm_id, template in batch:
+						if vm_id in failed and self.published.get(vm_id) == template:
+							del self.published[vm_id]
+			logger.debug("Mem info published to %d VMs (%d failed)." % (len(batch), len(failed)))
+
+			if self.interval > 0:
+				time.sleep(self.interval)
@@ -14,12 +14,18 @@
 # limitations under the License.                                             #
 #--------------------------------------------------------------------------- #
 
+import threading
+from cStringIO import StringIO
+import xml.etree.cElementTree as ElementTree
 from cpyutils.xmlobject import XMLObject
-from cpyutils.timeoutxmlrpccli import ServerProxy
 from cvem.config import logger, Config
 from cvem.CMPInfo import VirtualMachineInfo, HostInfo, CMPInfo
 from cvem.Monitor import Monitor
+from cvem.ServerProxyPool import ServerProxyPool
+from cvem.Metrics import Gauge
+from cvem.Tracing import tracer
 from config_one import ConfigONE
+from MemInfoPublisher import MemInfoPublisher
 
 # classes to parse the results of the ONE API using xmlobject
 class NIC(XMLObject):
@@ -49,7 +55,7 @@ class HISTORY_RECORDS(XMLObject):
 	tuples_lists = { 'HISTORY': HISTORY }
 
 class USER_TEMPLATE(XMLObject):
-		values = [ 'MEM_FREE', 'MEM_TOTAL', 'MEM_TOTAL_REAL', 'MIN_FREE_MEM', 'MEM_OVER', 'TIMESTAMP']
+		values = [ 'MEM_FREE', 'MEM_TOTAL', 'MEM_TOTAL_REAL', 'MIN_FREE_MEM', 'MEM_OVER', 'TIMESTAMP', 'MEM_POLICY']
 		numeric = [ 'MEM_FREE', 'MEM_TOTAL', 'MEM_TOTAL_REAL', 'MIN_FREE_MEM', 'MEM_OVER',  'TIMESTAMP']
 
 class VM(XMLObject):
@@ -119,7 +125,7 @@ class HOST(XMLObject):
 	STATE_MONITORING_DISABLED=7
 	INVALID_STATES = [STATE_ERROR, STATE_DISABLED, STATE_MONITORING_ERROR, STATE_MONITORING_DISABLED]
 	values = [ 'ID', 'LAST_MON_TIME', 'NAME', 'STATE' ]
-	numeric = [ 'ID', 'STATE' ]
+	numeric = [ 'ID', 'LAST_MON_TIME', 'STATE' ]
 	tuples = { 'HOST_SHARE': HOST_SHARE, 'TEMPLATE': TEMPLATE_HOST, 'VMS': VMS}
 	
 class HOST_POOL(XMLObject):
@@ -131,64 +137,192 @@ class OpenNebula(CMPInfo):
 	OpenNebula CMPInfo subclass
 	"""
 
+	_server_pool = None
+	_server_pool_lock = threading.Lock()
+	_publisher = None
+
 	@staticmethod
-	def get_vm_list():
-		server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
+	def _get_server_pool():
+		"""
+		Get the pool of persistent connections to the ONE XML-RPC API
+		"""
+		with OpenNebula._server_pool_lock:
+			if OpenNebula._server_pool is None:
+				server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
+				OpenNebula._server_pool = ServerProxyPool(server_url, ConfigONE.ONE_POOL_SIZE, ConfigONE.ONE_TIMEOUT)
+			return OpenNebula._server_pool
+
+	@staticmethod
+	def _get_publisher():
+		"""
+		Get the object that publishes the MEM properties to the user template of the VMs
+		"""
+		with OpenNebula._server_pool_lock:
+			if OpenNebula._publisher is None:
+				OpenNebula._publisher = MemInfoPublisher(OpenNebula._update_user_templates,
+														ConfigONE.ONE_PUBLISH_BATCH, ConfigONE.ONE_PUBLISH_INTERVAL)
+			return OpenNebula._publisher
+
+	@staticmethod
+	def get_pool_stats():
+		"""
+		Get the counters of the pool of connections to the ONE XML-RPC API
+
+		Return: dict with the number of hits, misses and waits of the pool
+		"""
+		return OpenNebula._get_server_pool().get_stats()
+
+	@staticmethod
+	def _get_vm_pool_info():
+		"""
+		Get the XML with the VM pool of ONE
+		
+		Return: str with the XML of the VM pool or None in case of error
+		"""
 		try:
-			server = ServerProxy(server_url,allow_none=True,timeout=10)
 			# To get only ONE_ID user's resources
 			#vm_filter = -3
 			# To get all
 			vm_filter = -2
-			(success, res_info, _) = server.one.vmpool.info(ConfigONE.ONE_ID, vm_filter, -1, -1, 3)
+			with tracer.span("one.vmpool.info"), OpenNebula._get_server_pool().server() as server:
+				(success, res_info, _) = server.one.vmpool.info(ConfigONE.ONE_ID, vm_filter, -1, -1, 3)
 		except:
 			logger.exception("Error getting the VM list")
-			return []
+			return None
+		logger.debug("ONE XML-RPC connection pool stats: %s" % OpenNebula.get_pool_stats())
 
 		if success:
-			res_vm = VM_POOL(res_info)
-			res = []
-			for vm in res_vm.VM:
+			return res_info
+		else:
+			logger.error("Error getting the VM list: " + res_info)
+			return None
+
+	@staticmethod
+	def _get_vm_info(vm):
+		"""
+		Create a VirtualMachineInfo object from the VM object
+		
+		Args:
+		- vm: VM object with the ONE VM information.
+
+		Return: VirtualMachineInfo object
+		"""
+		host = HostInfo(int(vm.HISTORY_RECORDS.HISTORY[0].HID), vm.HISTORY_RECORDS.HISTORY[0].HOSTNAME)
+		new_vm = VirtualMachineInfo(int(vm.ID), host, int(vm.TEMPLATE.MEMORY) * 1024, vm)
+		new_vm.user_id = vm.UID
+		new_vm.cpus = vm.TEMPLATE.CPU
+		new_vm.active = (vm.STATE == VM.STATE_ACTIVE)
+		if vm.LAST_POLL:
+			new_vm.last_poll = int(vm.LAST_POLL)
+		if vm.USER_TEMPLATE.MEM_TOTAL:
+			# to make it work on all ONE versions
+			real_memory = vm.TEMPLATE.REALMEMORY
+			if not real_memory:
+				real_memory = vm.REALMEMORY
+			new_vm.set_memory_values(int(real_memory),
+								int(vm.USER_TEMPLATE.MEM_TOTAL),
+								int(vm.USER_TEMPLATE.MEM_FREE))
+			if vm.USER_TEMPLATE.MIN_FREE_MEM:
+				new_vm.min_free_mem = vm.USER_TEMPLATE.MIN_FREE_MEM
+			if vm.USER_TEMPLATE.MEM_OVER:
+				new_vm.mem_over_ratio = vm.USER_TEMPLATE.MEM_OVER
+			if vm.USER_TEMPLATE.TIMESTAMP:
+				new_vm.timestamp = vm.USER_TEMPLATE.TIMESTAMP
+			if vm.USER_TEMPLATE.MEM_POLICY:
+				new_vm.mem_policy = vm.USER_TEMPLATE.MEM_POLICY.strip().lower()
+
+			# publish MEM properties to the VM user template to show the values to the user
+			OpenNebula._publish_mem_info(new_vm)
+
+		return new_vm
+
+	@staticmethod
+	def get_vm_list():
+		res_info = OpenNebula._get_vm_pool_info()
+		if res_info is None:
+			return []
+
+		res_vm = VM_POOL(res_info)
+		res = []
+		vm_ids = set()
+		for vm in res_vm.VM:
+			try:
+				new_vm = OpenNebula._get_vm_info(vm)
+				res.append(new_vm)
+				vm_ids.add(new_vm.id)
+			except:
+				logger.exception("Error getting the VM info %s." % vm.ID)
+			
+		OpenNebula._get_publisher().clean(vm_ids)
+		return res
+
+	@staticmethod
+	def iter_vm_list():
+		"""
+		Get the VMs of the VM pool one by one.
+		The XML of the pool is parsed incrementally, building only one VM element at a time.
+		"""
+		res_info = OpenNebula._get_vm_pool_info()
+		if res_info is None:
+			return
+
+		if isinstance(res_info, unicode):
+			res_info = res_info.encode('utf-8')
+
+		vm_ids = set()
+		depth = 0
+		root = None
+		for event, elem in ElementTree.iterparse(StringIO(res_info), events=('start', 'end')):
+			if event == 'start':
+				if root is None:
+					root = elem
+				depth += 1
+				continue
+
+			depth -= 1
+			if depth == 1 and elem.tag == 'VM':
+				vm = VM(ElementTree.tostring(elem))
+				# Free the memory of the parsed VM elements
+				root.clear()
 				try:
-					host = HostInfo(int(vm.HISTORY_RECORDS.HISTORY[0].HID), vm.HISTORY_RECORDS.HISTORY[0].HOSTNAME)
-					new_vm = VirtualMachineInfo(int(vm.ID), host, int(vm.TEMPLATE.MEMORY) * 1024, vm)
-					new_vm.user_id = vm.UID
-					if vm.USER_TEMPLATE.MEM_TOTAL:
-						# to make it work on all ONE versions
-						real_memory = vm.TEMPLATE.REALMEMORY
-						if not real_memory:
-							real_memory = vm.REALMEMORY
-						new_vm.set_memory_values(int(real_memory),
-											int(vm.USER_TEMPLATE.MEM_TOTAL),
-											int(vm.USER_TEMPLATE.MEM_FREE))
-						if vm.USER_TEMPLATE.MIN_FREE_MEM:
-							new_vm.min_free_mem = vm.USER_TEMPLATE.MIN_FREE_MEM
-						if vm.USER_TEMPLATE.MEM_OVER:
-							new_vm.mem_over_ratio = vm.USER_TEMPLATE.MEM_OVER
-						if vm.USER_TEMPLATE.TIMESTAMP:
-							new_vm.timestamp = vm.USER_TEMPLATE.TIMESTAMP
-
-						# publish MEM properties to the VM user template to show the values to the user
-						OpenNebula._publish_mem_info(new_vm)
-
-					res.append(new_vm)
+					new_vm = OpenNebula._get_vm_info(vm)
 				except:
 					logger.exception("Error getting the VM info %s." % vm.ID)
-				
-			return res
+					continue
+				vm_ids.add(new_vm.id)
+				yield new_vm
+
+		OpenNebula._get_publisher().clean(vm_ids)
+
+	@staticmethod
+	def get_vm_info(vm_id):
+		try:
+			with tracer.span("one.vm.info", vm_id = vm_id), OpenNebula._get_server_pool().server() as server:
+				(success, res_info, _) = server.one.vm.info(ConfigONE.ONE_ID, vm_id)
+		except:
+			logger.exception("Error getting the VM info: %s" % vm_id)
+			return None
+
+		if success:
+			try:
+				return OpenNebula._get_vm_info(VM(res_info))
+			except:
+				logger.exception("Error getting the VM info %s." % vm_id)
+				return None
 		else:
-			logger.error("Error getting the VM list: " + res_info)
-			return []
+			logger.error("Error getting the VM info: " + res_info)
+			return None
 
 	@staticmethod
 	def _publish_mem_info(vm):
 		"""
-		Publish MIN_FREE_MEM and MEM_OVER properties to the VM user template to show the values to the user
+		Publish MIN_FREE_MEM and MEM_OVER properties to the VM user template to show the values to the user.
+		The update is queued and sent in background, and it is only sent once per VM.
 		
 		Args:
 		- vm: VirtualMachineInfo with the VM info.
 
-		Return: True if the information is published successfully or False otherwise 
+		Return: True if the information is queued to be published or False otherwise 
 		"""
 		template = ""
 		if not vm.min_free_mem:
@@ -196,47 +330,82 @@ class OpenNebula(CMPInfo):
 		if not vm.mem_over_ratio:
 			template += "MEM_OVER = %.2f\n" % Config.MEM_OVER
 		
-		# if there is nothing to update return True
-		if not template:
-			return True 
-		
-		server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
 		try:
-			server = ServerProxy(server_url,allow_none=True,timeout=10)
-			(success, res_info, _) = server.one.vm.update(ConfigONE.ONE_ID, vm.id, template, 1)
-			if not success:
-				logger.error("Error updating the template to show the mem info to the VM ID: %s. %s." % (vm.id, res_info))
-			return success
+			OpenNebula._get_publisher().publish(vm.id, template)
 		except:
-			logger.exception("Error updating the template to show the mem info to the VM ID: %s." % vm.id)
+			logger.exception("Error queuing the template to show the mem info to the VM ID: %s." % vm.id)
 			return False
 		
 		return True
+
+	@staticmethod
+	def _update_user_templates(vm_templates):
+		"""
+		Update the user template of a set of VMs using the same connection
+		
+		Args:
+		- vm_templates: list of tuples (vm_id, template) to add to the user template of each VM.
+
+		Return: list of the IDs of the VMs that could not be updated 
+		"""
+		failed = []
+		pos = 0
+		while pos < len(vm_templates):
+			try:
+				# The connection is discarded after an error, so the rest of VMs are updated with a new one
+				with OpenNebula._get_server_pool().server() as server:
+					for vm_id, template in vm_templates[pos:]:
+						with tracer.span("one.vm.update", vm_id = vm_id):
+							(success, res_info, _) = server.one.vm.update(ConfigONE.ONE_ID, vm_id, template, 1)
+						pos += 1
+						if not success:
+							logger.error("Error updating the template to show the mem info to the VM ID: %s. %s." % (vm_id, res_info))
+							failed.append(vm_id)
+			except:
+				vm_id = vm_templates[pos][0]
+				logger.exception("Error updating the template to show the mem info to the VM ID: %s." % vm_id)
+				failed.append(vm_id)
+				pos += 1
+		return failed
 	
+	@staticmethod
+	def _get_host_info(host):
+		"""
+		Create a HostInfo object from the HOST object
+		
+		Args:
+		- host: HOST object with the ONE host information.
+
+		Return: HostInfo object
+		"""
+		res_host = HostInfo(int(host.ID), host.NAME, host.STATE not in HOST.INVALID_STATES, host)
+		res_host.last_update = host.LAST_MON_TIME
+		res_host.free_memory = host.HOST_SHARE.FREE_MEM
+		# ONE FREE_CPU is a Percentage
+		res_host.free_cpus = host.HOST_SHARE.FREE_CPU/100.0
+		return res_host
+
 	@staticmethod
 	def get_host_info(host_id):
-		server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
 		try:
-			server = ServerProxy(server_url,allow_none=True,timeout=10)
-			(success, res_info, _) = server.one.host.info(ConfigONE.ONE_ID, host_id)
+			with tracer.span("one.host.info", host = host_id), OpenNebula._get_server_pool().server() as server:
+				(success, res_info, _) = server.one.host.info(ConfigONE.ONE_ID, host_id)
 		except:
 			logger.exception("Error getting the host info: " + host_id)
 			return None
 		
 		if success:
 			host_info = HOST(res_info)
-			res_host = HostInfo(int(host_info.ID), host_info.NAME, host_info.STATE not in HOST.INVALID_STATES, host_info) 
-			return res_host
+			return OpenNebula._get_host_info(host_info)
 		else:
 			logger.error("Error getting the host info: " + res_info)
 			return None
 	
 	@staticmethod
 	def get_host_list():
-		server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
 		try:
-			server = ServerProxy(server_url,allow_none=True,timeout=10)
-			(success, res_info, _) = server.one.hostpool.info(ConfigONE.ONE_ID)
+			with tracer.span("one.hostpool.info"), OpenNebula._get_server_pool().server() as server:
+				(success, res_info, _) = server.one.hostpool.info(ConfigONE.ONE_ID)
 		except:
 			logger.exception("Error getting the host list")
 			return None
@@ -244,8 +413,7 @@ class OpenNebula(CMPInfo):
 		if success:
 			res = []
 			for host in HOST_POOL(res_info).HOST:
-				new_host = HostInfo(host.ID, host.NAME, host.STATE not in HOST.INVALID_STATES, host)
-				res.append(new_host)
+				res.append(OpenNebula._get_host_info(host))
 			return res
 		else:
 			logger.error("Error getting the host list: " + res_info)
@@ -253,10 +421,9 @@ class OpenNebula(CMPInfo):
 	
 	@staticmethod
 	def migrate(vm_id, host_id):
-		server_url = "http://%s:%d/RPC2" % (ConfigONE.ONE_SERVER, ConfigONE.ONE_PORT)
 		try:
-			server = ServerProxy(server_url,allow_none=True,timeout=10)
-			(success, res_info, _) = server.one.vm.migrate(ConfigONE.ONE_ID, vm_id, host_id, True, True)
+			with tracer.span("one.vm.migrate", vm_id = vm_id, host = host_id), OpenNebula._get_server_pool().server() as server:
+				(success, res_info, _) = server.one.vm.migrate(ConfigONE.ONE_ID, vm_id, host_id, True, True)
 		except:
 			logger.exception("Error migrating the VM %d to the host %d" % (vm_id, host_id))
 			return False
@@ -274,6 +441,9 @@ class MonitorONE(Monitor):
 	
 	def __init__(self, cmpo = None):
 		Monitor.__init__(self, OpenNebula())
+		pool_stats = self.metrics.registry.register(Gauge("cvem_one_connection_pool",
+			"Stats of the pool of connections with ONE", ("stat",)))
+		pool_stats.set_function(OpenNebula.get_pool_stats)
 	
 	@staticmethod
 	def host_has_memory_free(host_info,free_memory):
@@ -292,18 +462,10 @@ class MonitorONE(Monitor):
 
 	def select_host_to_migrate(self, vm_info):
 		"""
-		Get the ID of the HOST to migrate. It selects the HOST with more free memory.
+		Get the ID of the HOST to migrate. It selects the HOST with more free memory in the host ledger,
+		and debits the memory of the VM from it.
 		If no node has enough memory or cpus to host the VM to migrate, return None.
 		"""
-		host_list = self.cmp.get_host_list()
-		
-		hosts_mem = {} 
-		# Select the node with more memory free
-		for host in host_list:
-			hosts_mem[host] = host.raw.HOST_SHARE.FREE_MEM
-		
-		hosts_mem = sorted(hosts_mem.items(), key=lambda x: x[1], reverse = True)
-		
 		cpus = vm_info.raw.TEMPLATE.CPU
 		if vm_info.total_memory:
 			free_memory = vm_info.total_memory
@@ -311,40 +473,47 @@ class MonitorONE(Monitor):
 			# If the monitored total memory is not available use the CMP original allocated one 
 			free_memory = vm_info.allocated_memory
 
-		powered = None
-		while powered != False:
-			for host, host_mem in hosts_mem:
-				# ONE FREE_CPU is a Percentage
-				host_free_cpus = host.raw.HOST_SHARE.FREE_CPU/100
-				if host.active and host_mem > free_memory and host_free_cpus > cpus:
-					return host
-			
-			# only try to poweron a host once
-			if powered is None:
-				# Let's try to power on a host
-				powered = Monitor.power_on_host(free_memory, cpus)
-			else:
-				# otherwise continue
-				powered = False
+		host = self.reserve_host_to_migrate(free_memory, cpus)
+		if host is None:
+			# Let's try to power on a host (only once)
+			if self.request_power_on(free_memory, cpus):
+				# The new host is not in the host pool snapshot
+				host = self.reserve_host_to_migrate(free_memory, cpus, self.cmp.get_host_list() or [])
 		
-		return None
+		return host
+
+	@staticmethod
+	def get_host_vms(host_info, all_vms):
+		"""
+		Get the VMs allocated in a host, using the VM IDs of the host info.
+		If the VM list is streamed (all_vms is None) the info of the VMs is requested to ONE.
+		"""
+		if all_vms is None:
+			host_vms = [OpenNebula.get_vm_info(int(vm_id)) for vm_id in host_info.raw.VMS.ID]
+		else:
+			host_vms = [all_vms.get(int(vm_id)) for vm_id in host_info.raw.VMS.ID]
+		return [vm for vm in host_vms if vm]
 
 	@staticmethod
 	def select_vm_to_migrate(req_vm_id, host_info, all_vms):
 		"""
 		Get the ID of the VM to migrate. It selects the VM with less memory avoiding to migrate VM with ID "req_vm_id"
+		If there are no other VMs in the host, return None.
 		"""
-		vms_mem = {} 
-		for vm_id in host_info.raw.VMS.ID:
-			for vm in all_vms:
-				if int(vm_id) == vm.id and req_vm_id != vm.id:
-					if vm.total_memory:
-						vms_mem[vm] = vm.total_memory
-					else:
-						# If the monitored total memory is not available use the CMP original allocated one 
-						vms_mem[vm] = vm.allocated_memory
-		
-		# if we want to get the biggest one set reverse=True
-		vms_mem = sorted(vms_mem.items(), key=lambda x: x[1])
-		
-		return vms_mem[0][0]
+		host_vms = MonitorONE.get_host_vms(host_info, all_vms)
+
+		vm_to_migrate = None
+		vm_to_migrate_mem = None
+		for vm in host_vms:
+			if req_vm_id != vm.id:
+				if vm.total_memory:
+					vm_mem = vm.total_memory
+				else:
+					# If the monitored total memory is not available use the CMP original allocated one 
+					vm_mem = vm.allocated_memory
+				# if we want to get the biggest one use >
+				if vm_to_migrate is None or vm_mem < vm_to_migrate_mem:
+					vm_to_migrate = vm
+					vm_to_migrate_mem = vm_mem
+
+		return vm_to_migrate
@@ -22,6 +22,14 @@ class ConfigONE:
 	ONE_SERVER = None
 	ONE_PORT = 2633
 	ONE_ID = None
+	# Timeout (in secs) of the XML-RCP calls
+	ONE_TIMEOUT = 10
+	# Maximum number of persistent connections to the XML-RCP API
+	ONE_POOL_SIZE = 4
+	# Maximum number of user template updates sent in each batch
+	ONE_PUBLISH_BATCH = 50
+	# Time (in secs) to wait between each batch of user template updates
+	ONE_PUBLISH_INTERVAL = 1.0
 
 config = ConfigParser.ConfigParser()
 config.read([Config.CVEM_PATH + '/one.cfg', Config.CVEM_PATH + '/etc/one.cfg', '/etc/cvem/one.cfg'])
@@ -0,0 +1,271 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import threading
+from config import Config, logger
+from Tracing import tracer
+from CommandReactor import CommandReactor
+from cpyutils.runcommand import runcommand
+
+class Actuator:
+	"""
+	Base class to the backends that change the memory of the VMs
+	"""
+
+	def change_memory(self, vm_id, vm_host, new_mem):
+		"""
+		Change the memory of the VM
+
+		Args:
+		- vm_id: ID of the VM to change the memory.
+		- vm_host: HostInfo of the host where the VM is allocated.
+		- new_mem: Amount of memory to set to the VM.
+
+		Return: True if the memory has been changed successfully or False otherwise
+		"""
+		raise Exception("Not implemented")
+
+	def change_memory_batch(self, vm_host, changes):
+		"""
+		Change the memory of a set of VMs of the same host.
+		By default it changes them one by one.
+
+		Args:
+		- vm_host: HostInfo of the host where the VMs are allocated.
+		- changes: list of tuples (vm_id, new_mem) with the memory to set to each VM.
+
+		Return: dict with the result (True or False) of the change of each VM ID
+		"""
+		res = {}
+		for vm_id, new_mem in changes:
+			res[vm_id] = self.change_memory(vm_id, vm_host, new_mem)
+		return res
+
+	def change_memory_hosts(self, host_changes, pool):
+		"""
+		Change the memory of the VMs of a set of hosts concurrently (if ASYNC_ACTUATION is enabled).
+		By default the hosts are processed in parallel using the ThreadPool.
+
+		Args:
+		- host_changes: list of tuples (vm_host, changes) with the HostInfo and the list of
+		  tuples (vm_id, new_mem) of each host.
+		- pool: ThreadPool used to process the hosts.
+
+		Return: list with the dict with the result (True or False) of the change of each VM ID of each host
+		"""
+		return pool.map(lambda changes: self.change_memory_batch(*changes), host_changes)
+
+class CommandActuator(Actuator):
+	"""
+	Change the memory of the VMs executing the command CHANGE_MEMORY_CMD
+	"""
+
+	def __init__(self):
+		self.reactor = CommandReactor(Config.ACTUATION_CONCURRENCY, Config.ACTUATION_TIMEOUT)
+		""" CommandReactor to run the commands concurrently (if ASYNC_ACTUATION is enabled) """
+
+	@staticmethod
+	def get_batch_script(changes):
+		"""
+		Get the script for CHANGE_MEMORY_BATCH_CMD with one CHANGE_MEMORY_BATCH_LINE per VM,
+		each one followed by a line with its return code
+		"""
+		script = ""
+		for vm_id, new_mem in changes:
+			line = Config.CHANGE_MEMORY_BATCH_LINE.format(vmid = str(vm_id), newmemory = str(new_mem))
+			script += '%s > /dev/null; echo "CVEM_RC %s $?"\n' % (line, vm_id)
+		return script
+
+	@staticmethod
+	def get_batch_results(changes, out):
+		"""
+		Get the result of the change of each VM from the output of CHANGE_MEMORY_BATCH_CMD
+		"""
+		results = {}
+		for line in out.splitlines():
+			parts = line.split()
+			if len(parts) == 3 and parts[0] == "CVEM_RC":
+				results[parts[1]] = parts[2] == "0"
+
+		res = {}
+		for vm_id, _ in changes:
+			res[vm_id] = results.get(str(vm_id), False)
+			if not res[vm_id]:
+				logger.error("Error changing memory of VM: %s" % vm_id)
+		return res
+
+	def change_memory(self, vm_id, vm_host, new_mem):
+		chmem_cmd = Config.CHANGE_MEMORY_CMD.format(hostname = vm_host.name, vmid = str(vm_id), newmemory = str(new_mem))
+		logger.debug("Executing: " + chmem_cmd)
+		with tracer.span("change_memory_cmd", vm_id = vm_id, host = vm_host.name, new_mem = new_mem) as span:
+			success, out = runcommand(chmem_cmd, shell=True)
+			span.set_tag("success", success)
+
+		if success:
+			logger.debug("chmem command output: " + out)
+		else:
+			logger.error("Error changing memory: " + out)
+		return success
+
+	def change_memory_batch(self, vm_host, changes):
+		"""
+		Change the memory of a set of VMs of the same host executing CHANGE_MEMORY_BATCH_CMD once.
+		A script with one CHANGE_MEMORY_BATCH_LINE per VM is passed to the command in the stdin.
+		If CHANGE_MEMORY_BATCH_CMD is not set, CHANGE_MEMORY_CMD is executed for each VM.
+		"""
+		if not Config.CHANGE_MEMORY_BATCH_CMD:
+			return Actuator.change_memory_batch(self, vm_host, changes)
+
+		script = self.get_batch_script(changes)
+		chmem_cmd = Config.CHANGE_MEMORY_BATCH_CMD.format(hostname = vm_host.name)
+		logger.debug("Executing: " + chmem_cmd + " with script:\n" + script)
+		with tracer.span("change_memory_batch_cmd", host = vm_host.name, vms = len(changes)) as span:
+			success, out = runcommand(chmem_cmd, shell=True, strin=script)
+			span.set_tag("success", success)
+		if not success:
+			logger.error("Error changing memory: " + out)
+		return self.get_batch_results(changes, out)
+
+	def change_memory_hosts(self, host_changes, pool):
+		"""
+		Change the memory of the VMs of a set of hosts running all the commands concurrently
+		in the CommandReactor (at most ACTUATION_CONCURRENCY at the same time, and each one killed
+		after ACTUATION_TIMEOUT secs): one CHANGE_MEMORY_BATCH_CMD per host or,
+		if it is not set, one CHANGE_MEMORY_CMD per VM.
+		"""
+		if not Config.ASYNC_ACTUATION:
+			return Actuator.change_memory_hosts(self, host_changes, pool)
+
+		commands = []
+		for vm_host, changes in host_changes:
+			if Config.CHANGE_MEMORY_BATCH_CMD:
+				commands.append((Config.CHANGE_MEMORY_BATCH_CMD.format(hostname = vm_host.name), self.get_batch_script(changes)))
+			else:
+				for vm_id, new_mem in changes:
+					commands.append((Config.CHANGE_MEMORY_CMD.format(hostname = vm_host.name, vmid = str(vm_id), newmemory = str(new_mem)), None))
+
+		logger.debug("Executing %d commands to change the memory of the VMs of %d hosts." % (len(commands), len(host_changes)))
+		with tracer.span("change_memory_async", hosts = len(host_changes), commands = len(commands)) as span:
+			outputs = self.reactor.run(commands)
+			span.set_tag("failed", len([success for success, _ in outputs if not success]))
+
+		res = []
+		outputs = iter(outputs)
+		for vm_host, changes in host_changes:
+			if Config.CHANGE_MEMORY_BATCH_CMD:
+				success, out = outputs.next()
+				if not success:
+					logger.error("Error changing memory of the VMs of host %s: %s" % (vm_host.name, out))
+				res.append(self.get_batch_results(changes, out))
+			else:
+				host_res = {}
+				for vm_id, _ in changes:
+					success, out = outputs.next()
+					if not success:
+						logger.error("Error changing memory of VM %s: %s" % (vm_id, out))
+					host_res[vm_id] = success
+				res.append(host_res)
+		return res
+
+class LibvirtActuator(Actuator):
+	"""
+	Change the memory of the VMs using the libvirt API.
+	It keeps one connection open to each host (using the LIBVIRT_URI)
+	and reconnects in case of failure.
+	"""
+
+	def __init__(self):
+		import libvirt
+		self.libvirt = libvirt
+		self.connections = {}
+		""" Dict with the libvirt connection of each host """
+		self.host_locks = {}
+		""" Dict with the lock of each host, to serialize the operations over a connection """
+		self._lock = threading.Lock()
+
+	def _get_host_lock(self, hostname):
+		with self._lock:
+			if hostname not in self.host_locks:
+				self.host_locks[hostname] = threading.Lock()
+			return self.host_locks[hostname]
+
+	def _get_connection(self, hostname):
+		conn = self.connections.get(hostname)
+		if conn is None:
+			uri = Config.LIBVIRT_URI.format(hostname = hostname)
+			logger.debug("Opening libvirt connection to: " + uri)
+			conn = self.libvirt.open(uri)
+			self.connections[hostname] = conn
+		return conn
+
+	def _close_connection(self, hostname):
+		conn = self.connections.pop(hostname, None)
+		if conn is not None:
+			try:
+				conn.close()
+			except:
+				pass
+
+	def _set_memory(self, hostname, vm_id, new_mem):
+		"""
+		Set the memory of a VM using the connection of the host.
+		The host lock must be acquired by the caller.
+		"""
+		domain_name = Config.LIBVIRT_DOMAIN.format(vmid = str(vm_id))
+		retries = 1
+		while True:
+			try:
+				conn = self._get_connection(hostname)
+				conn.lookupByName(domain_name).setMemory(int(new_mem))
+				return True
+			except self.libvirt.libvirtError, ex:
+				conn = self.connections.get(hostname)
+				broken = conn is None or not conn.isAlive()
+				if broken:
+					self._close_connection(hostname)
+				if broken and retries > 0:
+					retries -= 1
+					logger.warn("Error in the libvirt connection to host %s: %s. Reconnecting." % (hostname, ex))
+				else:
+					logger.error("Error changing memory of VM %s: %s" % (vm_id, ex))
+					return False
+
+	def change_memory(self, vm_id, vm_host, new_mem):
+		with self._get_host_lock(vm_host.name):
+			with tracer.span("libvirt.setMemory", vm_id = vm_id, host = vm_host.name, new_mem = new_mem):
+				return self._set_memory(vm_host.name, vm_id, new_mem)
+
+	def change_memory_batch(self, vm_host, changes):
+		res = {}
+		with self._get_host_lock(vm_host.name):
+			for vm_id, new_mem in changes:
+				with tracer.span("libvirt.setMemory", vm_id = vm_id, host = vm_host.name, new_mem = new_mem):
+					res[vm_id] = self._set_memory(vm_host.name, vm_id, new_mem)
+		return res
+
+def get_actuator():
+	"""
+	Get the Actuator selected in the CHANGE_MEMORY_BACKEND config value.
+	If the libvirt python bindings are not installed the command backend is used.
+	"""
+	if Config.CHANGE_MEMORY_BACKEND == "libvirt":
+		try:
+			return LibvirtActuator()
+		except ImportError:
+			logger.warn("Error trying to import libvirt. It seems that libvirt python library is not installed. Using the command backend.")
+	elif Config.CHANGE_MEMORY_BACKEND != "command":
+		logger.warn("Unknown CHANGE_MEMORY_BACKEND: %s. Using the command backend." % Config.CHANGE_MEMORY_BACKEND)
+	return CommandActuator()
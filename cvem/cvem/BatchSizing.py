@@ -0,0 +1,262 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Computation of the new memory size of the VMs.
+size_vm computes it for one VM and size_vms for all the VMs of a monitor loop
+in one vectorized pass using NumPy (if it is not installed size_vm is used for each VM).
+Both give the same results.
+"""
+
+from config import Config, logger
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class SizingDecision(object):
+	"""
+	Result of the computation of the new memory size of a VM
+	"""
+
+	__slots__ = ('free_pct', 'mem_diff', 'out_of_band', 'init_state', 'in_cooldown',
+				'no_free_memory', 'no_free_memory_count', 'new_mem', 'total_memory', 'change')
+
+	def __init__(self, free_pct, mem_diff, out_of_band, init_state = False, in_cooldown = False,
+				no_free_memory = False, no_free_memory_count = 0, new_mem = None, total_memory = None, change = False):
+		self.free_pct = free_pct
+		""" Percentage of free memory of the VM """
+		self.mem_diff = mem_diff
+		""" Difference between the real memory and the total memory of the VM """
+		self.out_of_band = out_of_band
+		""" Flag set if the free memory is outside MEM_OVER +- MEM_MARGIN """
+		self.init_state = init_state
+		""" Flag set if the memory of the VM has been never modified (the initial memory must be stored) """
+		self.in_cooldown = in_cooldown
+		""" Flag set if the VM is in the cooldown period """
+		self.no_free_memory = no_free_memory
+		""" Flag set if the VM has not free memory (the exponential backoff is used) """
+		self.no_free_memory_count = no_free_memory_count
+		""" New number of consecutive occurrences of not having free memory """
+		self.new_mem = new_mem
+		""" New memory size of the VM (None if it has not been computed) """
+		self.total_memory = total_memory
+		""" Total memory of the VM plus the mem_diff (the one to compare with new_mem) """
+		self.change = change
+		""" Flag set if the difference between new_mem and total_memory is enough to change the memory """
+
+	def get_values(self):
+		return tuple(getattr(self, name) for name in self.__slots__)
+
+	def __eq__(self, other):
+		return isinstance(other, SizingDecision) and self.get_values() == other.get_values()
+
+	def __ne__(self, other):
+		return not self == other
+
+def get_inputs(vm, vm_data, forecast_used_mem = None):
+	"""
+	Get the values used to compute the new memory size of the VM
+
+	Args:
+	- vm: VirtualMachineInfo object.
+	- vm_data: VMMonitorData object of the VM.
+	- forecast_used_mem: peak of used memory forecasted for the VM (None to use only the current sample).
+
+	Return: tuple of values to pass to size_vm or size_vms
+	"""
+	min_free_memory = Config.MIN_FREE_MEMORY
+	# check if the VM has defined a specific MIN_FREE_MEMORY value
+	if vm.min_free_mem:
+		min_free_memory = vm.min_free_mem
+	mem_over_ratio = Config.MEM_OVER
+	if vm.mem_over_ratio:
+		mem_over_ratio = vm.mem_over_ratio
+	return (vm.free_memory, vm.total_memory, vm.real_memory, vm.allocated_memory, min_free_memory, mem_over_ratio,
+			vm_data.mem_diff, vm_data.last_set_mem, vm_data.original_mem, vm_data.no_free_memory_count, forecast_used_mem)
+
+def size_vm(inputs, now):
+	"""
+	Compute the new memory size of a VM.
+	If the used memory forecasted is set, the VM is sized ahead of it: it also grows if the
+	forecasted free memory is under the band, and it is never sized under the forecasted usage.
+
+	Args:
+	- inputs: tuple returned by get_inputs.
+	- now: current time.
+
+	Return: SizingDecision object
+	"""
+	(free_memory, total_memory, real_memory, allocated_memory, min_free_memory, mem_over_ratio,
+		mem_diff, last_set_mem, original_mem, no_free_memory_count, forecast_used_mem) = inputs
+
+	free_pct = float(free_memory)/float(total_memory) * 100.0
+	if mem_diff is None:
+		mem_diff = real_memory - total_memory
+
+	used_mem = total_memory - free_memory
+	out_of_band = free_pct < (mem_over_ratio - Config.MEM_MARGIN) or free_pct > (mem_over_ratio + Config.MEM_MARGIN)
+	if forecast_used_mem is not None:
+		used_mem = max(used_mem, forecast_used_mem)
+		forecast_free_pct = float(total_memory - used_mem)/float(total_memory) * 100.0
+		out_of_band = out_of_band or forecast_free_pct < (mem_over_ratio - Config.MEM_MARGIN)
+
+	if not out_of_band:
+		return SizingDecision(free_pct, mem_diff, False, no_free_memory_count = no_free_memory_count, total_memory = total_memory)
+
+	init_state = last_set_mem is None
+	if init_state:
+		original_mem = allocated_memory
+		last_set_mem = now
+
+	if (now - last_set_mem) < Config.COOLDOWN:
+		return SizingDecision(free_pct, mem_diff, True, init_state, True, no_free_memory_count = no_free_memory_count, total_memory = total_memory)
+
+	no_free_memory = free_memory <= min_free_memory
+	# it not free memory use exponential backoff idea
+	if no_free_memory:
+		if no_free_memory_count > 1:
+			# if this is the third time with no free memory use the original size
+			new_mem = original_mem
+			no_free_memory_count = 0
+		else:
+			new_mem = int(used_mem + (original_mem - used_mem) * 0.5)
+			no_free_memory_count += 1
+	else:
+		divider = 1.0 - (mem_over_ratio/100.0)
+		new_mem = int(used_mem / divider)
+
+	# Check for minimum memory
+	if new_mem < Config.MEM_MIN:
+		new_mem = Config.MEM_MIN
+
+	# add diff to new_mem value and to total_memory to make it real_memory (vm.real_memory has delays between updates)
+	new_mem += mem_diff
+	total_memory += mem_diff
+
+	# We never set more memory that the initial amount
+	if new_mem > original_mem:
+		new_mem = original_mem
+
+	change = abs(int(total_memory) - new_mem) >= Config.MEM_DIFF_TO_CHANGE
+	return SizingDecision(free_pct, mem_diff, True, init_state, False, no_free_memory, no_free_memory_count, new_mem, total_memory, change)
+
+def size_vms(inputs, now):
+	"""
+	Compute the new memory size of a set of VMs in one vectorized pass.
+	If NumPy is not installed size_vm is used for each VM.
+
+	Args:
+	- inputs: list of tuples returned by get_inputs.
+	- now: current time.
+
+	Return: list (or SizingResults) with a SizingDecision object for each VM
+	(None for the VMs whose values are not valid, i.e. total memory 0)
+	"""
+	if numpy is None:
+		res = []
+		for vm_inputs in inputs:
+			try:
+				res.append(size_vm(vm_inputs, now))
+			except Exception:
+				logger.exception("Error computing the new memory size of a VM.")
+				res.append(None)
+		return res
+
+	if not inputs:
+		return []
+
+	# The None values are converted to NaN
+	values = numpy.array(inputs, dtype=numpy.float64)
+	(free_memory, total_memory, real_memory, allocated_memory, min_free_memory, mem_over_ratio,
+		mem_diff, last_set_mem, original_mem, no_free_memory_count, forecast_used_mem) = values.T
+
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		free_pct = free_memory / total_memory * 100.0
+		mem_diff = numpy.where(numpy.isnan(mem_diff), real_memory - total_memory, mem_diff)
+
+		used_mem = total_memory - free_memory
+		out_of_band = (free_pct < (mem_over_ratio - Config.MEM_MARGIN)) | (free_pct > (mem_over_ratio + Config.MEM_MARGIN))
+		forecast = ~numpy.isnan(forecast_used_mem)
+		used_mem = numpy.where(forecast, numpy.maximum(used_mem, forecast_used_mem), used_mem)
+		forecast_free_pct = (total_memory - used_mem) / total_memory * 100.0
+		out_of_band |= forecast & (forecast_free_pct < (mem_over_ratio - Config.MEM_MARGIN))
+		init_state = out_of_band & numpy.isnan(last_set_mem)
+		original_mem = numpy.where(init_state, allocated_memory, original_mem)
+		last_set_mem = numpy.where(init_state, now, last_set_mem)
+		in_cooldown = out_of_band & ((now - last_set_mem) < Config.COOLDOWN)
+		sized = out_of_band & ~in_cooldown
+
+		no_free_memory = free_memory <= min_free_memory
+		to_original = no_free_memory & (no_free_memory_count > 1)
+		divider = 1.0 - (mem_over_ratio/100.0)
+		new_mem = numpy.where(to_original, original_mem,
+					numpy.where(no_free_memory, numpy.trunc(used_mem + (original_mem - used_mem) * 0.5),
+								numpy.trunc(used_mem / divider)))
+		new_count = numpy.where(to_original, 0, numpy.where(no_free_memory, no_free_memory_count + 1, no_free_memory_count))
+
+		new_mem = numpy.maximum(new_mem, Config.MEM_MIN)
+		new_mem += mem_diff
+		sized_total_memory = total_memory + mem_diff
+		new_mem = numpy.where(new_mem > original_mem, original_mem, new_mem)
+		change = numpy.abs(numpy.trunc(sized_total_memory) - new_mem) >= Config.MEM_DIFF_TO_CHANGE
+
+		# The cases where the scalar computation fails
+		valid = (total_memory != 0) & numpy.isfinite(free_pct) & numpy.isfinite(mem_diff)
+		valid &= ~sized | (numpy.isfinite(new_mem) & (no_free_memory | (divider != 0)))
+
+	results = numpy.column_stack((valid, free_pct, mem_diff, out_of_band, init_state, in_cooldown, sized,
+								no_free_memory, new_count, new_mem, sized_total_memory, change))
+	return SizingResults(inputs, results)
+
+class SizingResults(object):
+	"""
+	List with the SizingDecision objects computed by size_vms.
+	The results are kept in a NumPy array and each SizingDecision is created when it is accessed.
+	"""
+
+	def __init__(self, inputs, results):
+		self.inputs = inputs
+		""" List of tuples returned by get_inputs """
+		self.results = results
+		""" NumPy array with a row of results for each VM """
+
+	def __len__(self):
+		return len(self.inputs)
+
+	def __iter__(self):
+		for index in xrange(len(self.inputs)):
+			yield self[index]
+
+	def __eq__(self, other):
+		return list(self) == list(other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __getitem__(self, index):
+		(valid, free_pct, mem_diff, out_of_band, init_state, in_cooldown, sized,
+			no_free_memory, new_count, new_mem, total_memory, change) = self.results[index].tolist()
+		if not valid:
+			return None
+		elif sized:
+			return SizingDecision(free_pct, int(mem_diff), True, bool(init_state), False, bool(no_free_memory),
+								int(new_count), int(new_mem), int(total_memory), bool(change))
+		else:
+			inputs = self.inputs[index]
+			return SizingDecision(free_pct, int(mem_diff), bool(out_of_band), bool(init_state), bool(in_cooldown),
+								no_free_memory_count = inputs[9], total_memory = inputs[1])
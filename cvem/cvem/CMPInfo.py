@@ -29,6 +29,28 @@ class CMPInfo:
 		Return: list of VirtualMachineInfo
 		"""
 		raise Exception("Not implemented")
+
+	def iter_vm_list(self):
+		"""
+		Get the VMs of the CMP one by one, to avoid having all of them in memory.
+		Subclasses should override it to parse the VM list incrementally.
+		
+		Return: iterator of VirtualMachineInfo
+		"""
+		return iter(self.get_vm_list())
+
+	@staticmethod
+	def get_vm_info(vm_id):
+		"""
+		Get the information about the VM "vm_id"
+		
+		Args:
+
+		- vm_id: VM id.
+
+		Return: VirtualMachineInfo object
+		"""
+		raise Exception("Not implemented")
 	
 	@staticmethod
 	def get_host_info(host_id):
@@ -80,6 +102,8 @@ class VirtualMachineInfo:
 		""" Free memory of the VM """
 		self.allocated_memory = allocated_memory
 		""" Amount of memory originally allocated by the CMP """
+		self.cpus = None
+		""" Number of CPUs allocated by the CMP """
 		self.min_free_mem = None
 		""" Minimum amount of memory that will trigger the exponential backoff algorithm
 		    If defined it overwrites the default system value: MIN_FREE_MEM
@@ -88,6 +112,16 @@ class VirtualMachineInfo:
 		""" The Memory Overprovisioning Ratio
 		    If defined it overwrites the default system value: MEM_OVER
 		"""
+		self.mem_policy = None
+		""" The policy to size the memory of the VM: reactive or predictive
+		    If defined it overwrites the default system value: MEM_POLICY
+		"""
+		self.timestamp = None
+		""" Time when the memory values were monitored """
+		self.last_poll = None
+		""" Time of the last poll of the VM made by the CMP """
+		self.active = True
+		""" Flag to indicate that the VM is running in the CMP """
 		self.raw = raw
 		""" Data of the VM in the original format of the CMP """
 	
@@ -107,11 +141,54 @@ class VirtualMachineInfo:
 		if self.free_memory < 0:
 			self.free_memory = 0
 		
+class VMIndex:
+	"""
+	List of VirtualMachineInfo objects indexed by VM ID and by host ID.
+	It is built once per monitor loop, when the VM list is obtained from the CMP.
+	"""
+	def __init__(self, vm_list):
+		self.vms = vm_list
+		""" List of VirtualMachineInfo """
+		self.by_id = {}
+		""" Dict with the VirtualMachineInfo of each VM ID """
+		self.by_host = {}
+		""" Dict with the list of VirtualMachineInfo of each host ID """
+		for vm in vm_list:
+			self.by_id[vm.id] = vm
+			if vm.host is not None:
+				if vm.host.id not in self.by_host:
+					self.by_host[vm.host.id] = []
+				self.by_host[vm.host.id].append(vm)
+
+	def __iter__(self):
+		return iter(self.vms)
+
+	def __len__(self):
+		return len(self.vms)
+
+	def get(self, vm_id):
+		"""
+		Get the VirtualMachineInfo of the VM "vm_id" (or None if it does not exist)
+		"""
+		return self.by_id.get(vm_id)
+
+	def get_host_vms(self, host_id):
+		"""
+		Get the list of VirtualMachineInfo of the VMs allocated in the host "host_id"
+		"""
+		return self.by_host.get(host_id, [])
+
 class HostInfo:
 	""" Class to store the Host information """
 	def __init__(self, host_id = None, name = None, active = True, raw = None):
 		self.id =  host_id
 		self.name =  name
 		self.active = active
+		self.last_update = None
+		""" Timestamp of the last time that the CMP refreshed the host information """
+		self.free_memory = None
+		""" Amount of free memory of the host """
+		self.free_cpus = None
+		""" Number of free CPUs of the host """
 		self.raw = raw
 		""" Data of the host in the original format of the CMP """
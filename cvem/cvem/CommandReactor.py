@@ -0,0 +1,191 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import os
+import time
+import errno
+import fcntl
+import select
+import signal
+import subprocess
+import collections
+from config import logger
+
+def _set_nonblocking(fd):
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+class RunningCommand:
+	""" State of a command launched by the CommandReactor """
+	def __init__(self, index, process, strin, deadline):
+		self.index = index
+		""" Position of the command in the list of commands """
+		self.process = process
+		self.strin = strin
+		""" Data pending to be written in the stdin of the command """
+		self.output = []
+		self.deadline = deadline
+		""" Time to kill the command """
+		self.eof = False
+		""" The command has closed its stdout """
+		self.stdout_fd = process.stdout.fileno()
+		self.stdin_fd = None
+		if process.stdin is not None:
+			self.stdin_fd = process.stdin.fileno()
+
+class CommandReactor:
+	"""
+	Run a set of shell commands concurrently from the calling thread, using poll to read their
+	output and write their input without blocking. At most max_concurrency commands are running
+	at the same time, and the commands that run more than timeout secs are killed (with all
+	their children, i.e. the ssh sessions), so a slow host does not delay the rest of them.
+	"""
+
+	POLL_INTERVAL = 0.01
+	""" Time (in secs) to check the commands that have closed the stdout but have not finished yet """
+
+	def __init__(self, max_concurrency = 100, timeout = 60.0):
+		self.max_concurrency = max(1, max_concurrency)
+		self.timeout = timeout
+		""" Time (in secs) to kill each command (0 to disable it) """
+
+	def run(self, commands):
+		"""
+		Run a set of commands
+
+		Args:
+		- commands: list of tuples (command, strin) with the shell command and the data to write
+		  in its stdin (or None).
+
+		Return: list with the tuple (success, output) of each command (as runcommand)
+		"""
+		results = [None] * len(commands)
+		pending = collections.deque(enumerate(commands))
+		running = []
+		fds = {}
+		""" Dict with the RunningCommand of each fd registered in the poller """
+		poller = select.poll()
+
+		while pending or running:
+			while pending and len(running) < self.max_concurrency:
+				index, (command, strin) = pending.popleft()
+				cmd = self._launch(index, command, strin, poller, fds)
+				if cmd is None:
+					results[index] = (False, "Error executing the command: " + command)
+				else:
+					running.append(cmd)
+
+			timeout = None
+			if self.timeout > 0 and running:
+				timeout = max(0, min(cmd.deadline for cmd in running) - time.time())
+			if any(cmd.eof for cmd in running):
+				timeout = min(timeout, self.POLL_INTERVAL) if timeout is not None else self.POLL_INTERVAL
+			try:
+				events = poller.poll(None if timeout is None else int(timeout * 1000) + 1)
+			except select.error, ex:
+				if ex.args[0] == errno.EINTR:
+					continue
+				raise
+
+			for fd, event in events:
+				cmd = fds.get(fd)
+				if cmd is None:
+					continue
+				if fd == cmd.stdin_fd:
+					self._write(cmd, poller, fds)
+				else:
+					self._read(cmd, poller, fds)
+
+			now = time.time()
+			for cmd in list(running):
+				if cmd.eof and cmd.process.poll() is not None:
+					running.remove(cmd)
+					self._close(cmd, poller, fds)
+					results[cmd.index] = (cmd.process.returncode == 0, "".join(cmd.output))
+				elif self.timeout > 0 and now >= cmd.deadline:
+					running.remove(cmd)
+					self._kill(cmd, poller, fds)
+					logger.warn("Timeout of %s secs executing the command: %s" % (self.timeout, commands[cmd.index][0]))
+					results[cmd.index] = (False, "".join(cmd.output) + "Timeout executing the command.")
+
+		return results
+
+	def _launch(self, index, command, strin, poller, fds):
+		try:
+			process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE if strin is not None else None,
+									stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True,
+									preexec_fn=os.setsid)
+		except OSError:
+			logger.exception("Error executing the command: " + command)
+			return None
+
+		cmd = RunningCommand(index, process, strin, time.time() + self.timeout)
+		_set_nonblocking(cmd.stdout_fd)
+		poller.register(cmd.stdout_fd, select.POLLIN | select.POLLPRI)
+		fds[cmd.stdout_fd] = cmd
+		if cmd.stdin_fd is not None:
+			_set_nonblocking(cmd.stdin_fd)
+			poller.register(cmd.stdin_fd, select.POLLOUT)
+			fds[cmd.stdin_fd] = cmd
+		return cmd
+
+	def _read(self, cmd, poller, fds):
+		fd = cmd.stdout_fd
+		try:
+			data = os.read(fd, 65536)
+		except OSError, ex:
+			if ex.errno in (errno.EAGAIN, errno.EINTR):
+				return
+			data = ""
+		if data:
+			cmd.output.append(data)
+		else:
+			cmd.eof = True
+			poller.unregister(fd)
+			del fds[fd]
+
+	def _write(self, cmd, poller, fds):
+		fd = cmd.stdin_fd
+		try:
+			written = os.write(fd, cmd.strin)
+			cmd.strin = cmd.strin[written:]
+		except OSError, ex:
+			if ex.errno in (errno.EAGAIN, errno.EINTR):
+				return
+			# The command has closed its stdin
+			cmd.strin = ""
+		if not cmd.strin:
+			poller.unregister(fd)
+			del fds[fd]
+			cmd.process.stdin.close()
+			cmd.stdin_fd = None
+
+	def _close(self, cmd, poller, fds):
+		for fd in (cmd.stdin_fd, cmd.stdout_fd):
+			if fds.get(fd) is cmd:
+				poller.unregister(fd)
+				del fds[fd]
+		for stream in (cmd.process.stdin, cmd.process.stdout):
+			if stream is not None and not stream.closed:
+				stream.close()
+
+	def _kill(self, cmd, poller, fds):
+		try:
+			os.killpg(cmd.process.pid, signal.SIGKILL)
+		except OSError:
+			pass
+		self._close(cmd, poller, fds)
+		cmd.process.wait()
@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import sys
+import socket
+import threading
+from config import Config, logger
+
+class EventFeed:
+	"""
+	Receive the events of the changes of the VMs and hosts of the CMP in a local socket.
+	Each event is a line with the type and the ID of the object changed: "VM <id>" or "HOST <id>",
+	or the line "RESYNC" to request a full resync of the VM pool.
+	The events are coalesced until they are taken with get_events.
+	"""
+
+	VM = "VM"
+	HOST = "HOST"
+	RESYNC = "RESYNC"
+
+	def __init__(self, address = "127.0.0.1", port = 0):
+		self.address = address
+		""" Address to listen for events """
+		self.port = port
+		""" Port to listen for events (0 to select a free one, set in start) """
+		self.vm_ids = set()
+		""" Set with the IDs of the VMs changed since the last get_events """
+		self.host_ids = set()
+		""" Set with the IDs of the hosts changed since the last get_events """
+		self.resync = False
+		""" Flag set if a full resync has been requested since the last get_events """
+		self.received = 0
+		""" Number of events received """
+		self._cond = threading.Condition()
+		self._socket = None
+
+	def start(self):
+		"""
+		Start listening for events in a background thread
+		"""
+		self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._socket.bind((self.address, self.port))
+		self._socket.listen(16)
+		self.port = self._socket.getsockname()[1]
+
+		thread = threading.Thread(target=self._serve, name="cvem-event-feed")
+		thread.daemon = True
+		thread.start()
+		logger.info("Listening for events in %s:%d" % (self.address, self.port))
+
+	def stop(self):
+		"""
+		Stop listening for events
+		"""
+		if self._socket:
+			self._socket.close()
+			self._socket = None
+
+	def _serve(self):
+		while self._socket:
+			try:
+				conn, _ = self._socket.accept()
+			except Exception:
+				if self._socket:
+					logger.exception("Error accepting an event connection.")
+				continue
+			thread = threading.Thread(target=self._handle, args=(conn,))
+			thread.daemon = True
+			thread.start()
+
+	def _handle(self, conn):
+		try:
+			conn.settimeout(10)
+			conn_file = conn.makefile('r')
+			for line in conn_file:
+				self.add_event(line)
+			conn_file.close()
+		except Exception:
+			logger.exception("Error reading the events of a connection.")
+		finally:
+			conn.close()
+
+	def add_event(self, line):
+		"""
+		Add an event to the feed
+
+		Args:
+		- line: str with the event: "VM <id>", "HOST <id>" or "RESYNC".
+
+		Return: True if the event is valid or False otherwise
+		"""
+		parts = line.split()
+		try:
+			if parts == [self.RESYNC]:
+				event = (self.RESYNC, None)
+			elif len(parts) == 2 and parts[0].upper() in [self.VM, self.HOST]:
+				event = (parts[0].upper(), int(parts[1]))
+			else:
+				raise ValueError()
+		except ValueError:
+			logger.warn("Invalid event received: %s" % line.strip())
+			return False
+
+		with self._cond:
+			kind, obj_id = event
+			if kind == self.VM:
+				self.vm_ids.add(obj_id)
+			elif kind == self.HOST:
+				self.host_ids.add(obj_id)
+			else:
+				self.resync = True
+			self.received += 1
+			self._cond.notify()
+		return True
+
+	def get_events(self, timeout = None):
+		"""
+		Get the events received since the last call, waiting for them if there are none
+
+		Args:
+		- timeout: max time (in secs) to wait for events (None to wait forever).
+
+		Return: tuple (vm_ids, host_ids, resync) with the set of IDs of VMs changed,
+		the set of IDs of hosts changed and a flag to make a full resync
+		"""
+		with self._cond:
+			if not self.vm_ids and not self.host_ids and not self.resync:
+				self._cond.wait(timeout)
+			res = (self.vm_ids, self.host_ids, self.resync)
+			self.vm_ids = set()
+			self.host_ids = set()
+			self.resync = False
+			return res
+
+class EventPublisher:
+	"""
+	Send events to an EventFeed. It can be used from the CMP hooks
+	(or to test the event mode with a fake publisher).
+	"""
+
+	def __init__(self, address = "127.0.0.1", port = None):
+		self.address = address
+		self.port = port
+
+	def publish(self, events):
+		"""
+		Send a set of events
+
+		Args:
+		- events: list of tuples (type, id) with the events, i.e. [("VM", 12), ("HOST", 3)].
+		"""
+		lines = ""
+		for kind, obj_id in events:
+			if obj_id is None:
+				lines += "%s\n" % kind
+			else:
+				lines += "%s %s\n" % (kind, obj_id)
+		conn = socket.create_connection((self.address, self.port), 10)
+		try:
+			conn.sendall(lines)
+		finally:
+			conn.close()
+
+if __name__ == "__main__":
+	# To be called from the CMP hooks, i.e.: EventFeed.py VM 12 [HOST 3 ...]
+	args = sys.argv[1:]
+	events = []
+	while args:
+		if args[0] == EventFeed.RESYNC:
+			events.append((args.pop(0), None))
+		elif len(args) >= 2:
+			events.append((args.pop(0), args.pop(0)))
+		else:
+			print "Usage: %s [VM <id>] [HOST <id>] [RESYNC] ..." % sys.argv[0]
+			sys.exit(1)
+	EventPublisher(Config.EVENT_FEED_ADDRESS, Config.EVENT_FEED_PORT).publish(events)
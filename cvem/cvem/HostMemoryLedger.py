@@ -0,0 +1,93 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import threading
+
+class HostMemoryLedger:
+	"""
+	Free memory of each host updated with the decisions made in the current monitor loop.
+	It starts with the free memory of the host pool snapshot, and each memory increase
+	is debited from it (and each decrease or migration out of the host credited to it)
+	as soon as it is decided, so the threads that monitor VMs of the same host
+	do not use the same free memory.
+	"""
+
+	def __init__(self):
+		self.free_memory = {}
+		""" Dict with the free memory of each host ID """
+		self._lock = threading.Lock()
+
+	def reset(self, hosts):
+		"""
+		Start the ledger with the free memory of the hosts
+		
+		Args:
+		- hosts: list of HostInfo objects.
+		"""
+		with self._lock:
+			self.free_memory = dict((host.id, host.free_memory) for host in hosts if host.free_memory is not None)
+
+	def get_free_memory(self, host_info):
+		"""
+		Get the free memory of the host, or None if it is not known
+		"""
+		with self._lock:
+			return self._get_free_memory(host_info)
+
+	def _get_free_memory(self, host_info):
+		if host_info.id not in self.free_memory:
+			if host_info.free_memory is None:
+				return None
+			# The host was not in the snapshot, start with its own value
+			self.free_memory[host_info.id] = host_info.free_memory
+		return self.free_memory[host_info.id]
+
+	def reserve(self, host_info, memory, mem_margin = 0):
+		"""
+		Debit the memory from the host if it has enough free memory available
+		
+		Args:
+		- host_info: HostInfo object of the host.
+		- memory: amount of memory needed in the host.
+		- mem_margin: amount of memory that must remain free in the host.
+
+		Return: True if the memory has been reserved, False if the host has not enough
+		free memory or None if the free memory of the host is not known.
+		"""
+		with self._lock:
+			free_memory = self._get_free_memory(host_info)
+			if free_memory is None:
+				return None
+			if free_memory - memory > mem_margin:
+				self.free_memory[host_info.id] = free_memory - memory
+				return True
+			else:
+				return False
+
+	def debit(self, host_info, memory):
+		"""
+		Debit the memory from the host, although it has not enough free memory
+		"""
+		with self._lock:
+			free_memory = self._get_free_memory(host_info)
+			if free_memory is not None:
+				self.free_memory[host_info.id] = free_memory - memory
+
+	def credit(self, host_info, memory):
+		"""
+		Credit the memory to the host (a negative amount is debited)
+		"""
+		self.debit(host_info, -memory)
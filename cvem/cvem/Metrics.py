@@ -0,0 +1,322 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Metrics of the monitor in the Prometheus text format, served by an HTTP server in its own thread
+"""
+
+import time
+import json
+import bisect
+import logging
+import urlparse
+import threading
+from contextlib import contextmanager
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from config import logger
+
+class Metric:
+	"""
+	Base class to the metrics. Each metric has a value for each set of label values.
+	"""
+
+	TYPE = None
+
+	def __init__(self, name, description, labels = ()):
+		self.name = name
+		self.description = description
+		self.labels = tuple(labels)
+		""" Names of the labels of the metric """
+		self.values = {}
+		""" Dict with the value of each tuple of label values """
+		self._lock = threading.Lock()
+
+	def _format_labels(self, label_values, extra = None):
+		pairs = zip(self.labels, label_values)
+		if extra:
+			pairs.append(extra)
+		if not pairs:
+			return ""
+		return "{" + ",".join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs) + "}"
+
+	def get_samples(self):
+		"""
+		Get the samples of the metric
+
+		Return: list of tuples (name, labels, value)
+		"""
+		with self._lock:
+			return [(self.name, self._format_labels(label_values), value) for label_values, value in sorted(self.values.items())]
+
+	def render(self):
+		lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s %s" % (self.name, self.TYPE)]
+		for name, labels, value in self.get_samples():
+			lines.append("%s%s %s" % (name, labels, repr(float(value))))
+		return "\n".join(lines)
+
+class Counter(Metric):
+	""" Value that only increases """
+
+	TYPE = "counter"
+
+	def inc(self, *label_values):
+		self.add(1, *label_values)
+
+	def add(self, amount, *label_values):
+		with self._lock:
+			self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+	""" Value that can go up and down """
+
+	TYPE = "gauge"
+
+	def __init__(self, name, description, labels = ()):
+		Metric.__init__(self, name, description, labels)
+		self.function = None
+
+	def set(self, value, *label_values):
+		with self._lock:
+			self.values[label_values] = value
+
+	def set_function(self, function):
+		"""
+		Set a function to get the values of the gauge when the metrics are requested.
+		It must return the value or, if the gauge has labels, a dict with the value of each label value.
+		"""
+		self.function = function
+
+	def get_samples(self):
+		if self.function:
+			try:
+				values = self.function()
+			except Exception:
+				logger.exception("Error getting the value of the metric: " + self.name)
+				values = {}
+			if not self.labels:
+				values = {(): values}
+			with self._lock:
+				self.values = dict((key if isinstance(key, tuple) else (key,), value) for key, value in values.items())
+		return Metric.get_samples(self)
+
+class Histogram(Metric):
+	""" Distribution of observed values in cumulative buckets """
+
+	TYPE = "histogram"
+	DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+	def __init__(self, name, description, labels = (), buckets = DEFAULT_BUCKETS):
+		Metric.__init__(self, name, description, labels)
+		self.buckets = tuple(sorted(buckets))
+
+	def observe(self, value, *label_values):
+		with self._lock:
+			if label_values not in self.values:
+				# counts of each bucket (plus +Inf), sum and count
+				self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			counts, total, count = self.values[label_values]
+			counts[bisect.bisect_left(self.buckets, value)] += 1
+			self.values[label_values][1] = total + value
+			self.values[label_values][2] = count + 1
+
+	def get_samples(self):
+		res = []
+		with self._lock:
+			for label_values, (counts, total, count) in sorted(self.values.items()):
+				cumulative = 0
+				for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+					cumulative += bucket_count
+					bound = "+Inf" if bound == float("inf") else repr(float(bound))
+					res.append((self.name + "_bucket", self._format_labels(label_values, ("le", bound)), cumulative))
+				res.append((self.name + "_sum", self._format_labels(label_values), total))
+				res.append((self.name + "_count", self._format_labels(label_values), count))
+		return res
+
+class MetricsRegistry:
+	""" Set of metrics to render together """
+
+	def __init__(self):
+		self.metrics = []
+
+	def register(self, metric):
+		self.metrics.append(metric)
+		return metric
+
+	def render(self):
+		"""
+		Get the metrics in the Prometheus text format
+		"""
+		return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+class ErrorCountHandler(logging.Handler):
+	""" Logging handler that counts the error messages """
+
+	def __init__(self, counter):
+		logging.Handler.__init__(self, logging.ERROR)
+		self.counter = counter
+
+	def emit(self, record):
+		self.counter.inc()
+
+class MonitorMetrics:
+	"""
+	Metrics of the Monitor
+	"""
+
+	CYCLE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+	def __init__(self):
+		self.registry = MetricsRegistry()
+		self.cycle_seconds = self.registry.register(Histogram("cvem_cycle_seconds",
+			"Duration of the monitor loops", buckets = self.CYCLE_BUCKETS))
+		self.phase_seconds = self.registry.register(Histogram("cvem_phase_seconds",
+			"Duration of each phase of the monitor loops", ("phase",)))
+		self.memory_changes = self.registry.register(Counter("cvem_memory_changes_total",
+			"Number of changes of the memory of the VMs", ("result",)))
+		self.migrations = self.registry.register(Counter("cvem_migrations_total",
+			"Number of migrations of VMs", ("result",)))
+		self.power_on_requests = self.registry.register(Counter("cvem_power_on_requests_total",
+			"Number of requests to power on a host sent to CLUES", ("result",)))
+		self.errors = self.registry.register(Counter("cvem_errors_total",
+			"Number of errors logged"))
+		self.monitored_vms = self.registry.register(Gauge("cvem_monitored_vms",
+			"Number of VMs with monitoring information in the last monitor loop"))
+		self.cycle_overrun = self.registry.register(Gauge("cvem_cycle_overrun_seconds",
+			"Time that the last monitor loop exceeded DELAY"))
+		self.cycle_budget_exceeded = self.registry.register(Counter("cvem_cycle_budget_exceeded_total",
+			"Number of monitor loops that exceeded CYCLE_BUDGET before evaluating all the VMs"))
+		self.deferred_vms = self.registry.register(Gauge("cvem_deferred_vms",
+			"Number of VMs deferred to the next monitor loop because the last one exceeded CYCLE_BUDGET"))
+		self.vm_evaluations = self.registry.register(Counter("cvem_vm_evaluations_total",
+			"Number of VMs evaluated or skipped because their inputs had not changed", ("result",)))
+		self.skipped_vms_ratio = self.registry.register(Gauge("cvem_skipped_vms_ratio",
+			"Fraction of the VMs skipped in the last monitor loop because their inputs had not changed"))
+		self.stale_vms = self.registry.register(Gauge("cvem_stale_vms",
+			"Number of VMs with metrics older than STALE_METRICS_AGE in the last monitor loop"))
+		self.fresh_vms = self.registry.register(Gauge("cvem_fresh_vms",
+			"Number of VMs with fresh metrics in the last monitor loop"))
+		self.error_handler = ErrorCountHandler(self.errors)
+		""" Handler of the logger that counts the errors """
+		logger.addHandler(self.error_handler)
+
+	def close(self):
+		"""
+		Stop counting the errors of the logger
+		"""
+		logger.removeHandler(self.error_handler)
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		Measure the duration of a phase of the monitor loop
+		"""
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.phase_seconds.observe(time.time() - start, name)
+
+	@staticmethod
+	def get_result(success):
+		if success:
+			return "ok"
+		else:
+			return "error"
+
+class MetricsServer:
+	"""
+	HTTP server that serves the metrics of a registry in /metrics in its own thread.
+	If a TimeSeriesStore is set it also serves the memory samples of the VMs in JSON:
+	- /timeseries/<vm_id>?minutes=N: the samples of the last N minutes of the VM (default 60).
+	- /timeseries/top?k=N&minutes=M: the N VMs with more memory pressure (default 10), using
+	  the average of the last M minutes (or the last sample if it is not set).
+	"""
+
+	def __init__(self, registry, address = "127.0.0.1", port = 0, timeseries = None):
+		self.registry = registry
+		self.address = address
+		self.port = port
+		self.timeseries = timeseries
+		""" TimeSeriesStore with the memory samples of the VMs (or None) """
+		self._server = None
+
+	def get_timeseries(self, path, params):
+		"""
+		Get the response of a request to /timeseries
+
+		Args:
+		- path: path of the request.
+		- params: dict with the list of values of each parameter of the query string.
+
+		Return: object to serve in JSON or None if the path is not found
+		"""
+		parts = path.strip("/").split("/")
+		if self.timeseries is None or len(parts) != 2 or parts[0] != "timeseries":
+			return None
+		now = time.time()
+		minutes = params.get("minutes", [None])[0]
+		if minutes is not None:
+			minutes = float(minutes)
+		if parts[1] == "top":
+			k = int(params.get("k", ["10"])[0])
+			return [{"vm_id": vm_id, "pressure": pressure}
+					for vm_id, pressure in self.timeseries.top_pressure(k, minutes, now)]
+		if minutes is None:
+			minutes = 60
+		return self.timeseries.query(int(parts[1]), minutes, now)
+
+	def start(self):
+		registry = self.registry
+		server = self
+
+		class MetricsHandler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				url = urlparse.urlparse(self.path)
+				if url.path == "/metrics":
+					body = registry.render()
+					content_type = "text/plain; version=0.0.4"
+				else:
+					try:
+						res = server.get_timeseries(url.path, urlparse.parse_qs(url.query))
+					except ValueError:
+						self.send_error(400)
+						return
+					if res is None:
+						self.send_error(404)
+						return
+					body = json.dumps(res)
+					content_type = "application/json"
+				self.send_response(200)
+				self.send_header("Content-Type", content_type)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				logger.debug("Metrics request: " + format % args)
+
+		self._server = HTTPServer((self.address, self.port), MetricsHandler)
+		self.port = self._server.server_address[1]
+		thread = threading.Thread(target=self._server.serve_forever, name="cvem-metrics")
+		thread.daemon = True
+		thread.start()
+		logger.info("Serving the metrics in http://%s:%d/metrics" % (self.address, self.port))
+
+	def stop(self):
+		if self._server:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
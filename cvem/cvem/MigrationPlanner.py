@@ -0,0 +1,143 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import bisect
+from config import logger
+
+class MigrationRequest:
+	""" Request of memory of a VM that can not grow in its host """
+	def __init__(self, vm, host, memory):
+		self.vm = vm
+		""" VirtualMachineInfo of the VM that needs more memory """
+		self.host = host
+		""" HostInfo of the host of the VM """
+		self.memory = memory
+		""" Amount of memory that the VM needs to grow """
+
+class MigrationPlanner:
+	"""
+	Plan the migrations needed to serve all the memory requests of a monitor loop together.
+	For each host with requests it selects the minimal set of VMs to move out to cover
+	the memory deficit of the host, and then it assigns all the selected VMs to the
+	rest of hosts using a best fit decreasing bin packing with memory and CPU constraints.
+	"""
+
+	def __init__(self, hosts, mem_margin = 0, free_memory = None):
+		self.hosts = dict((host.id, host) for host in hosts)
+		""" Dict with the HostInfo of each host ID """
+		self.mem_margin = mem_margin
+		""" Amount of memory that must remain free in each host """
+		self.free_memory = dict((host.id, host.free_memory) for host in hosts)
+		""" Dict with the free memory of each host ID (by default the one of the HostInfo) """
+		if free_memory:
+			self.free_memory.update(free_memory)
+		self.unplaced = []
+		""" List of VirtualMachineInfo of the VMs that could not be placed in any host """
+
+	@staticmethod
+	def get_vm_memory(vm):
+		if vm.total_memory:
+			return vm.total_memory
+		else:
+			# If the monitored total memory is not available use the CMP original allocated one
+			return vm.allocated_memory
+
+	def select_vms(self, deficit, candidates):
+		"""
+		Select the minimal set of VMs whose memory covers the deficit:
+		the smallest VM that covers it alone or, if none does, the biggest ones until it is covered.
+
+		Args:
+		- deficit: amount of memory to free.
+		- candidates: list of VirtualMachineInfo that can be migrated.
+
+		Return: list of VirtualMachineInfo to migrate
+		"""
+		candidates = sorted(candidates, key=self.get_vm_memory)
+		mems = [self.get_vm_memory(vm) for vm in candidates]
+		pos = bisect.bisect_left(mems, deficit)
+		if pos < len(candidates):
+			return [candidates[pos]]
+
+		res = []
+		freed = 0
+		for vm in reversed(candidates):
+			if freed >= deficit:
+				break
+			res.append(vm)
+			freed += self.get_vm_memory(vm)
+		return res
+
+	def plan(self, requests, get_host_vms):
+		"""
+		Plan the migrations to serve the memory requests
+
+		Args:
+		- requests: list of MigrationRequest.
+		- get_host_vms: function that returns the list of VirtualMachineInfo of a host: get_host_vms(host_info).
+
+		Return: list of tuples (vm, source_host, target_host) with the migrations to perform
+		"""
+		self.unplaced = []
+		requests_by_host = {}
+		for request in requests:
+			if request.host.id not in requests_by_host:
+				requests_by_host[request.host.id] = []
+			requests_by_host[request.host.id].append(request)
+
+		# Select the VMs to migrate from each host
+		to_migrate = []
+		for host_id, host_requests in requests_by_host.items():
+			host = self.hosts.get(host_id, host_requests[0].host)
+			needed = sum(request.memory for request in host_requests)
+			deficit = needed - ((self.free_memory.get(host_id, host.free_memory) or 0) - self.mem_margin)
+			if deficit <= 0:
+				continue
+			requesting = set(request.vm.id for request in host_requests)
+			host_vms = get_host_vms(host)
+			candidates = [vm for vm in host_vms if vm.id not in requesting]
+			selected = self.select_vms(deficit, candidates)
+			if sum(self.get_vm_memory(vm) for vm in selected) < deficit:
+				# The rest of VMs are not enough, so let's also move the VMs that need memory
+				selected = self.select_vms(deficit, host_vms)
+			logger.debug("Host %s needs %d KB. VMs selected to migrate: %s" % (host.name, deficit, [vm.id for vm in selected]))
+			to_migrate.extend((vm, host) for vm in selected)
+
+		# Free memory and CPUs of the target hosts (sorted by free memory)
+		targets = []
+		for host_id, host in self.hosts.items():
+			free_memory = self.free_memory.get(host_id)
+			if host.active and host_id not in requests_by_host and free_memory is not None:
+				targets.append([free_memory, host_id, host.free_cpus or 0])
+		targets.sort()
+
+		# Best fit decreasing: place the biggest VMs first in the host with less free memory that fits
+		migrations = []
+		to_migrate.sort(key=lambda x: self.get_vm_memory(x[0]), reverse=True)
+		for vm, source in to_migrate:
+			vm_mem = self.get_vm_memory(vm)
+			vm_cpus = vm.cpus or 0
+			pos = bisect.bisect_left(targets, [vm_mem + self.mem_margin])
+			while pos < len(targets) and targets[pos][2] < vm_cpus:
+				pos += 1
+			if pos < len(targets):
+				free_mem, host_id, free_cpus = targets.pop(pos)
+				bisect.insort(targets, [free_mem - vm_mem, host_id, free_cpus - vm_cpus])
+				migrations.append((vm, source, self.hosts[host_id]))
+			else:
+				self.unplaced.append(vm)
+
+		return migrations
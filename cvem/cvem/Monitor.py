@@ -15,18 +15,33 @@
 #--------------------------------------------------------------------------- #
 
 import time
+import itertools
+import threading
 from multiprocessing.pool import ThreadPool
-import cPickle as pickle
-import os
 from config import Config, logger
-from cpyutils.runcommand import runcommand
+from Actuator import get_actuator
+from StateJournal import StateJournal
+from VMDataStore import VMDataStore
+from CMPInfo import VMIndex
+from MigrationPlanner import MigrationPlanner, MigrationRequest
+from HostMemoryLedger import HostMemoryLedger
+from Scheduler import VMScheduler
+from EventFeed import EventFeed
+import BatchSizing
+from Predictor import HoltPredictor
+from TimeSeries import TimeSeriesStore
+from Metrics import MonitorMetrics, MetricsServer
+from Tracing import tracer
+from Recording import SnapshotRecorder
 
-class VMMonitorData:
+class VMMonitorData(object):
 	"""
 	Class to store monitoring information for each VM 
 	"""
 
-	def __init__(self, vm_id):
+	__slots__ = ('id', 'last_set_mem', 'original_mem', 'mem_diff', 'no_free_memory_count')
+
+	def __init__(self, vm_id = None):
 		self.id = vm_id
 		self.last_set_mem = None
 		""" The timestamp of the last modification of the memory for each VM """
@@ -38,6 +53,35 @@ class VMMonitorData:
 		self.no_free_memory_count = 0
 		""" The number of consecutive occurrences of not having free memory in each VM """
 
+	def __getstate__(self):
+		return dict((name, getattr(self, name)) for name in self.__slots__)
+
+	def __setstate__(self, state):
+		# state is the __dict__ of the objects pickled with the old class without __slots__
+		for name, value in state.items():
+			setattr(self, name, value)
+
+	def get_state(self):
+		"""
+		Get the monitoring information of the VM as a tuple
+		"""
+		return (self.last_set_mem, self.original_mem, self.mem_diff, self.no_free_memory_count)
+
+	@staticmethod
+	def from_state(vm_id, state):
+		"""
+		Create a VMMonitorData object from the tuple returned by get_state
+		"""
+		vm_data = VMMonitorData(vm_id)
+		vm_data.last_set_mem, vm_data.original_mem, vm_data.mem_diff, vm_data.no_free_memory_count = state
+		return vm_data
+
+class SerialPool:
+	""" Replacement of the ThreadPool that evaluates the VMs in order in the current thread """
+	@staticmethod
+	def map(function, iterable):
+		return map(function, iterable)
+
 class Monitor:
 	"""
 	Base class to monitors
@@ -48,25 +92,92 @@ class Monitor:
 		""" Object child of CMPInfo to connect with the underlying CMP """
 		self.last_migration = {}
 		""" Dict to store the timestamp of the last migration operation made in each host """
-		self.vm_data = {}
-		""" Dict to store the monitoring information for each VM """
+		self.vm_data = VMDataStore(VMMonitorData, Config.VM_DATA_SHARDS)
+		""" VMDataStore to store the monitoring information for each VM """
+		self.host_pool = {}
+		""" Dict with the snapshot of the HostInfo objects of the CMP indexed by host ID """
+		self.host_pool_expires = 0
+		""" Timestamp until the host pool snapshot can be reused """
+		self.host_ledger = HostMemoryLedger()
+		""" HostMemoryLedger with the free memory of the hosts updated with the decisions of the loop """
+		self.actuator = get_actuator()
+		""" Actuator object used to change the memory of the VMs """
+		self.memory_changes = {}
+		""" Dict with the list of memory changes (vm_id, new_mem) pending in each host (if BATCH_ACTUATION or ASYNC_ACTUATION is enabled) """
+		self.memory_changes_hosts = {}
+		""" Dict with the HostInfo of the hosts with memory changes pending """
+		self.memory_reservations = {}
+		""" Dict with the tuple (host_info, memory) debited from the host ledger by each memory change pending """
+		self._memory_changes_lock = threading.Lock()
+		self.migration_requests = []
+		""" List of MigrationRequest pending to be planned (if MIGRATION_PLANNER is enabled) """
+		self._migration_requests_lock = threading.Lock()
+		self.journal = StateJournal(Config.DATA_FILE, Config.DATA_COMPACT_RECORDS)
+		""" StateJournal object to store the monitor data """
+		self.scheduler = VMScheduler(Config.SCHEDULER_MIN_INTERVAL, Config.SCHEDULER_MAX_INTERVAL,
+									Config.SCHEDULER_BACKOFF, Config.SCHEDULER_FAST_CHANGE)
+		""" VMScheduler to decide when each VM is evaluated (if ADAPTIVE_SCHEDULER is enabled) """
+		self.predictor = HoltPredictor(Config.PREDICTIVE_ALPHA, Config.PREDICTIVE_BETA, Config.PREDICTIVE_HORIZON)
+		""" HoltPredictor with the forecast of the used memory of the VMs with the predictive MEM_POLICY """
+		self.metrics = MonitorMetrics()
+		""" MonitorMetrics with the metrics of the monitor (served in METRICS_PORT if it is set) """
+		self.timeseries = None
+		""" TimeSeriesStore with the last memory samples of the VMs (if TIMESERIES is enabled) """
+		if Config.TIMESERIES:
+			self.timeseries = TimeSeriesStore(Config.TIMESERIES_SAMPLES, Config.TIMESERIES_DOWNSAMPLE_INTERVAL,
+											Config.TIMESERIES_DOWNSAMPLED_SAMPLES)
+		self.recorder = None
+		""" SnapshotRecorder to record the VMs and hosts of each monitor loop (if RECORD_FILE is set) """
+		if Config.RECORD_FILE:
+			self.recorder = SnapshotRecorder(Config.RECORD_FILE)
+		self.shard_pool = None
+		""" ShardPool with the worker processes that evaluate the VMs (if PROCESS_SHARDS is set) """
+		self.cycle_deadline = None
+		""" Time to stop evaluating VMs in the current monitor loop (if CYCLE_BUDGET is set) """
+		self.carried_over = set()
+		""" Set with the IDs of the VMs deferred in the previous monitor loop """
+		self.deferred_vms = set()
+		""" Set with the IDs of the VMs deferred in the current monitor loop """
+		self.evaluated_vms = 0
+		""" Number of VMs evaluated in the current monitor loop """
+		self.skipped_vms = 0
+		""" Number of VMs skipped in the current monitor loop because their inputs have not changed """
+		self.vm_inputs = {}
+		""" Dict with the inputs (see get_inputs_key) of the last evaluation of each VM
+		with a stable decision (if SKIP_UNCHANGED_VMS is enabled) """
+		self.stale_vm_ids = set()
+		""" Set with the IDs of the VMs with stale metrics (if STALE_METRICS_AGE is set) """
+		self.stale_vms = 0
+		""" Number of VMs with stale metrics in the current monitor loop """
+		self.fresh_vms = 0
+		""" Number of VMs with fresh metrics in the current monitor loop """
 		
 		self.load_data()
 
-	def clean_old_data(self, current_vms):
+	def now(self):
+		"""
+		Get the current time used in the decisions (the Simulator replaces it with the time of the recording)
+		"""
+		return time.time()
+
+	def clean_old_data(self, current_vmids):
 		"""
 		Clean old data from the Monitor
 		Delete the values of VMs that do not appear in the
 		monitoring system.
 		To avoid an uncontrolled increase of memory usage.
 		"""
-		current_vmids = [vm.id for vm in current_vms]
-
 		try:
-			for vmid in self.vm_data.keys():
-				if vmid not in current_vmids:
-					logger.debug("Removing data for old VM ID: %s" % str(vmid))
-					del self.vm_data[vmid]
+			current_vmids = set(current_vmids)
+			for vmid in self.vm_data.retain(current_vmids):
+				logger.debug("Removing data for old VM ID: %s" % str(vmid))
+			self.scheduler.retain(current_vmids)
+			self.predictor.retain(current_vmids)
+			for vmid in [vmid for vmid in self.vm_inputs if vmid not in current_vmids]:
+				del self.vm_inputs[vmid]
+			self.stale_vm_ids &= current_vmids
+			if self.timeseries is not None:
+				self.timeseries.retain(current_vmids)
 		except:
 			logger.exception("ERROR cleaning old data.")
 	
@@ -74,35 +185,206 @@ class Monitor:
 		"""
 		Load the monitor data from file
 		"""
-		if os.path.isfile(Config.DATA_FILE):
-			try:
-				data_file = open(Config.DATA_FILE, 'r')
-				self.vm_data = pickle.load(data_file)
-				self.last_migration = pickle.load(data_file)
-				data_file.close()
-			except Exception:
-				logger.exception("ERROR loading data file: " + Config.DATA_FILE + ". Data not loaded.")
-		else:
-			logger.debug("No data file: " + Config.DATA_FILE)
+		try:
+			vm_states, self.last_migration = self.journal.load()
+			for vm_id, state in vm_states.items():
+				self.vm_data[vm_id] = VMMonitorData.from_state(vm_id, state)
+		except Exception:
+			logger.exception("ERROR loading data file: " + Config.DATA_FILE + ". Data not loaded.")
 		
 	def save_data(self):
 		"""
-		Save the monitor data to file
+		Save the changes of the monitor data to file
 		"""
 		try:
-			data_file = open(Config.DATA_FILE, 'wb')
-			pickle.dump(self.vm_data, data_file)
-			pickle.dump(self.last_migration, data_file)
-			data_file.close()
+			vm_states = self.vm_data.map(VMMonitorData.get_state)
+			records = self.journal.save(vm_states, self.last_migration)
+			logger.debug("%d changes stored in the data file." % records)
 		except Exception:
 			logger.exception("ERROR saving data to the file: " + Config.DATA_FILE + ". Changes not stored!!")
 
+	def update_host_pool(self):
+		"""
+		Get a snapshot of the hosts of the CMP indexed by host ID.
+		It is called once per monitor loop, so all the VMs of a host share the same HostInfo.
+		If HOST_POOL_TTL is set, the snapshot is reused until HOST_POOL_TTL secs
+		have passed since the oldest update of the hosts made by the CMP.
+		The host ledger is restarted with each new snapshot (and it keeps
+		the decisions of the previous loops while the snapshot is reused).
+		"""
+		now = self.now()
+		if self.host_pool and now < self.host_pool_expires:
+			logger.debug("Reusing the host pool snapshot. The CMP has not refreshed it.")
+			return self.host_pool
+
+		host_list = self.cmp.get_host_list()
+		if host_list is None:
+			logger.warn("Error getting the host pool. The host info will be requested per VM.")
+			self.host_pool = {}
+			self.host_pool_expires = 0
+			self.host_ledger.reset([])
+			return self.host_pool
+
+		self.host_pool = dict((host.id, host) for host in host_list)
+		self.host_ledger.reset(host_list)
+		self.host_pool_expires = 0
+		if Config.HOST_POOL_TTL > 0:
+			last_updates = [host.last_update for host in host_list if host.last_update]
+			if last_updates:
+				self.host_pool_expires = min(last_updates) + Config.HOST_POOL_TTL
+
+		return self.host_pool
+
 	def get_host_info(self, host_id):
 		if host_id is not None:
-			return self.cmp.get_host_info(host_id)
+			if host_id in self.host_pool:
+				return self.host_pool[host_id]
+			else:
+				logger.debug("Host ID %s not found in the host pool snapshot. Requesting it." % str(host_id))
+				with self.metrics.phase("host_info"):
+					return self.cmp.get_host_info(host_id)
 		else:
 			logger.error("Trying to get host info from a VM without host.id") 
 
+	def reserve_host_memory(self, host_info, memory):
+		"""
+		Check if the host has enough free memory available in the host ledger and debit it.
+		If the free memory of the host is not known, host_has_memory_free is used.
+
+		Args:
+		- host_info: HostInfo object of the host.
+		- memory: amount of memory needed in the host.
+
+		Return: True if the host has enough free memory or False otherwise.
+		"""
+		if not host_info:
+			return False
+		reserved = self.host_ledger.reserve(host_info, memory, Config.HOST_MEM_MARGIN)
+		if reserved is None:
+			return self.host_has_memory_free(host_info, memory)
+		logger.debug("The host %s has %d KB of free memory left in this loop." % (host_info.name, self.host_ledger.get_free_memory(host_info)))
+		return reserved
+
+	def move_host_memory(self, vm, source, target):
+		"""
+		Update the host ledger with the migration of a VM
+		"""
+		memory = MigrationPlanner.get_vm_memory(vm)
+		self.host_ledger.credit(source, memory)
+		if target:
+			self.host_ledger.debit(target, memory)
+
+	def reserve_host_to_migrate(self, memory, cpus, hosts = None):
+		"""
+		Select the host with more free memory in the host ledger that has enough memory and CPUs
+		to host a VM, and debit the memory of the VM from it (so the threads that migrate VMs
+		at the same time do not select the same free memory).
+
+		Args:
+		- memory: amount of memory of the VM.
+		- cpus: number of CPUs of the VM.
+		- hosts: list of HostInfo of the candidate hosts (by default the ones of the host pool snapshot).
+
+		Return: HostInfo of the host selected or None if no host has enough resources
+		"""
+		if hosts is None:
+			hosts = self.host_pool.values()
+		candidates = []
+		for host in hosts:
+			if host.active and (host.free_cpus or 0) > cpus:
+				free_memory = self.host_ledger.get_free_memory(host)
+				if free_memory is not None:
+					candidates.append((free_memory, host))
+		candidates.sort(key=lambda x: x[0], reverse=True)
+
+		for _, host in candidates:
+			if self.host_ledger.reserve(host, memory):
+				return host
+		return None
+
+	def get_host_vms(self, host_info, all_vms):
+		"""
+		Get the VMs allocated in a host
+
+		Args:
+		- host_info: HostInfo object of the host.
+		- all_vms: VMIndex object with all the VMs of the CMP (None if the VM list is streamed).
+
+		Return: list of VirtualMachineInfo
+		"""
+		if all_vms is None:
+			return []
+		return all_vms.get_host_vms(host_info.id)
+
+	def request_migration(self, vm, memory):
+		"""
+		Store the memory request of a VM that can not grow in its host,
+		to be served by plan_migrations at the end of the monitor loop
+		"""
+		with self._migration_requests_lock:
+			self.migration_requests.append(MigrationRequest(vm, vm.host, memory))
+
+	def plan_migrations(self, all_vms):
+		"""
+		Plan and perform the migrations needed to serve all the memory requests of the loop
+
+		Args:
+		- all_vms: VMIndex object with all the VMs of the CMP (None if the VM list is streamed).
+
+		Return: number of VMs migrated
+		"""
+		with self._migration_requests_lock:
+			requests = self.migration_requests
+			self.migration_requests = []
+		if not requests:
+			return 0
+
+		hosts = self.host_pool.values()
+		if not hosts:
+			hosts = self.cmp.get_host_list() or []
+		free_memory = dict((host.id, self.host_ledger.get_free_memory(host)) for host in hosts)
+		planner = MigrationPlanner(hosts, Config.HOST_MEM_MARGIN, free_memory)
+		migrations = planner.plan(requests, lambda host_info: self.get_host_vms(host_info, all_vms))
+		logger.debug("%d migrations planned for %d memory requests." % (len(migrations), len(requests)))
+
+		if planner.unplaced:
+			logger.warn("There are no host with enough resources to host the VMs: %s" % [vm.id for vm in planner.unplaced])
+			vm = planner.unplaced[0]
+			# Let's try to power on a host for the biggest one
+			self.request_power_on(MigrationPlanner.get_vm_memory(vm), vm.cpus or 0)
+
+		now = self.now()
+		migrated = 0
+		for vm, source, target in migrations:
+			if not Config.ONLY_TEST:
+				logger.debug("Migrate the VM %d from host %d to host %d" % (vm.id, source.id, target.id))
+				if self.migrate(vm.id, target.id):
+					logger.debug("A VM has been migrated from host %d. Store the timestamp." % source.id)
+					self.last_migration[source.id] = now
+					self.move_host_memory(vm, source, target)
+					migrated += 1
+			else:
+				logger.debug("No migrate the VM %d from host %d to host %d. This is just a test." % (vm.id, source.id, target.id))
+		return migrated
+
+	def migrate(self, vm_id, host_id):
+		"""
+		Migrate the VM "vm_id" to the Host "host_id" using the CMP
+		"""
+		with self.metrics.phase("migration"), tracer.span("migrate", vm_id = vm_id, host = host_id):
+			success = self.cmp.migrate(vm_id, host_id)
+		self.metrics.migrations.inc(self.metrics.get_result(success))
+		return success
+
+	def request_power_on(self, free_memory, cpus):
+		"""
+		Try to power on a node connecting with CLUES (see power_on_host)
+		"""
+		with self.metrics.phase("power_on"), tracer.span("clues.power_on", memory = free_memory, cpus = cpus):
+			success = self.power_on_host(free_memory, cpus)
+		self.metrics.power_on_requests.inc(self.metrics.get_result(success))
+		return success
+
 	def migrate_vm(self, vm_id, host_info, all_vms):
 		"""
 		Migrate one of the VMs of the host to free memory
@@ -110,6 +392,10 @@ class Monitor:
 		logger.debug("Migrating.")
 		
 		vm_to_migrate = self.select_vm_to_migrate(vm_id, host_info, all_vms)
+		if not vm_to_migrate:
+			logger.warn("There are no other VMs to migrate in the host " + str(host_info.name))
+			return False
+
 		host_to_migrate = self.select_host_to_migrate(vm_to_migrate)
 		if not host_to_migrate:
 			logger.warn("There are no host with enough resources to host the VM " + str(vm_to_migrate.id))
@@ -117,155 +403,715 @@ class Monitor:
 	
 		if not Config.ONLY_TEST:
 			logger.debug("Migrate the VM %d to host %d" % (vm_to_migrate.id, host_to_migrate.id))
-			return self.cmp.migrate(vm_to_migrate.id, host_to_migrate.id)
+			if self.migrate(vm_to_migrate.id, host_to_migrate.id):
+				# The memory of the VM was debited from the target host when it was selected
+				self.move_host_memory(vm_to_migrate, host_info, None)
+				return True
 		else:
 			logger.debug("No migrate. This is just a test.")
-			return False
+		self.host_ledger.credit(host_to_migrate, MigrationPlanner.get_vm_memory(vm_to_migrate))
+		return False
 	
-	def monitor_vm(self, vm, all_vms):
+	def monitor_vm(self, vm, all_vms, decision = None, now = None):
 		"""
 		Main function of the monitor
+		The monitoring information of the VM is locked while it is evaluated, but the external
+		calls of the decision (migrations and memory changes) are made once it is released,
+		so a slow call does not block the rest of VMs of the shard lock.
+
+		Args:
+		- vm: VirtualMachineInfo object of the VM.
+		- all_vms: VMIndex object with all the VMs of the CMP (None if the VM list is streamed).
+		- decision: SizingDecision of the VM if it has been already computed by size_vms.
+		- now: time used to compute the decision.
 		""" 
-		try:
-			vm_pct_free_memory = float(vm.free_memory)/float(vm.total_memory) * 100.0
+		if Config.ADAPTIVE_SCHEDULER:
+			self.schedule_vm(vm)
+		with tracer.span("vm", vm_id = vm.id, host = vm.host.id):
+			# The host info may be requested to the CMP
+			vm.host = self.get_host_info(vm.host.id)
+			with self.vm_data.lock(vm.id):
+				actions = self._monitor_vm(vm, all_vms, decision, now)
+			for function, args in actions:
+				try:
+					function(*args)
+				except:
+					logger.exception("Error in monitor loop!")
+
+	def migrate_vm_from_host(self, vm, all_vms, now):
+		"""
+		Migrate a VM of the host of a VM that needs more memory, and store the timestamp of the migration
+		"""
+		if self.migrate_vm(vm.id, vm.host, all_vms):
+			logger.debug("A VM has been migrated from host %d. Store the timestamp." % vm.host.id)
+			self.last_migration[vm.host.id] = now
+
+	def size_vms(self, vms):
+		"""
+		Compute the new memory size of a list of VMs in one pass
+
+		Return: tuple (now, decisions) with the time used and the list of SizingDecision of the VMs
+		"""
+		with tracer.span("size_vms", vms = len(vms)):
+			now = self.now()
+			inputs = [BatchSizing.get_inputs(vm, self.vm_data.get_or_create(vm.id), self.get_forecast(vm)) for vm in vms]
+			return now, BatchSizing.size_vms(inputs, now)
+
+	def get_forecast(self, vm):
+		"""
+		Add the current sample of the VM to the predictor and get the peak of used memory
+		forecasted within PREDICTIVE_HORIZON secs, if the VM uses the predictive MEM_POLICY
+
+		Return: the used memory forecasted or None if the VM uses the reactive policy
+		(or there are not enough samples of the VM yet)
+		"""
+		mem_policy = Config.MEM_POLICY
+		if vm.mem_policy:
+			mem_policy = vm.mem_policy
+		if mem_policy != "predictive":
+			return None
+
+		timestamp = vm.timestamp
+		if not timestamp:
+			timestamp = self.now()
+		self.predictor.update(vm.id, vm.total_memory - vm.free_memory, timestamp)
+		forecast = self.predictor.forecast(vm.id)
+		if forecast is not None:
+			logger.debug("VMID " + str(vm.id) + ": Used memory forecasted in %d secs: %d" % (Config.PREDICTIVE_HORIZON, forecast))
+		return forecast
+
+	def evaluate_vms(self, pool, vms, all_vms):
+		"""
+		Evaluate a list of VMs using the ThreadPool.
+		If BATCH_SIZING is enabled, the new memory size of all the VMs is computed first in one pass
+		and only the actuation is made in the ThreadPool.
+		"""
+		if Config.BATCH_SIZING:
+			now, decisions = self.size_vms(vms)
+			pool.map(lambda i: self.monitor_vm(vms[i], all_vms, decisions[i], now), range(len(vms)))
+		else:
+			pool.map(lambda vm: self.monitor_vm(vm, all_vms), vms)
+
+	def get_priority(self, vm):
+		"""
+		Get the sort key of a VM to evaluate it within the CYCLE_BUDGET: the VMs with fresh metrics
+		before the stale ones and, within them, first the VMs in the no free memory backoff,
+		then the VMs deferred in the previous loop and then by free memory percentage
+		"""
+		vm_data = self.vm_data.get(vm.id)
+		starving = vm_data is not None and vm_data.no_free_memory_count > 0
+		free_pct = 100.0
+		if vm.total_memory:
+			free_pct = 100.0 * vm.free_memory / vm.total_memory
+		return (vm.id in self.stale_vm_ids, not starving, vm.id not in self.carried_over, free_pct)
+
+	@staticmethod
+	def get_sample_age(vm, now):
+		"""
+		Get the age (in secs) of the metrics published by the VM or None if the VM does not publish its TIMESTAMP
+		"""
+		if not vm.timestamp:
+			return None
+		return max(0, now - vm.timestamp)
+
+	def check_stale_vms(self, vms):
+		"""
+		Compute the age of the metrics of the VMs and update the set of VMs with stale metrics:
+		the ones that published their metrics more than STALE_METRICS_AGE secs ago.
+		The VMs that do not publish their TIMESTAMP are considered fresh.
+
+		Return: list of VirtualMachineInfo with the VMs to evaluate (all of them
+		or only the fresh ones if STALE_METRICS_POLICY is skip)
+		"""
+		now = self.now()
+		res = []
+		for vm in vms:
+			age = self.get_sample_age(vm, now)
+			if age is not None and age > Config.STALE_METRICS_AGE:
+				self.stale_vms += 1
+				if vm.id not in self.stale_vm_ids:
+					logger.warn("VMID %s: The metrics of the VM are %d secs old. Is the publisher of the VM running?" % (vm.id, age))
+					self.stale_vm_ids.add(vm.id)
+				if Config.STALE_METRICS_POLICY == "skip":
+					# Schedule the next check of the VM, otherwise it would be always due
+					if Config.ADAPTIVE_SCHEDULER:
+						self.schedule_vm(vm)
+					continue
+			else:
+				self.fresh_vms += 1
+				if vm.id in self.stale_vm_ids:
+					logger.info("VMID %s: The VM publishes fresh metrics again." % vm.id)
+					self.stale_vm_ids.discard(vm.id)
+			res.append(vm)
+		return res
+
+	def get_inputs_key(self, vm):
+		"""
+		Get the inputs of the decision of a VM that come from the CMP: the time of the metrics
+		published by the VM, the last poll of the CMP, the memory values and the free memory of the host
+		"""
+		host_id = host_free_memory = None
+		if vm.host is not None:
+			host_id = vm.host.id
+			host_info = self.host_pool.get(host_id)
+			if host_info is not None:
+				host_free_memory = host_info.free_memory
+		return (vm.timestamp, vm.last_poll, vm.real_memory, vm.total_memory, vm.free_memory, host_id, host_free_memory)
 
-			if vm.id not in self.vm_data:
-				self.vm_data[vm.id] = VMMonitorData(vm.id)
+	def skip_unchanged_vms(self, vms):
+		"""
+		Remove the VMs whose inputs have not changed since their last evaluation, if it made a
+		stable decision (the VM was in band or the change was too small, and it was not in the
+		no free memory backoff), as they would get the same decision again
+
+		Return: list of VirtualMachineInfo with the VMs to evaluate
+		"""
+		res = []
+		for vm in vms:
+			if self.vm_inputs.get(vm.id) == self.get_inputs_key(vm):
+				if Config.ADAPTIVE_SCHEDULER:
+					self.schedule_vm(vm)
+			else:
+				res.append(vm)
+		skipped = len(vms) - len(res)
+		if skipped:
+			logger.debug("%d VMs skipped as their inputs have not changed." % skipped)
+		self.skipped_vms += skipped
+		return res
+
+	def evaluate_due_vms(self, pool, vms, all_vms):
+		"""
+		Evaluate a list of VMs, skipping the ones that have not changed (if SKIP_UNCHANGED_VMS is enabled)
+		and the ones with stale metrics (if STALE_METRICS_AGE is set and STALE_METRICS_POLICY is skip).
+		If CYCLE_BUDGET is set, the VMs are evaluated in priority order
+		(see get_priority) in chunks of CYCLE_BUDGET_CHUNK VMs, and the VMs not evaluated
+		before the deadline of the loop are deferred to the next one.
+		At least one chunk is evaluated in each loop, even if getting the VMs has consumed all the budget.
+		"""
+		if Config.STALE_METRICS_AGE > 0:
+			vms = self.check_stale_vms(vms)
+		if Config.SKIP_UNCHANGED_VMS:
+			vms = self.skip_unchanged_vms(vms)
+		if self.cycle_deadline is None:
+			self.evaluated_vms += len(vms)
+			return self.evaluate_vms(pool, vms, all_vms)
+
+		vms = sorted(vms, key=self.get_priority)
+		chunk_size = max(1, Config.CYCLE_BUDGET_CHUNK)
+		for i in range(0, len(vms), chunk_size):
+			if self.evaluated_vms and time.time() >= self.cycle_deadline:
+				self.deferred_vms.update(vm.id for vm in vms[i:])
+				break
+			chunk = vms[i:i + chunk_size]
+			self.evaluate_vms(pool, chunk, all_vms)
+			self.evaluated_vms += len(chunk)
+
+	def _monitor_vm(self, vm, all_vms, decision = None, now = None):
+		"""
+		Evaluate a VM and update its monitoring information
+
+		Return: list of tuples (function, args) with the external calls to make
+		"""
+		actions = []
+		try:
+			stable = False
+			if Config.SKIP_UNCHANGED_VMS:
+				inputs_key = self.get_inputs_key(vm)
+			vm_data = self.vm_data.get_or_create(vm.id)
+			self.add_sample(vm)
+			if decision is None:
+				now = self.now()
+				decision = BatchSizing.size_vm(BatchSizing.get_inputs(vm, vm_data, self.get_forecast(vm)), now)
 			
-			if self.vm_data[vm.id].mem_diff is None:
-				self.vm_data[vm.id].mem_diff = vm.real_memory - vm.total_memory
+			if vm_data.mem_diff is None:
+				vm_data.mem_diff = decision.mem_diff
 
 			vmid_msg = "VMID " + str(vm.id) + ": "
-			vm.host = self.get_host_info(vm.host.id)
 
 			logger.info(vmid_msg + "Real Memory: " + str(vm.real_memory))
 			logger.info(vmid_msg + "Total Memory: " + str(vm.total_memory))
-			logger.info(vmid_msg + "Free Memory: %d (%.2f%%)" % (vm.free_memory, vm_pct_free_memory))
-
-			mem_over_ratio = Config.MEM_OVER
-			if vm.mem_over_ratio:
-				mem_over_ratio = vm.mem_over_ratio
+			logger.info(vmid_msg + "Free Memory: %d (%.2f%%)" % (vm.free_memory, decision.free_pct))
+			tracer.tag("free_pct", "%.2f" % decision.free_pct)
+			tracer.tag("branch", "in_band")
+			stable = not decision.out_of_band
 
-			if vm_pct_free_memory < (mem_over_ratio - Config.MEM_MARGIN) or vm_pct_free_memory > (mem_over_ratio + Config.MEM_MARGIN):
-				now = time.time()
-		
-				logger.debug(vmid_msg + "VM %s has %.2f%% of free memory, change the memory size" % (vm.id, vm_pct_free_memory))
-				if self.vm_data[vm.id].last_set_mem is not None:
-					logger.debug(vmid_msg + "Last memory change was %s secs ago." % (now - self.vm_data[vm.id].last_set_mem))
+			if decision.out_of_band:
+				logger.debug(vmid_msg + "VM %s has %.2f%% of free memory, change the memory size" % (vm.id, decision.free_pct))
+				if not decision.init_state:
+					logger.debug(vmid_msg + "Last memory change was %s secs ago." % (now - vm_data.last_set_mem))
 				else:
-					self.vm_data[vm.id].original_mem = vm.allocated_memory
-					logger.debug(vmid_msg + "The memory of this VM has been never modified. Store the initial memory  : " + str(self.vm_data[vm.id].original_mem))
-					self.vm_data[vm.id].last_set_mem = now
+					vm_data.original_mem = vm.allocated_memory
+					logger.debug(vmid_msg + "The memory of this VM has been never modified. Store the initial memory  : " + str(vm_data.original_mem))
+					vm_data.last_set_mem = now
 
-				if (now - self.vm_data[vm.id].last_set_mem) < Config.COOLDOWN:
+				if decision.in_cooldown:
 					logger.debug(vmid_msg + "It is in cooldown period. No changing the memory.")
+					tracer.tag("branch", "cooldown")
 				else:
-					used_mem = vm.total_memory - vm.free_memory
-					min_free_memory = Config.MIN_FREE_MEMORY
-					# check if the VM has defined a specific MIN_FREE_MEMORY value
-					if vm.min_free_mem:
-						min_free_memory = vm.min_free_mem
-					# it not free memory use exponential backoff idea
-					if vm.free_memory <= min_free_memory:
+					if decision.no_free_memory:
 						logger.debug(vmid_msg + "No free memory in the VM!")
-						if self.vm_data[vm.id].no_free_memory_count > 1:
-							# if this is the third time with no free memory use the original size
+						if decision.no_free_memory_count == 0:
 							logger.debug(vmid_msg + "Increase the mem to the original size.")
-							new_mem =  self.vm_data[vm.id].original_mem
-							self.vm_data[vm.id].no_free_memory_count = 0
 						else:
 							logger.debug(vmid_msg + "Increase the mem with 50% of the original.")
-							new_mem =  int(used_mem + (self.vm_data[vm.id].original_mem - used_mem) * 0.5)
-							self.vm_data[vm.id].no_free_memory_count += 1
+						vm_data.no_free_memory_count = decision.no_free_memory_count
 					else:
-						divider = 1.0 - (mem_over_ratio/100.0)
+						used_mem = vm.total_memory - vm.free_memory
+						divider = 1.0 - ((vm.mem_over_ratio or Config.MEM_OVER)/100.0)
 						logger.debug(vmid_msg + "The used memory %d is divided by %.2f" % (int(used_mem), divider))
-						new_mem =  int(used_mem / divider)
-
-					# Check for minimum memory
-					if new_mem < Config.MEM_MIN:
-						new_mem = Config.MEM_MIN
-
-					# add diff to new_mem value and to total_memory to make it real_memory (vm.real_memory has delays between updates)
-					new_mem += self.vm_data[vm.id].mem_diff
-					vm.total_memory += self.vm_data[vm.id].mem_diff
-					
-					# We never set more memory that the initial amount
-					if new_mem > self.vm_data[vm.id].original_mem:
-						new_mem = self.vm_data[vm.id].original_mem
-	
-					if abs(int(vm.total_memory)-new_mem) < Config.MEM_DIFF_TO_CHANGE:
+
+					new_mem = decision.new_mem
+					# the total_memory plus the mem_diff to make it real_memory (vm.real_memory has delays between updates)
+					vm.total_memory = decision.total_memory
+
+					tracer.tag("old_mem", vm.total_memory)
+					tracer.tag("new_mem", new_mem)
+					if not decision.change:
 						logger.debug(vmid_msg + "Not changing the memory. Too small difference.")
+						tracer.tag("branch", "small_change")
+						stable = not decision.no_free_memory
 					else:
 						logger.debug(vmid_msg + "Changing the memory from %d to %d" % (vm.total_memory, new_mem))
 						if new_mem > vm.total_memory:
 							# If we increase the memory we must check if the host has enough free space
-							if not self.host_has_memory_free(vm.host,new_mem-vm.total_memory):
+							if not self.reserve_host_memory(vm.host, new_mem - vm.total_memory):
 								# The host has not enough free memory. Let's try to migrate a VM.
 								logger.debug(vmid_msg + "The host " + vm.host.name + " has not enough free memory!")
 								if Config.MIGRATION:
 									logger.debug(vmid_msg + "Let's try to migrate a VM.")
 									if vm.host.id in self.last_migration and (now - self.last_migration[vm.host.id]) < Config.MIGRATION_COOLDOWN:
 										logger.debug("The host %s is in migration cooldown period, let's wait.." % vm.host.name)
+										tracer.tag("branch", "migration_cooldown")
+									elif Config.MIGRATION_PLANNER:
+										logger.debug(vmid_msg + "Store the request to plan the migrations at the end of the loop.")
+										tracer.tag("branch", "migration_planned")
+										self.request_migration(vm, new_mem - vm.total_memory)
 									else:
-										if self.migrate_vm(vm.id, vm.host, all_vms):
-											logger.debug("A VM has been migrated from host %d. Store the timestamp." % vm.host.id)
-											self.last_migration[vm.host.id] = now
+										tracer.tag("branch", "migration")
+										actions.append((self.migrate_vm_from_host, (vm, all_vms, now)))
 								else:
 									logger.debug(vmid_msg + "Migration is disabled.")
 									if Config.FORCE_INCREASE_MEMORY:
 										logger.debug(vmid_msg + "But Force increase memory is activated. Changing memory.")
-										self.change_memory(vm.id, vm.host, new_mem)
-										self.vm_data[vm.id].last_set_mem = now
+										tracer.tag("branch", "forced_increase")
+										self.host_ledger.debit(vm.host, new_mem - vm.total_memory)
+										actions.append((self.request_memory_change, (vm.id, vm.host, new_mem, new_mem - vm.total_memory)))
+										vm_data.last_set_mem = now
 									else:
 										logger.debug(vmid_msg + "Not increase memory.")
+										tracer.tag("branch", "no_host_memory")
 							else:
 								logger.debug(vmid_msg + "The host " + vm.host.name + " has enough free memory.")
-								self.change_memory(vm.id, vm.host, new_mem)
-								self.vm_data[vm.id].last_set_mem = now
+								tracer.tag("branch", "increase")
+								actions.append((self.request_memory_change, (vm.id, vm.host, new_mem, new_mem - vm.total_memory)))
+								vm_data.last_set_mem = now
+						elif vm.id in self.stale_vm_ids:
+							# The VM may be using more memory than the published one
+							logger.debug(vmid_msg + "The metrics of the VM are stale. Not decrease memory.")
+							tracer.tag("branch", "stale")
 						else:
-							self.change_memory(vm.id, vm.host, new_mem)
-							self.vm_data[vm.id].last_set_mem = now
+							# The memory released is available for the rest of VMs of the host
+							tracer.tag("branch", "decrease")
+							self.host_ledger.credit(vm.host, vm.total_memory - new_mem)
+							actions.append((self.request_memory_change, (vm.id, vm.host, new_mem, new_mem - vm.total_memory)))
+							vm_data.last_set_mem = now
+
+			if Config.SKIP_UNCHANGED_VMS:
+				if stable and vm_data.no_free_memory_count == 0:
+					self.vm_inputs[vm.id] = inputs_key
+				else:
+					self.vm_inputs.pop(vm.id, None)
 		except:
 			logger.exception("Error in monitor loop!")
+		return actions
+
+	def add_sample(self, vm):
+		"""
+		Store the memory sample of a VM evaluated in the time series store (if TIMESERIES is enabled)
+		"""
+		if self.timeseries is not None:
+			self.timeseries.add_sample(vm.id, vm.timestamp or self.now(), vm.real_memory, vm.total_memory, vm.free_memory)
+
+	def schedule_vm(self, vm):
+		"""
+		Compute the time of the next evaluation of the VM
+		"""
+		try:
+			vm_pct_free_memory = float(vm.free_memory)/float(vm.total_memory) * 100.0
+			mem_over_ratio = Config.MEM_OVER
+			if vm.mem_over_ratio:
+				mem_over_ratio = vm.mem_over_ratio
+			interval = self.scheduler.schedule(vm.id, vm_pct_free_memory, mem_over_ratio, Config.MEM_MARGIN, self.now())
+			logger.debug("VMID " + str(vm.id) + ": Next evaluation in %.1f secs." % interval)
+		except:
+			logger.exception("Error scheduling the VM: " + str(vm.id))
+
+	def get_due_vms(self, vm_list):
+		"""
+		Get the VMs that have to be evaluated in this loop (all of them if ADAPTIVE_SCHEDULER is disabled)
+		"""
+		if not Config.ADAPTIVE_SCHEDULER:
+			return vm_list
+		now = self.now()
+		return [vm for vm in vm_list if self.scheduler.is_due(vm.id, now)]
+
+	def get_delay(self):
+		"""
+		Get the time to sleep until the next monitor loop:
+		DELAY or, if ADAPTIVE_SCHEDULER is enabled, until the next VM has to be evaluated (up to DELAY).
+		"""
+		if not Config.ADAPTIVE_SCHEDULER:
+			return Config.DELAY
+		next_check = self.scheduler.get_next_check()
+		if next_check is None:
+			return Config.DELAY
+		return max(0, min(Config.DELAY, next_check - self.now()))
 
 	@staticmethod
-	def get_monitored_vms(vm_list, user = None):
+	def iter_monitored_vms(vm_list, user = None):
 		"""
-		Get the list of VMs that has the monitored metrics available and filtered by user
+		Iterate over the VMs that has the monitored metrics available and filtered by user
 		"""
-		res = []
 		try:
 			for vm in vm_list:
 				if vm.free_memory:
 					# Check the user filter
 					if not user or vm.user_id == user:  
-						res.append(vm)
+						yield vm
 		except:
 			logger.exception("Error monitoring VMs!")
 
-		return res
+	@staticmethod
+	def get_monitored_vms(vm_list, user = None):
+		"""
+		Get the list of VMs that has the monitored metrics available and filtered by user
+		"""
+		return list(Monitor.iter_monitored_vms(vm_list, user))
 
-	def start(self):
+	def monitor_vms(self, pool):
 		"""
-		Launch the monitor loop
+		Get the VM list from the CMP and monitor all the VMs
+
+		Args:
+		- pool: ThreadPool used to monitor the VMs.
+
+		Return: list with the IDs of the monitored VMs
+		"""
+		with self.metrics.phase("vm_list"):
+			all_vms = VMIndex(self.cmp.get_vm_list())
+		if self.recorder:
+			self.recorder.start_cycle(self.now())
+			self.recorder.add_vms(all_vms)
+		monitored_vms = self.get_monitored_vms(all_vms, Config.USER_FILTER)
+		due_vms = self.get_due_vms(monitored_vms)
+		
+		if due_vms:
+			with self.metrics.phase("host_pool"):
+				self.update_host_pool()
+			with self.metrics.phase("evaluate"):
+				self.evaluate_due_vms(pool, due_vms, all_vms)
+		elif monitored_vms:
+			logger.debug("There is no VM to evaluate in this loop.")
+		else:
+			logger.debug("There is no VM with monitoring information.")
+
+		if Config.MIGRATION_PLANNER:
+			with self.metrics.phase("plan_migrations"):
+				self.plan_migrations(all_vms)
+
+		if self.recorder:
+			self.recorder.end_cycle(self.host_pool.values())
+
+		return [vm.id for vm in monitored_vms]
+
+	def monitor_vms_stream(self, pool):
+		"""
+		Get the VM list from the CMP incrementally and monitor the VMs in chunks
+		of STREAM_CHUNK_SIZE VMs, so only a chunk of VMs is kept in memory.
+		As the complete VM list is not available, it is not passed to monitor_vm.
+
+		Args:
+		- pool: ThreadPool used to monitor the VMs.
+
+		Return: list with the IDs of the monitored VMs
+		"""
+		monitored_vmids = []
+		host_pool_updated = False
+		monitored_vms = self.iter_monitored_vms(self.cmp.iter_vm_list(), Config.USER_FILTER)
+		if self.recorder:
+			self.recorder.start_cycle(self.now())
+
+		while True:
+			chunk = list(itertools.islice(monitored_vms, Config.STREAM_CHUNK_SIZE))
+			if not chunk:
+				break
+			if self.recorder:
+				self.recorder.add_vms(chunk)
+			monitored_vmids.extend(vm.id for vm in chunk)
+			chunk = self.get_due_vms(chunk)
+			if chunk and not host_pool_updated:
+				with self.metrics.phase("host_pool"):
+					self.update_host_pool()
+				host_pool_updated = True
+			with self.metrics.phase("evaluate"):
+				self.evaluate_due_vms(pool, chunk, None)
+
+		if not monitored_vmids:
+			logger.debug("There is no VM with monitoring information.")
+
+		if Config.MIGRATION_PLANNER:
+			with self.metrics.phase("plan_migrations"):
+				self.plan_migrations(None)
+
+		if self.recorder:
+			self.recorder.end_cycle(self.host_pool.values())
+
+		return monitored_vmids
+
+	def get_vm_state(self, vm_id):
+		"""
+		Get the monitoring information of a VM (see VMMonitorData.get_state) or None if there is no information
+		"""
+		vm_data = self.vm_data.get(vm_id)
+		if vm_data is None:
+			return None
+		return vm_data.get_state()
+
+	def monitor_vms_sharded(self, pool):
+		"""
+		Get the VM list from the CMP and evaluate the VMs in the worker processes of the ShardPool.
+		The workers only return their decisions: the memory changes are applied here using the ThreadPool,
+		the migrations are made here with all the VMs (planned if MIGRATION_PLANNER is enabled or one per
+		memory request, as in monitor_vm, otherwise), and the monitoring information is stored here.
+
+		Args:
+		- pool: ThreadPool used to change the memory of the VMs.
+
+		Return: list with the IDs of the monitored VMs
+		"""
+		with self.metrics.phase("vm_list"):
+			all_vms = VMIndex(self.cmp.get_vm_list())
+		if self.recorder:
+			self.recorder.start_cycle(self.now())
+			self.recorder.add_vms(all_vms)
+		monitored_vms = self.get_monitored_vms(all_vms, Config.USER_FILTER)
+
+		if monitored_vms:
+			with self.metrics.phase("host_pool"):
+				self.update_host_pool()
+			with self.metrics.phase("evaluate"):
+				changes, requests, states, deferred, counters, samples = self.shard_pool.evaluate(monitored_vms,
+						self.host_pool.values(), dict(self.last_migration), self.get_vm_state, self.cycle_deadline)
+			self.deferred_vms.update(deferred)
+			for name, value in counters.items():
+				setattr(self, name, getattr(self, name) + value)
+			for vm_id, state in states.items():
+				self.vm_data[vm_id] = VMMonitorData.from_state(vm_id, state)
+			if self.timeseries is not None:
+				# Before the memory changes, as they are set in the last sample of each VM
+				for sample in samples:
+					self.timeseries.add_sample(*sample)
+
+			for vm_id, host_id, new_mem, reserved in changes:
+				host_info = self.get_host_info(host_id)
+				if reserved > 0:
+					self.host_ledger.debit(host_info, reserved)
+				elif reserved < 0:
+					self.host_ledger.credit(host_info, -reserved)
+			pool.map(lambda change: self.request_memory_change(change[0], self.get_host_info(change[1]), change[2], change[3]), changes)
+
+			now = self.now()
+			for vm_id, memory in requests:
+				vm = all_vms.get(vm_id)
+				if vm is not None and vm.host is not None:
+					vm.host = self.get_host_info(vm.host.id)
+					if Config.MIGRATION_PLANNER:
+						self.request_migration(vm, memory)
+					elif vm.host.id in self.last_migration and (now - self.last_migration[vm.host.id]) < Config.MIGRATION_COOLDOWN:
+						# Other VM of the host has been migrated in this loop
+						logger.debug("The host %s is in migration cooldown period, let's wait.." % vm.host.name)
+					else:
+						self.migrate_vm_from_host(vm, all_vms, now)
+		else:
+			logger.debug("There is no VM with monitoring information.")
+
+		if Config.MIGRATION_PLANNER:
+			with self.metrics.phase("plan_migrations"):
+				self.plan_migrations(all_vms)
+
+		if self.recorder:
+			self.recorder.end_cycle(self.host_pool.values())
+
+		return [vm.id for vm in monitored_vms]
+
+	def monitor_event_vms(self, pool, vm_ids, host_ids):
+		"""
+		Monitor the VMs affected by a set of events: the VMs changed and the VMs of the hosts changed.
+		The information of each VM is requested to the CMP.
+
+		Args:
+		- pool: ThreadPool used to monitor the VMs.
+		- vm_ids: set with the IDs of the VMs changed.
+		- host_ids: set with the IDs of the hosts changed.
+
+		Return: list with the IDs of the monitored VMs
+		"""
+		vms = {}
+		if host_ids:
+			# Get a new snapshot of the hosts
+			self.host_pool_expires = 0
+			with self.metrics.phase("host_pool"):
+				self.update_host_pool()
+			for host_id in host_ids:
+				host_info = self.get_host_info(host_id)
+				if host_info:
+					for vm in self.get_host_vms(host_info, None):
+						vms[vm.id] = vm
+
+		for vm_id in vm_ids:
+			if vm_id not in vms:
+				vm = self.cmp.get_vm_info(vm_id)
+				if vm:
+					vms[vm.id] = vm
+
+		monitored_vms = self.get_monitored_vms([vm for vm in vms.values() if vm.active], Config.USER_FILTER)
+		logger.debug("%d VMs affected by the events of %d VMs and %d hosts." % (len(monitored_vms), len(vm_ids), len(host_ids)))
+		if monitored_vms:
+			if not host_ids:
+				with self.metrics.phase("host_pool"):
+					self.update_host_pool()
+			with self.metrics.phase("evaluate"):
+				self.evaluate_due_vms(pool, monitored_vms, None)
+
+		if Config.MIGRATION_PLANNER:
+			with self.metrics.phase("plan_migrations"):
+				self.plan_migrations(None)
+
+		return [vm.id for vm in monitored_vms]
+
+	def start_event_loop(self):
+		"""
+		Launch the monitor loop in event mode: only the VMs affected by the events received
+		in the EventFeed are monitored, and all the VMs are monitored every EVENT_RESYNC_INTERVAL secs
+		(or when a resync event is received) in case some event has been lost.
 		"""
 		pool = ThreadPool(processes=Config.MAX_THREADS)
-	
+		feed = EventFeed(Config.EVENT_FEED_ADDRESS, Config.EVENT_FEED_PORT)
+		feed.start()
+		next_resync = 0
+
 		while True:
-			all_vms = self.cmp.get_vm_list()
-			monitored_vms = self.get_monitored_vms(all_vms, Config.USER_FILTER)
-			
-			if monitored_vms:
-				pool.map(lambda vm: self.monitor_vm(vm, all_vms), monitored_vms)
+			vm_ids, host_ids, resync = feed.get_events(max(0, next_resync - time.time()))
+			if resync or time.time() >= next_resync:
+				logger.debug("Full resync of the VM pool.")
+				self.run_cycle(pool)
+				next_resync = time.time() + Config.EVENT_RESYNC_INTERVAL
 			else:
-				logger.debug("There is no VM with monitoring information.")
-	
+				self.run_cycle(pool, lambda: self.monitor_event_vms(pool, vm_ids, host_ids))
+
+	def run_cycle(self, pool, monitor_function = None):
+		"""
+		Make one monitor loop: monitor the VMs, apply the memory changes and store the data
+
+		Args:
+		- pool: ThreadPool used to monitor the VMs.
+		- monitor_function: function to monitor the VMs (by default all the VMs are monitored
+		  and the data of the VMs not monitored is deleted).
+
+		Return: list with the IDs of the monitored VMs
+		"""
+		start = time.time()
+		self.cycle_deadline = None
+		if Config.CYCLE_BUDGET > 0:
+			self.cycle_deadline = start + Config.CYCLE_BUDGET
+		self.carried_over, self.deferred_vms = self.deferred_vms, set()
+		self.evaluated_vms = 0
+		self.skipped_vms = 0
+		self.stale_vms = 0
+		self.fresh_vms = 0
+
+		with tracer.start_trace("cycle", event = monitor_function is not None) as span:
+			with self.metrics.phase("monitor"):
+				if monitor_function:
+					monitored_vmids = monitor_function()
+				elif self.shard_pool:
+					monitored_vmids = self.monitor_vms_sharded(pool)
+				elif Config.STREAM_VM_LIST:
+					monitored_vmids = self.monitor_vms_stream(pool)
+				else:
+					monitored_vmids = self.monitor_vms(pool)
+			span.set_tag("monitored_vms", len(monitored_vmids))
+			if self.deferred_vms:
+				logger.warn("The CYCLE_BUDGET of %s secs has been exceeded. %d VMs deferred to the next loop." % (Config.CYCLE_BUDGET, len(self.deferred_vms)))
+				span.set_tag("deferred_vms", len(self.deferred_vms))
+				self.metrics.cycle_budget_exceeded.inc()
+			self.metrics.deferred_vms.set(len(self.deferred_vms))
+			self.metrics.vm_evaluations.add(self.evaluated_vms, "evaluated")
+			self.metrics.vm_evaluations.add(self.skipped_vms, "skipped")
+			if self.evaluated_vms + self.skipped_vms:
+				self.metrics.skipped_vms_ratio.set(float(self.skipped_vms) / (self.evaluated_vms + self.skipped_vms))
+			if Config.STALE_METRICS_AGE > 0 and not monitor_function:
+				self.metrics.stale_vms.set(self.stale_vms)
+				self.metrics.fresh_vms.set(self.fresh_vms)
+				span.set_tag("stale_vms", self.stale_vms)
+
+			if Config.BATCH_ACTUATION or Config.ASYNC_ACTUATION:
+				with self.metrics.phase("apply_memory_changes"):
+					self.apply_memory_changes(pool)
+
 			logger.debug("-----------------------------------")
 
-			self.clean_old_data(monitored_vms)
-			self.save_data()
-			time.sleep(Config.DELAY)
+			if not monitor_function:
+				with self.metrics.phase("clean_old_data"):
+					self.clean_old_data(monitored_vmids)
+				self.metrics.monitored_vms.set(len(monitored_vmids))
+			with self.metrics.phase("save_data"):
+				self.save_data()
+
+		duration = time.time() - start
+		self.metrics.cycle_seconds.observe(duration)
+		self.metrics.cycle_overrun.set(max(0, duration - Config.DELAY))
+		return monitored_vmids
+
+	def start_metrics_server(self):
+		"""
+		Serve the metrics (and the memory samples of the VMs if TIMESERIES is enabled)
+		in METRICS_ADDRESS:METRICS_PORT (if METRICS_PORT is set)
+		"""
+		if Config.METRICS_PORT:
+			try:
+				MetricsServer(self.metrics.registry, Config.METRICS_ADDRESS, Config.METRICS_PORT, self.timeseries).start()
+			except Exception:
+				logger.exception("Error starting the metrics server.")
+
+	def start_shard_pool(self):
+		"""
+		Start the worker processes to evaluate the VMs (if PROCESS_SHARDS is set).
+		It must be called before starting any thread, as the workers are forked.
+		"""
+		if Config.PROCESS_SHARDS > 0:
+			if Config.EVENT_FEED or Config.STREAM_VM_LIST:
+				logger.warn("PROCESS_SHARDS is not used with EVENT_FEED or STREAM_VM_LIST. Evaluating the VMs in the monitor process.")
+			else:
+				# Imported here as Sharding depends on this module
+				from Sharding import ShardPool
+				self.shard_pool = ShardPool(Config.PROCESS_SHARDS)
+				self.shard_pool.start()
+
+	def start(self):
+		"""
+		Launch the monitor loop
+		"""
+		self.start_shard_pool()
+		self.start_metrics_server()
+		if Config.EVENT_FEED:
+			return self.start_event_loop()
+
+		pool = ThreadPool(processes=Config.MAX_THREADS)
+	
+		while True:
+			self.run_cycle(pool)
+			time.sleep(self.get_delay())
 
 	@staticmethod
 	def power_on_host(free_memory, cpus, delay = 5, timeout = None):
@@ -335,9 +1181,10 @@ class Monitor:
 		Args:
 		- req_vm_id: ID of the growing memory VM that causes the migration.
 		- host_info: HostInfo object of the host where the VM has to go out.
-		- all_vms: List of VirtualMachineInfo objects with all the VMs of the CMP.
+		- all_vms: VMIndex object with all the VMs of the CMP
+		  (None if the VM list is streamed).
 
-		Return: VirtualMachineInfo object with the VM to migrate 
+		Return: VirtualMachineInfo object with the VM to migrate or None if there are no VMs to migrate
 		"""
 		raise Exception("Not implemented")
 	
@@ -345,6 +1192,8 @@ class Monitor:
 	def select_host_to_migrate(vm_info):
 		"""
 		Get the ID of the HOST to migrate.
+		The memory of the VM must be debited from the host ledger of the host selected
+		(see reserve_host_to_migrate).
 		
 		Args:
 		- vm_info: VirtualMachineInfo object with the VM to migrate
@@ -353,28 +1202,139 @@ class Monitor:
 		"""
 		raise Exception("Not implemented")
 	
-	@staticmethod
-	def change_memory(vm_id, vm_host, new_mem):
+	def request_memory_change(self, vm_id, vm_host, new_mem, reserved = 0):
+		"""
+		Change the memory of the VM. If BATCH_ACTUATION or ASYNC_ACTUATION is enabled the change is stored
+		to be applied at the end of the monitor loop, together with the rest of changes of the host.
+		If the change fails the memory debited from the host ledger is credited back.
+		
+		Args:
+		- vm_id: ID of the VM to change the memory.
+		- vm_host: Host where the VM is allocated.
+		- new_mem: Amount of memory to set to the VM.
+		- reserved: Amount of memory debited from the host ledger by the change (negative if credited).
+		"""
+		if self.timeseries is not None:
+			self.timeseries.set_new_mem(vm_id, new_mem)
+		if Config.BATCH_ACTUATION or Config.ASYNC_ACTUATION:
+			with self._memory_changes_lock:
+				if vm_host.id not in self.memory_changes:
+					self.memory_changes[vm_host.id] = []
+					self.memory_changes_hosts[vm_host.id] = vm_host
+				self.memory_changes[vm_host.id].append((vm_id, new_mem))
+				if reserved:
+					self.memory_reservations[vm_id] = (vm_host, reserved)
+		else:
+			if not self.change_memory(vm_id, vm_host, new_mem) and reserved:
+				self.host_ledger.credit(vm_host, reserved)
+
+	def apply_memory_changes(self, pool):
+		"""
+		Apply the memory changes pending in each host, sending all the changes of a host together.
+		The hosts are processed in parallel using the ThreadPool.
+		
+		Args:
+		- pool: ThreadPool used to process the hosts.
+
+		Return: dict with the result (True or False) of the change of each VM ID
+		"""
+		with self._memory_changes_lock:
+			changes = [(self.memory_changes_hosts[host_id], host_changes) for host_id, host_changes in self.memory_changes.items()]
+			reservations = self.memory_reservations
+			self.memory_changes = {}
+			self.memory_changes_hosts = {}
+			self.memory_reservations = {}
+
+		res = {}
+		if Config.ASYNC_ACTUATION:
+			host_results = self.change_memory_hosts(changes, pool)
+		else:
+			host_results = pool.map(lambda host_changes: self.change_memory_batch(*host_changes), changes)
+		for host_res in host_results:
+			res.update(host_res)
+
+		failed = [vm_id for vm_id, success in res.items() if not success]
+		if failed:
+			logger.warn("Error changing the memory of the VMs: %s" % failed)
+			for vm_id in failed:
+				if vm_id in reservations:
+					self.host_ledger.credit(*reservations[vm_id])
+		return res
+
+	def change_memory_hosts(self, changes, pool):
+		"""
+		Function to change the memory of the VMs of a set of hosts concurrently (if ASYNC_ACTUATION is enabled)
+
+		Args:
+		- changes: list of tuples (vm_host, host_changes) with the HostInfo and the list of
+		  tuples (vm_id, new_mem) of each host.
+		- pool: ThreadPool used if the Actuator can not run the changes concurrently.
+
+		Return: list with the dict with the result (True or False) of the change of each VM ID of each host
+		"""
+		logger.debug("Change the memory of %d VMs of %d hosts." % (sum(len(host_changes) for _, host_changes in changes), len(changes)))
+		if not Config.ONLY_TEST:
+			try:
+				with self.metrics.phase("change_memory"):
+					res = self.actuator.change_memory_hosts(changes, pool)
+			except:
+				logger.exception("Error changing memory of the VMs.")
+				res = [dict((vm_id, False) for vm_id, _ in host_changes) for _, host_changes in changes]
+			for host_res in res:
+				for success in host_res.values():
+					self.metrics.memory_changes.inc(self.metrics.get_result(success))
+			return res
+		else:
+			logger.debug("Not executed. This is just a test.")
+			return [dict((vm_id, False) for vm_id, _ in host_changes) for _, host_changes in changes]
+
+	def change_memory_batch(self, vm_host, changes):
+		"""
+		Function to change the memory of a set of VMs of the same host
+		
+		Args:
+		- vm_host: Host where the VMs are allocated.
+		- changes: list of tuples (vm_id, new_mem) with the memory to set to each VM.
+
+		Return: dict with the result (True or False) of the change of each VM ID 
+		"""
+		logger.debug("Change the memory of %d VMs of host %s: %s" % (len(changes), vm_host.name, changes))
+		if not Config.ONLY_TEST:
+			try:
+				with self.metrics.phase("change_memory"):
+					res = self.actuator.change_memory_batch(vm_host, changes)
+			except:
+				logger.exception("Error changing memory of the VMs of host: " + vm_host.name)
+				res = dict((vm_id, False) for vm_id, _ in changes)
+			for success in res.values():
+				self.metrics.memory_changes.inc(self.metrics.get_result(success))
+			return res
+		else:
+			logger.debug("Not executed. This is just a test.")
+			return dict((vm_id, False) for vm_id, _ in changes)
+
+	def change_memory(self, vm_id, vm_host, new_mem):
 		"""
 		Function to change the memory of the VM
+		It uses the Actuator selected in the CHANGE_MEMORY_BACKEND config value.
 		
 		Args:
 		- vm_id: ID of the VM to change the memory.
 		- vm_host: Host where the VM is allocated.
 		- new_mem: Amount of memory to set to the VM.
 
-		Return: ID of the Host to migrate 
+		Return: True if the memory has been changed successfully or False otherwise 
 		"""
-		chmem_cmd = Config.CHANGE_MEMORY_CMD.format(hostname = vm_host.name, vmid = str(vm_id), newmemory = str(new_mem))
-	
 		logger.debug("Change the memory of VM: " + str(vm_id) + " to " + str(new_mem))
-		logger.debug("Executing: " + chmem_cmd)
 		if not Config.ONLY_TEST:
-			success, out = runcommand(chmem_cmd, shell=True)
-
-			if success:
-				logger.debug("chmem command output: " + out)
-			else:
-				logger.error("Error changing memory: " + out)
+			try:
+				with self.metrics.phase("change_memory"):
+					success = self.actuator.change_memory(vm_id, vm_host, new_mem)
+			except:
+				logger.exception("Error changing memory of VM: " + str(vm_id))
+				success = False
+			self.metrics.memory_changes.inc(self.metrics.get_result(success))
+			return success
 		else:
 			logger.debug("Not executed. This is just a test.")
+			return False
@@ -0,0 +1,83 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import threading
+
+class HoltPredictor:
+	"""
+	Forecast of the used memory of each VM using the Holt's linear trend method
+	(double exponential smoothing) over the samples of the VM.
+	Only the level and the trend of each VM are stored, so the history is bounded.
+	"""
+
+	def __init__(self, alpha = 0.5, beta = 0.3, horizon = 60):
+		self.alpha = alpha
+		""" Smoothing factor of the level """
+		self.beta = beta
+		""" Smoothing factor of the trend """
+		self.horizon = horizon
+		""" Time (in secs) ahead to forecast the used memory """
+		self.state = {}
+		""" Dict with the tuple (level, trend per sec, timestamp, num_samples) of each VM ID """
+		self._lock = threading.Lock()
+
+	def update(self, vm_id, used_mem, timestamp):
+		"""
+		Add a sample of the used memory of the VM.
+		The sample is ignored if it has the same timestamp than the previous one.
+
+		Args:
+		- vm_id: ID of the VM.
+		- used_mem: used memory of the VM.
+		- timestamp: time of the sample.
+		"""
+		with self._lock:
+			if vm_id not in self.state:
+				self.state[vm_id] = (float(used_mem), 0.0, timestamp, 1)
+				return
+
+			level, trend, last_timestamp, samples = self.state[vm_id]
+			elapsed = timestamp - last_timestamp
+			if elapsed <= 0:
+				return
+			new_level = self.alpha * used_mem + (1 - self.alpha) * (level + trend * elapsed)
+			new_trend = self.beta * (new_level - level) / elapsed + (1 - self.beta) * trend
+			self.state[vm_id] = (new_level, new_trend, timestamp, samples + 1)
+
+	def forecast(self, vm_id):
+		"""
+		Get the peak of the used memory of the VM expected within the horizon
+
+		Return: the used memory forecasted or None if there are not enough samples of the VM
+		"""
+		with self._lock:
+			if vm_id not in self.state:
+				return None
+			level, trend, _, samples = self.state[vm_id]
+			if samples < 2:
+				return None
+			return int(level + max(0.0, trend) * self.horizon)
+
+	def retain(self, vm_ids):
+		"""
+		Delete the VMs that are not in vm_ids
+
+		Args:
+		- vm_ids: set with the IDs of the VMs to keep.
+		"""
+		with self._lock:
+			for vm_id in [vm_id for vm_id in self.state if vm_id not in vm_ids]:
+				del self.state[vm_id]
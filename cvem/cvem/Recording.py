@@ -0,0 +1,152 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import gzip
+import zlib
+import struct
+import cPickle as pickle
+from config import logger
+from CMPInfo import VirtualMachineInfo, HostInfo
+
+FORMAT = "cvem-recording"
+""" Key that identifies the header of the recordings """
+VERSION = 1
+
+VM_FIELDS = ('id', 'host_id', 'host_name', 'user_id', 'allocated_memory', 'real_memory', 'total_memory', 'free_memory',
+			'cpus', 'min_free_mem', 'mem_over_ratio', 'mem_policy', 'timestamp', 'active')
+""" Fields of the tuple of each VM in the snapshots """
+HOST_FIELDS = ('id', 'name', 'active', 'last_update', 'free_memory', 'free_cpus')
+""" Fields of the tuple of each host in the snapshots """
+
+def vm_to_tuple(vm):
+	host_id = host_name = None
+	if vm.host is not None:
+		host_id, host_name = vm.host.id, vm.host.name
+	return (vm.id, host_id, host_name, vm.user_id, vm.allocated_memory, vm.real_memory, vm.total_memory, vm.free_memory,
+			vm.cpus, vm.min_free_mem, vm.mem_over_ratio, vm.mem_policy, vm.timestamp, vm.active)
+
+def tuple_to_vm(values):
+	(vm_id, host_id, host_name, user_id, allocated_memory, real_memory, total_memory, free_memory,
+		cpus, min_free_mem, mem_over_ratio, mem_policy, timestamp, active) = values
+	host = None
+	if host_id is not None:
+		host = HostInfo(host_id, host_name)
+	vm = VirtualMachineInfo(vm_id, host, allocated_memory)
+	vm.user_id = user_id
+	# The free memory is stored already corrected with SYS_MEM_OFFSET
+	vm.real_memory = real_memory
+	vm.total_memory = total_memory
+	vm.free_memory = free_memory
+	vm.cpus = cpus
+	vm.min_free_mem = min_free_mem
+	vm.mem_over_ratio = mem_over_ratio
+	vm.mem_policy = mem_policy
+	vm.timestamp = timestamp
+	vm.active = active
+	return vm
+
+def host_to_tuple(host):
+	return (host.id, host.name, host.active, host.last_update, host.free_memory, host.free_cpus)
+
+def tuple_to_host(values):
+	host_id, name, active, last_update, free_memory, free_cpus = values
+	host = HostInfo(host_id, name, active)
+	host.last_update = last_update
+	host.free_memory = free_memory
+	host.free_cpus = free_cpus
+	return host
+
+class Snapshot:
+	""" VMs and hosts of the CMP in a monitor loop """
+	def __init__(self, timestamp, vms, hosts):
+		self.timestamp = timestamp
+		""" Time of the monitor loop """
+		self.vms = vms
+		""" List with the tuple (VM_FIELDS) of each VM """
+		self.hosts = hosts
+		""" List with the tuple (HOST_FIELDS) of each host """
+
+class SnapshotRecorder:
+	"""
+	Record the VMs and hosts of each monitor loop to a gzip file with one pickled
+	record per loop, to replay them later in the Simulator.
+	The file is opened in append mode, so each start of the monitor adds a new gzip member
+	(with a new header) to the file.
+	"""
+
+	def __init__(self, record_file):
+		self.record_file = record_file
+		""" Path of the recording file """
+		self._file = None
+		self._timestamp = None
+		self._vms = []
+
+	def start_cycle(self, timestamp):
+		self._timestamp = timestamp
+		self._vms = []
+
+	def add_vms(self, vms):
+		"""
+		Add a list of VirtualMachineInfo to the snapshot of the loop
+		"""
+		self._vms.extend(vm_to_tuple(vm) for vm in vms)
+
+	def end_cycle(self, hosts):
+		"""
+		Write the snapshot of the loop with the hosts (list of HostInfo) to the file
+		"""
+		if self._timestamp is None:
+			return
+		record = (self._timestamp, self._vms, [host_to_tuple(host) for host in hosts])
+		self._timestamp = None
+		self._vms = []
+		try:
+			if self._file is None:
+				self._file = gzip.open(self.record_file, 'ab')
+				pickle.dump((FORMAT, VERSION, VM_FIELDS, HOST_FIELDS), self._file, pickle.HIGHEST_PROTOCOL)
+			pickle.dump(record, self._file, pickle.HIGHEST_PROTOCOL)
+			self._file.flush()
+		except Exception:
+			logger.exception("Error writing the snapshot to the recording file: " + self.record_file)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+def iter_snapshots(record_file):
+	"""
+	Read the snapshots of a recording file. The incomplete records at the end of the file are ignored.
+
+	Return: iterator of Snapshot
+	"""
+	record_file = gzip.open(record_file, 'rb')
+	try:
+		while True:
+			try:
+				record = pickle.load(record_file)
+			except EOFError:
+				break
+			except (IOError, zlib.error, struct.error, pickle.UnpicklingError):
+				logger.warn("Incomplete record in the recording file. Ignoring the rest of the file.")
+				break
+			if record[0] == FORMAT:
+				if record[1] != VERSION:
+					raise Exception("Unsupported version of the recording file: %s" % record[1])
+				continue
+			yield Snapshot(*record)
+	finally:
+		record_file.close()
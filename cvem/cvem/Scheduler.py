@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import heapq
+import threading
+
+class VMScheduler:
+	"""
+	Decide when each VM has to be evaluated again, using a priority queue with the next check time of each VM.
+	A VM is checked again after min_interval secs if its free memory is outside the
+	overprovisioning band or it is changing fast, sooner than before if it is near the limits of the band,
+	and the interval grows (up to max_interval secs) while the VM remains stable.
+	"""
+
+	def __init__(self, min_interval, max_interval, backoff = 2.0, fast_change = 5.0):
+		self.min_interval = min_interval
+		""" Minimum time (in secs) between two checks of a VM """
+		self.max_interval = max_interval
+		""" Maximum time (in secs) between two checks of a VM """
+		self.backoff = backoff
+		""" Factor to increase the interval of a VM each time it is stable """
+		self.fast_change = fast_change
+		""" Change of the free memory percentage (and distance to the limits of the band) that is considered fast (or near) """
+		self.next_check = {}
+		""" Dict with the time of the next check of each VM ID """
+		self.intervals = {}
+		""" Dict with the current interval of each VM ID """
+		self.last_pct = {}
+		""" Dict with the free memory percentage of each VM ID in the last check """
+		self._queue = []
+		self._lock = threading.Lock()
+
+	def is_due(self, vm_id, now):
+		"""
+		Check if the VM has to be evaluated (the VMs never checked are always due)
+		"""
+		return self.next_check.get(vm_id, 0) <= now
+
+	def schedule(self, vm_id, free_pct, mem_over_ratio, mem_margin, now):
+		"""
+		Compute the time of the next check of the VM with its current free memory percentage
+
+		Args:
+		- vm_id: ID of the VM.
+		- free_pct: percentage of free memory of the VM.
+		- mem_over_ratio: memory overprovisioning percentage of the VM.
+		- mem_margin: margin of the overprovisioning percentage.
+		- now: current time.
+
+		Return: the interval (in secs) until the next check of the VM
+		"""
+		with self._lock:
+			interval = self.intervals.get(vm_id, self.min_interval)
+			last_pct = self.last_pct.get(vm_id, free_pct)
+			distance = min(abs(free_pct - (mem_over_ratio - mem_margin)), abs(free_pct - (mem_over_ratio + mem_margin)))
+
+			if abs(free_pct - mem_over_ratio) > mem_margin or abs(free_pct - last_pct) >= self.fast_change:
+				# Outside the band or changing fast
+				interval = self.min_interval
+			elif distance < self.fast_change:
+				# Near the limits of the band
+				interval = max(self.min_interval, interval / self.backoff)
+			else:
+				interval = min(self.max_interval, interval * self.backoff)
+
+			self.intervals[vm_id] = interval
+			self.last_pct[vm_id] = free_pct
+			self.next_check[vm_id] = now + interval
+			heapq.heappush(self._queue, (now + interval, vm_id))
+			return interval
+
+	def get_next_check(self):
+		"""
+		Get the time of the earliest check of the VMs, or None if there are no VMs scheduled
+		"""
+		with self._lock:
+			while self._queue:
+				next_check, vm_id = self._queue[0]
+				if self.next_check.get(vm_id) == next_check:
+					return next_check
+				# The VM has been rescheduled or deleted
+				heapq.heappop(self._queue)
+			return None
+
+	def retain(self, vm_ids):
+		"""
+		Delete the VMs that are not in vm_ids
+
+		Args:
+		- vm_ids: set with the IDs of the VMs to keep.
+		"""
+		with self._lock:
+			for vm_id in [vm_id for vm_id in self.next_check if vm_id not in vm_ids]:
+				del self.next_check[vm_id]
+				del self.intervals[vm_id]
+				del self.last_pct[vm_id]
+			self._queue = [(next_check, vm_id) for next_check, vm_id in self._queue if self.next_check.get(vm_id) == next_check]
+			heapq.heapify(self._queue)
@@ -0,0 +1,116 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import threading
+import Queue
+from contextlib import contextmanager
+from cpyutils.timeoutxmlrpccli import ServerProxy
+
+class ServerProxyPool:
+	"""
+	Thread-safe pool of XML-RPC ServerProxy objects.
+	Each ServerProxy keeps its HTTP connection open between calls (HTTP/1.1 keep-alive),
+	so the connections to the server are reused instead of opening a new one per call.
+	"""
+
+	def __init__(self, server_url, size = 1, timeout = 10):
+		self.server_url = server_url
+		""" URL of the XML-RPC server """
+		self.size = max(1, size)
+		""" Maximum number of ServerProxy objects (connections) of the pool """
+		self.timeout = timeout
+		""" Timeout (in secs) of the XML-RPC calls """
+		self._idle = Queue.LifoQueue()
+		self._created = 0
+		self._lock = threading.Lock()
+		self.hits = 0
+		""" Number of times that an idle connection has been reused """
+		self.misses = 0
+		""" Number of times that a new connection has been created """
+		self.waits = 0
+		""" Number of times that a caller had to wait for a connection to be released """
+
+	def acquire(self):
+		"""
+		Get a ServerProxy from the pool. If there are no idle ones
+		it creates a new one or waits until one is released (if the pool is full).
+		"""
+		try:
+			server = self._idle.get_nowait()
+			with self._lock:
+				self.hits += 1
+			return server
+		except Queue.Empty:
+			pass
+
+		with self._lock:
+			if self._created < self.size:
+				self._created += 1
+				self.misses += 1
+				create = True
+			else:
+				self.waits += 1
+				create = False
+
+		if create:
+			try:
+				return ServerProxy(self.server_url, allow_none=True, timeout=self.timeout)
+			except:
+				with self._lock:
+					self._created -= 1
+				raise
+		else:
+			return self._idle.get()
+
+	def release(self, server, discard = False):
+		"""
+		Return a ServerProxy to the pool.
+		If discard is True the ServerProxy is closed and replaced by a new one
+		(i.e. its connection may be broken after an error).
+		"""
+		if discard:
+			try:
+				server("close")()
+			except:
+				pass
+			# Replace it with a new one (it does not connect until it is used)
+			server = ServerProxy(self.server_url, allow_none=True, timeout=self.timeout)
+		self._idle.put(server)
+
+	@contextmanager
+	def server(self):
+		"""
+		Context manager to get a ServerProxy from the pool and release it when finished.
+		In case of error the ServerProxy is discarded.
+		"""
+		server = self.acquire()
+		try:
+			yield server
+		except:
+			self.release(server, True)
+			raise
+		else:
+			self.release(server)
+
+	def get_stats(self):
+		"""
+		Get the counters of the pool
+
+		Return: dict with the number of hits, misses and waits and the size of the pool
+		"""
+		with self._lock:
+			return {'size': self.size, 'created': self._created, 'idle': self._idle.qsize(),
+				'hits': self.hits, 'misses': self.misses, 'waits': self.waits}
@@ -0,0 +1,278 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import multiprocessing
+from config import Config, logger
+from CMPInfo import CMPInfo, VMIndex
+from Monitor import Monitor, VMMonitorData, SerialPool
+from SharedSnapshot import SnapshotWriter, SnapshotReader
+from Tracing import tracer
+
+class ShardCMP(CMPInfo):
+	""" CMP of the worker processes: it serves the hosts of the shared snapshot """
+
+	def __init__(self):
+		self.hosts = []
+		""" List of HostInfo of the last snapshot """
+
+	def get_host_list(self):
+		return self.hosts
+
+	def get_host_info(self, host_id):
+		for host in self.hosts:
+			if host.id == host_id:
+				return host
+		return None
+
+class ShardMonitor(Monitor):
+	"""
+	Monitor of a worker process. It evaluates the VMs of its shard with the decision logic
+	of the Monitor, but instead of applying the decisions it returns them to the coordinator:
+	the memory changes, the memory requests of the VMs that can not grow in their host
+	(the migrations are made by the coordinator), the changes of the monitoring information
+	and the memory samples of the VMs evaluated (stored in the TimeSeriesStore of the coordinator).
+	"""
+
+	COUNTERS = ('evaluated_vms', 'skipped_vms', 'stale_vms', 'fresh_vms')
+	""" Counters of the VMs of the loop returned to the coordinator """
+
+	def __init__(self):
+		Monitor.__init__(self, ShardCMP())
+		self.changes = []
+		""" List of tuples (vm_id, host_id, new_mem, reserved) with the memory changes of the loop """
+		self.requests = []
+		""" List of tuples (vm_id, memory) with the memory requests of the loop """
+		self.collect_samples = self.timeseries is not None
+		""" Return the memory samples of the VMs (if TIMESERIES is enabled) """
+		self.timeseries = None
+		self.samples = []
+		""" List of tuples (vm_id, timestamp, real_memory, total_memory, free_memory) with the samples of the loop """
+
+	def load_data(self):
+		pass
+
+	def save_data(self):
+		pass
+
+	@staticmethod
+	def host_has_memory_free(host_info, free_memory):
+		return host_info.free_memory is not None and host_info.free_memory - free_memory > Config.HOST_MEM_MARGIN
+
+	def add_sample(self, vm):
+		if self.collect_samples:
+			self.samples.append((vm.id, vm.timestamp or self.now(), vm.real_memory, vm.total_memory, vm.free_memory))
+
+	def request_memory_change(self, vm_id, vm_host, new_mem, reserved = 0):
+		self.changes.append((vm_id, vm_host.id, new_mem, reserved))
+
+	def request_migration(self, vm, memory):
+		self.requests.append((vm.id, memory))
+
+	def run_shard(self, hosts, vms, last_migration, states, deadline = None):
+		"""
+		Evaluate the VMs of the shard
+
+		Args:
+		- hosts: list of HostInfo of the snapshot.
+		- vms: list of VirtualMachineInfo of the shard.
+		- last_migration: dict with the timestamp of the last migration of each host.
+		- states: dict with the monitoring information (see VMMonitorData.get_state) of the VMs new in the shard.
+		- deadline: time to stop evaluating VMs (see CYCLE_BUDGET).
+
+		Return: tuple (changes, requests, states, deferred, counters, samples) with the memory changes,
+		the memory requests, the monitoring information of the VMs that has changed, the IDs of the VMs deferred,
+		a dict with the number of VMs of the loop (see COUNTERS) and the memory samples of the VMs evaluated
+		"""
+		self.cmp.hosts = hosts
+		self.last_migration = last_migration
+		self.cycle_deadline = deadline
+		self.carried_over, self.deferred_vms = self.deferred_vms, set()
+		for name in self.COUNTERS:
+			setattr(self, name, 0)
+		self.clean_old_data([vm.id for vm in vms])
+		for vm_id, state in states.items():
+			self.vm_data[vm_id] = VMMonitorData.from_state(vm_id, state)
+
+		due_vms = self.get_due_vms(vms)
+		before = {}
+		for vm in due_vms:
+			vm_data = self.vm_data.get(vm.id)
+			before[vm.id] = vm_data.get_state() if vm_data else None
+
+		if due_vms:
+			self.update_host_pool()
+			self.evaluate_due_vms(SerialPool(), due_vms, VMIndex(vms))
+
+		deltas = {}
+		for vm in due_vms:
+			vm_data = self.vm_data.get(vm.id)
+			if vm_data:
+				state = vm_data.get_state()
+				if state != before[vm.id]:
+					deltas[vm.id] = state
+
+		changes, self.changes = self.changes, []
+		requests, self.requests = self.requests, []
+		samples, self.samples = self.samples, []
+		counters = dict((name, getattr(self, name)) for name in self.COUNTERS)
+		return changes, requests, deltas, list(self.deferred_vms), counters, samples
+
+def run_worker(shard, conn, snapshot_path):
+	"""
+	Main loop of a worker process: it receives a message per loop with the last migrations,
+	the states of the new VMs and the deadline of the loop, reads its VMs from the shared snapshot and sends back the decisions
+	"""
+	# The traces and the recording are only made by the coordinator, and the migrations are always made by it
+	# (the workers return a memory request for each VM that needs a migration)
+	tracer.sample_rate = 0
+	Config.RECORD_FILE = ""
+	Config.MIGRATION_PLANNER = True
+	monitor = ShardMonitor()
+	reader = SnapshotReader(snapshot_path)
+	try:
+		while True:
+			msg = conn.recv()
+			if msg is None:
+				break
+			last_migration, states, deadline = msg
+			try:
+				_, hosts, vms = reader.read_shard(shard)
+				res = monitor.run_shard(hosts, vms, last_migration, states, deadline)
+			except Exception:
+				logger.exception("Error in the monitor worker %d." % shard)
+				res = ([], [], {}, [], {}, [])
+			conn.send(res)
+	except (EOFError, KeyboardInterrupt):
+		pass
+	finally:
+		reader.close()
+
+class ShardPool:
+	"""
+	Pool of worker processes that evaluate the VMs sharded by host ID: each host (and its VMs)
+	belongs to one worker, so the host ledger of each worker is exact and no locks are shared.
+	In each loop the VMs and hosts are written once in a SnapshotWriter, and each worker reads its VMs.
+	The monitoring information of the VMs lives in the workers, so the coordinator only sends
+	the information of the VMs that are new in a shard (i.e. migrated to a host of other shard).
+	"""
+
+	def __init__(self, num_shards):
+		self.num_shards = max(1, num_shards)
+		self.writer = SnapshotWriter(self.num_shards)
+		self.workers = [None] * self.num_shards
+		""" List with the tuple (process, connection) of each worker """
+		self.vm_shard = {}
+		""" Dict with the shard of each VM ID in the last loop """
+
+	def _start_worker(self, shard):
+		parent_conn, child_conn = multiprocessing.Pipe()
+		process = multiprocessing.Process(target=run_worker, args=(shard, child_conn, self.writer.path),
+										name="cvem-shard-%d" % shard)
+		process.daemon = True
+		process.start()
+		child_conn.close()
+		self.workers[shard] = (process, parent_conn)
+
+	def start(self):
+		for shard in range(self.num_shards):
+			self._start_worker(shard)
+		logger.info("%d monitor workers started." % self.num_shards)
+
+	def get_shard(self, vm):
+		if vm.host is None:
+			return 0
+		return vm.host.id % self.num_shards
+
+	def evaluate(self, vms, hosts, last_migration, get_state, deadline = None):
+		"""
+		Evaluate the VMs in the workers
+
+		Args:
+		- vms: list of VirtualMachineInfo to evaluate.
+		- hosts: list of HostInfo.
+		- last_migration: dict with the timestamp of the last migration of each host.
+		- get_state: function that returns the monitoring information of a VM (or None): get_state(vm_id).
+		- deadline: time to stop evaluating VMs (see CYCLE_BUDGET).
+
+		Return: tuple (changes, requests, states, deferred, counters, samples) with the decisions
+		of all the workers (see ShardMonitor.run_shard)
+		"""
+		vms_by_shard = [[] for _ in range(self.num_shards)]
+		states = [{} for _ in range(self.num_shards)]
+		vm_shard = {}
+		for vm in vms:
+			shard = self.get_shard(vm)
+			vms_by_shard[shard].append(vm)
+			vm_shard[vm.id] = shard
+			if self.vm_shard.get(vm.id) != shard:
+				state = get_state(vm.id)
+				if state is not None:
+					states[shard][vm.id] = state
+		self.vm_shard = vm_shard
+		self.writer.write(hosts, vms_by_shard)
+
+		for shard, (_, conn) in enumerate(self.workers):
+			try:
+				conn.send((last_migration, states[shard], deadline))
+			except (IOError, OSError):
+				pass
+
+		changes = []
+		requests = []
+		deltas = {}
+		deferred = []
+		samples = []
+		counters = dict((name, 0) for name in ShardMonitor.COUNTERS)
+		for shard, (process, conn) in enumerate(self.workers):
+			try:
+				shard_changes, shard_requests, shard_deltas, shard_deferred, shard_counters, shard_samples = conn.recv()
+			except (EOFError, IOError, OSError):
+				logger.error("The monitor worker %d has died. Restarting it." % shard)
+				self._restart_worker(shard)
+				continue
+			changes.extend(shard_changes)
+			requests.extend(shard_requests)
+			deltas.update(shard_deltas)
+			deferred.extend(shard_deferred)
+			samples.extend(shard_samples)
+			for name, value in shard_counters.items():
+				counters[name] += value
+		return changes, requests, deltas, deferred, counters, samples
+
+	def _restart_worker(self, shard):
+		process, conn = self.workers[shard]
+		conn.close()
+		if process.is_alive():
+			process.terminate()
+		process.join()
+		self._start_worker(shard)
+		# The new worker has no monitoring information, send it again in the next loop
+		for vm_id, vm_shard in self.vm_shard.items():
+			if vm_shard == shard:
+				del self.vm_shard[vm_id]
+
+	def stop(self):
+		for process, conn in self.workers:
+			try:
+				conn.send(None)
+			except (IOError, OSError):
+				pass
+		for process, conn in self.workers:
+			process.join(5)
+			if process.is_alive():
+				process.terminate()
+			conn.close()
+		self.writer.close()
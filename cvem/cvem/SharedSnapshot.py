@@ -0,0 +1,254 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import os
+import mmap
+import struct
+import tempfile
+from CMPInfo import VirtualMachineInfo, HostInfo
+
+MAGIC = "CVEMSNAP"
+
+HEADER = struct.Struct("<8sIIII")
+""" Header of the snapshot: magic, generation, number of hosts, number of shards and size of the names section """
+SHARD = struct.Struct("<II")
+""" Entry of the shard table: index of the first VM of the shard and number of VMs """
+HOST = struct.Struct("<qqddBII")
+""" Host record: id, free_memory, free_cpus, last_update, flags and position and length of the name in the names section """
+VM = struct.Struct("<qqqqqqdddddBB")
+""" VM record: id, host_id, allocated_memory, real_memory, total_memory, free_memory,
+min_free_mem, cpus, mem_over_ratio, timestamp, last_poll, flags and mem_policy """
+
+# Flags of the records
+ACTIVE = 1
+HAS_HOST = 2
+HAS_ALLOCATED = 4
+HAS_MEMORY = 8
+HAS_FREE_MEMORY = 16
+
+POLICIES = (None, 'reactive', 'predictive')
+""" Values of the mem_policy of the VMs (any unknown policy is reactive) """
+
+NAN = float('nan')
+
+def _to_float(value):
+	if value is None:
+		return NAN
+	return float(value)
+
+def _from_float(value):
+	if value != value:
+		return None
+	return value
+
+def _get_policy_code(mem_policy):
+	if mem_policy is None:
+		return 0
+	elif mem_policy == 'predictive':
+		return 2
+	else:
+		return 1
+
+class SnapshotWriter:
+	"""
+	Write the VMs and hosts of each monitor loop in a shared memory file (in /dev/shm if it exists),
+	so the worker processes read them directly from the memory instead of receiving them pickled.
+	The VMs are written grouped by shard, with a table with the position of the VMs of each shard,
+	so each worker only reads its VMs. The names of the hosts (UTF-8 encoded) are written in
+	a variable length section between the hosts and the VMs. The file only grows, so the workers remap it only when needed.
+	"""
+
+	def __init__(self, num_shards):
+		self.num_shards = num_shards
+		directory = None
+		if os.path.isdir("/dev/shm"):
+			directory = "/dev/shm"
+		fd, self.path = tempfile.mkstemp(prefix="cvem_snapshot_", dir=directory)
+		""" Path of the shared memory file """
+		self._file = os.fdopen(fd, "r+b")
+		self._mmap = None
+		self.size = 0
+		""" Size of the file """
+		self.generation = 0
+		""" Number of snapshots written """
+
+	def _reserve(self, size):
+		if size <= self.size:
+			return
+		size = max(size, self.size * 2, mmap.PAGESIZE)
+		self._file.truncate(size)
+		if self._mmap is not None:
+			self._mmap.close()
+		self._mmap = mmap.mmap(self._file.fileno(), size)
+		self.size = size
+
+	def write(self, hosts, vms_by_shard):
+		"""
+		Write a snapshot
+
+		Args:
+		- hosts: list of HostInfo.
+		- vms_by_shard: list with the list of VirtualMachineInfo of each shard.
+
+		Return: the generation of the snapshot
+		"""
+		names = []
+		for host in hosts:
+			name = (host.name or "")
+			if isinstance(name, unicode):
+				name = name.encode('utf-8')
+			names.append(name)
+		names_size = sum(len(name) for name in names)
+
+		num_vms = sum(len(vms) for vms in vms_by_shard)
+		self._reserve(HEADER.size + SHARD.size * self.num_shards + HOST.size * len(hosts) + names_size + VM.size * num_vms)
+		buf = self._mmap
+		self.generation += 1
+
+		HEADER.pack_into(buf, 0, MAGIC, self.generation, len(hosts), self.num_shards, names_size)
+		offset = HEADER.size
+		first = 0
+		for vms in vms_by_shard:
+			SHARD.pack_into(buf, offset, first, len(vms))
+			offset += SHARD.size
+			first += len(vms)
+
+		name_offset = 0
+		for host, name in zip(hosts, names):
+			flags = 0
+			if host.active:
+				flags |= ACTIVE
+			if host.free_memory is not None:
+				flags |= HAS_FREE_MEMORY
+			HOST.pack_into(buf, offset, host.id, int(host.free_memory or 0), _to_float(host.free_cpus),
+						_to_float(host.last_update), flags, name_offset, len(name))
+			offset += HOST.size
+			name_offset += len(name)
+
+		buf[offset:offset + names_size] = "".join(names)
+		offset += names_size
+
+		for vms in vms_by_shard:
+			for vm in vms:
+				flags = 0
+				if vm.active:
+					flags |= ACTIVE
+				host_id = 0
+				if vm.host is not None:
+					flags |= HAS_HOST
+					host_id = vm.host.id
+				if vm.allocated_memory is not None:
+					flags |= HAS_ALLOCATED
+				if vm.total_memory is not None:
+					flags |= HAS_MEMORY
+				VM.pack_into(buf, offset, vm.id, host_id, int(vm.allocated_memory or 0), int(vm.real_memory or 0),
+						int(vm.total_memory or 0), int(vm.free_memory or 0), _to_float(vm.min_free_mem), _to_float(vm.cpus),
+						_to_float(vm.mem_over_ratio), _to_float(vm.timestamp), _to_float(vm.last_poll), flags,
+						_get_policy_code(vm.mem_policy))
+				offset += VM.size
+
+		return self.generation
+
+	def close(self):
+		if self._mmap is not None:
+			self._mmap.close()
+			self._mmap = None
+		self._file.close()
+		try:
+			os.unlink(self.path)
+		except OSError:
+			pass
+
+class SnapshotReader:
+	"""
+	Read the snapshots written by a SnapshotWriter
+	"""
+
+	def __init__(self, path):
+		self._file = open(path, "rb")
+		self._mmap = None
+		self.size = 0
+
+	def _remap(self):
+		size = os.fstat(self._file.fileno()).st_size
+		if size != self.size:
+			if self._mmap is not None:
+				self._mmap.close()
+			self._mmap = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+			self.size = size
+
+	def read_shard(self, shard):
+		"""
+		Read the hosts and the VMs of a shard of the last snapshot
+
+		Return: tuple (generation, hosts, vms) with the list of HostInfo and the list of VirtualMachineInfo
+		"""
+		self._remap()
+		buf = self._mmap
+		magic, generation, num_hosts, num_shards, names_size = HEADER.unpack_from(buf, 0)
+		if magic != MAGIC:
+			raise Exception("Invalid snapshot file")
+		first, count = SHARD.unpack_from(buf, HEADER.size + SHARD.size * shard)
+
+		hosts = []
+		hosts_by_id = {}
+		offset = HEADER.size + SHARD.size * num_shards
+		names_offset = offset + HOST.size * num_hosts
+		for _ in range(num_hosts):
+			host_id, free_memory, free_cpus, last_update, flags, name_offset, name_size = HOST.unpack_from(buf, offset)
+			offset += HOST.size
+			name = buf[names_offset + name_offset:names_offset + name_offset + name_size]
+			host = HostInfo(host_id, name.decode('utf-8'), bool(flags & ACTIVE))
+			if flags & HAS_FREE_MEMORY:
+				host.free_memory = free_memory
+			host.free_cpus = _from_float(free_cpus)
+			host.last_update = _from_float(last_update)
+			hosts.append(host)
+			hosts_by_id[host_id] = host
+
+		vms = []
+		offset += names_size + VM.size * first
+		for _ in range(count):
+			(vm_id, host_id, allocated_memory, real_memory, total_memory, free_memory,
+				min_free_mem, cpus, mem_over_ratio, timestamp, last_poll, flags, policy) = VM.unpack_from(buf, offset)
+			offset += VM.size
+			host = None
+			if flags & HAS_HOST:
+				host = hosts_by_id.get(host_id)
+				if host is None:
+					host = HostInfo(host_id)
+			vm = VirtualMachineInfo(vm_id, host, allocated_memory if flags & HAS_ALLOCATED else None)
+			if flags & HAS_MEMORY:
+				# The free memory is stored already corrected with SYS_MEM_OFFSET
+				vm.real_memory = real_memory
+				vm.total_memory = total_memory
+				vm.free_memory = free_memory
+			vm.min_free_mem = _from_float(min_free_mem)
+			vm.cpus = _from_float(cpus)
+			vm.mem_over_ratio = _from_float(mem_over_ratio)
+			vm.timestamp = _from_float(timestamp)
+			vm.last_poll = _from_float(last_poll)
+			vm.mem_policy = POLICIES[policy]
+			vm.active = bool(flags & ACTIVE)
+			vms.append(vm)
+
+		return generation, hosts, vms
+
+	def close(self):
+		if self._mmap is not None:
+			self._mmap.close()
+			self._mmap = None
+		self._file.close()
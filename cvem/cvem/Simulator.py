@@ -0,0 +1,302 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import itertools
+import multiprocessing
+from config import Config, logger
+from CMPInfo import CMPInfo
+from Actuator import Actuator
+from Monitor import Monitor, SerialPool
+from Recording import iter_snapshots, tuple_to_vm, tuple_to_host
+
+# Config values needed to replay a recording
+SIMULATION_CONFIG = {'ONLY_TEST': False, 'EVENT_FEED': False, 'STREAM_VM_LIST': False, 'RECORD_FILE': "",
+					'BATCH_ACTUATION': False, 'ASYNC_ACTUATION': False, 'TRACE_SAMPLE_RATE': 0.0, 'METRICS_PORT': 0}
+
+class SimulationStats:
+	""" Counters of the events of a simulation """
+	def __init__(self):
+		self.cycles = 0
+		self.vm_samples = 0
+		""" Number of samples of the VMs (one per VM and loop) """
+		self.grows = 0
+		self.shrinks = 0
+		self.migrations = 0
+		self.power_on_requests = 0
+		self.near_oom = 0
+		""" Number of samples with less free memory than the min free memory of the VM """
+		self.oom = 0
+		""" Number of samples with more used memory than the memory of the VM """
+		self.allocated_memory = 0
+		""" Sum of the original memory of the VMs in all the samples (the baseline of the memory saved) """
+		self.memory = 0
+		""" Sum of the memory set to the VMs in all the samples """
+		self.start = None
+		self.end = None
+
+	def to_dict(self):
+		"""
+		Get the counters and the memory saved (per loop and in percentage) with respect to
+		the original memory of the VMs (see SimulatedCMP)
+		"""
+		res = dict(self.__dict__)
+		res['resizes'] = self.grows + self.shrinks
+		res['memory_saved'] = 0
+		res['memory_saved_pct'] = 0.0
+		if self.cycles:
+			res['memory_saved'] = (self.allocated_memory - self.memory) / self.cycles
+		if self.allocated_memory:
+			res['memory_saved_pct'] = 100.0 * (self.allocated_memory - self.memory) / self.allocated_memory
+		return res
+
+class SimulatedCMP(CMPInfo):
+	"""
+	CMP that serves the snapshots of a recording, modified with the effects of the decisions
+	of the monitor: the memory set to the VMs and their migrations. The used memory of each VM
+	is the recorded one, and its free memory is computed with the memory set in the simulation.
+	The VMs start the simulation with their original memory: the memory allocated by the CMP
+	(or the first recorded one if it is bigger or the allocated one is not known), as the recorded
+	memory may have been already reduced by the monitor that made the recording.
+	This is also the baseline of the memory saved.
+	"""
+
+	def __init__(self):
+		self.stats = SimulationStats()
+		self.now = None
+		""" Time of the current snapshot """
+		self.vms = {}
+		""" Dict with the VirtualMachineInfo of each VM ID in the current snapshot """
+		self.hosts = {}
+		""" Dict with the HostInfo of each host ID in the current snapshot """
+		self.memory = {}
+		""" Dict with the real memory set to each VM ID in the simulation """
+		self.first_memory = {}
+		""" Dict with the first recorded real memory of each VM ID """
+		self.placement = {}
+		""" Dict with the host ID of each VM migrated in the simulation """
+
+	def load(self, snapshot):
+		"""
+		Load a snapshot of the recording applying the state of the simulation
+		"""
+		stats = self.stats
+		self.now = snapshot.timestamp
+		if stats.start is None:
+			stats.start = snapshot.timestamp
+		stats.end = snapshot.timestamp
+		stats.cycles += 1
+
+		self.hosts = dict((host[0], tuple_to_host(host)) for host in snapshot.hosts)
+		self.vms = {}
+		for values in snapshot.vms:
+			vm = tuple_to_vm(values)
+			self.vms[vm.id] = vm
+			if vm.total_memory is None:
+				continue
+
+			host_id = vm.host.id if vm.host else None
+			# Give back the recorded memory of the VM to its recorded host
+			recorded_host = self.hosts.get(host_id)
+			if recorded_host and recorded_host.free_memory is not None:
+				recorded_host.free_memory += vm.real_memory
+
+			# Apply the memory and the host of the simulation
+			original_mem = max(vm.allocated_memory, self.first_memory.setdefault(vm.id, vm.real_memory))
+			used_mem = vm.total_memory - vm.free_memory
+			mem_diff = vm.real_memory - vm.total_memory
+			vm.real_memory = self.memory.get(vm.id, original_mem)
+			vm.total_memory = vm.real_memory - mem_diff
+			vm.free_memory = max(0, vm.total_memory - used_mem)
+			if vm.id in self.placement and self.placement[vm.id] in self.hosts:
+				vm.host = self.hosts[self.placement[vm.id]]
+			host = self.hosts.get(vm.host.id) if vm.host else None
+			if host and host.free_memory is not None:
+				host.free_memory -= vm.real_memory
+
+			stats.vm_samples += 1
+			stats.allocated_memory += original_mem
+			stats.memory += vm.real_memory
+			if used_mem > vm.total_memory:
+				stats.oom += 1
+			if vm.free_memory < (vm.min_free_mem or Config.MIN_FREE_MEMORY):
+				stats.near_oom += 1
+
+	def get_vm_list(self):
+		return self.vms.values()
+
+	def get_vm_info(self, vm_id):
+		return self.vms.get(vm_id)
+
+	def get_host_info(self, host_id):
+		return self.hosts.get(host_id)
+
+	def get_host_list(self):
+		return self.hosts.values()
+
+	def migrate(self, vm_id, host_id):
+		if host_id not in self.hosts:
+			return False
+		self.placement[vm_id] = host_id
+		self.stats.migrations += 1
+		return True
+
+	def set_memory(self, vm_id, new_mem):
+		vm = self.vms.get(vm_id)
+		if vm is not None and vm.real_memory is not None:
+			if new_mem > vm.real_memory:
+				self.stats.grows += 1
+			else:
+				self.stats.shrinks += 1
+		self.memory[vm_id] = new_mem
+		return True
+
+class SimulatedActuator(Actuator):
+	""" Actuator that sets the memory of the VMs in the SimulatedCMP """
+
+	def __init__(self, cmp):
+		self.cmp = cmp
+
+	def change_memory(self, vm_id, vm_host, new_mem):
+		return self.cmp.set_memory(vm_id, int(new_mem))
+
+class SimulatedMonitor(Monitor):
+	"""
+	Monitor that runs over a SimulatedCMP: the time is the one of the snapshots,
+	the data is not stored and the hosts are not really powered on.
+	"""
+
+	def __init__(self, cmpo):
+		Monitor.__init__(self, cmpo)
+		self.actuator = SimulatedActuator(cmpo)
+
+	def now(self):
+		return self.cmp.now
+
+	def load_data(self):
+		pass
+
+	def save_data(self):
+		pass
+
+	def request_power_on(self, free_memory, cpus):
+		self.cmp.stats.power_on_requests += 1
+		return False
+
+	@staticmethod
+	def host_has_memory_free(host_info, free_memory):
+		return host_info.free_memory is not None and host_info.free_memory - free_memory > Config.HOST_MEM_MARGIN
+
+	def select_vm_to_migrate(self, req_vm_id, host_info, all_vms):
+		"""
+		Select the VM with less memory of the host (as MonitorONE)
+		"""
+		candidates = [vm for vm in self.get_host_vms(host_info, all_vms) if vm.id != req_vm_id]
+		if not candidates:
+			return None
+		return min(candidates, key=lambda vm: vm.total_memory or vm.allocated_memory)
+
+	def select_host_to_migrate(self, vm_info):
+		"""
+		Select the host with more free memory in the host ledger if it has enough memory and CPUs for the VM (as MonitorONE)
+		"""
+		memory = vm_info.total_memory or vm_info.allocated_memory
+		host = self.reserve_host_to_migrate(memory, vm_info.cpus or 0)
+		if host is None:
+			self.request_power_on(memory, vm_info.cpus)
+		return host
+
+def simulate(record_file, params = None):
+	"""
+	Replay a recording with a set of Config values
+
+	Args:
+	- record_file: path of the recording file (see RECORD_FILE).
+	- params: dict with the Config values of the simulation (i.e. MEM_OVER, COOLDOWN, ...).
+
+	Return: dict with the params and the SimulationStats values of the simulation
+	"""
+	if params is None:
+		params = {}
+	values = dict(SIMULATION_CONFIG)
+	values.update(params)
+	old_values = dict((key, getattr(Config, key)) for key in values)
+	for key, value in values.items():
+		setattr(Config, key, value)
+	start = time.time()
+	try:
+		cmp = SimulatedCMP()
+		monitor = SimulatedMonitor(cmp)
+		try:
+			pool = SerialPool()
+			for snapshot in iter_snapshots(record_file):
+				cmp.load(snapshot)
+				monitor.run_cycle(pool)
+		finally:
+			monitor.metrics.close()
+	finally:
+		for key, value in old_values.items():
+			setattr(Config, key, value)
+
+	res = cmp.stats.to_dict()
+	res['params'] = params
+	res['elapsed'] = time.time() - start
+	res['speedup'] = 0.0
+	if res['start'] is not None and res['elapsed'] > 0:
+		res['speedup'] = (res['end'] - res['start']) / res['elapsed']
+	return res
+
+def _simulate_task(args):
+	record_file, params = args
+	try:
+		return simulate(record_file, params)
+	except Exception, ex:
+		logger.exception("Error in the simulation with params: %s" % params)
+		return {'params': params, 'error': str(ex)}
+
+def get_param_sets(sweep):
+	"""
+	Get all the combinations of the values of a sweep
+
+	Args:
+	- sweep: dict with the list of values of each Config key.
+
+	Return: list of dicts with the Config values of each combination
+	"""
+	keys = sorted(sweep.keys())
+	return [dict(zip(keys, values)) for values in itertools.product(*[sweep[key] for key in keys])]
+
+def run_sweep(record_file, sweep, processes = None):
+	"""
+	Replay a recording with all the combinations of the values of a sweep,
+	running the simulations in parallel in a pool of processes
+
+	Args:
+	- record_file: path of the recording file.
+	- sweep: dict with the list of values of each Config key.
+	- processes: number of processes (by default the number of CPUs).
+
+	Return: list with the results (see simulate) of each combination
+	"""
+	param_sets = get_param_sets(sweep)
+	tasks = [(record_file, params) for params in param_sets]
+	if processes == 1 or len(tasks) == 1:
+		return map(_simulate_task, tasks)
+	pool = multiprocessing.Pool(processes)
+	try:
+		return pool.map(_simulate_task, tasks, 1)
+	finally:
+		pool.terminate()
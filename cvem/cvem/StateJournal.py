@@ -0,0 +1,183 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import os
+import cPickle as pickle
+from config import logger
+
+class StateJournal:
+	"""
+	Store the monitor data in a snapshot file plus an append-only journal.
+	In each save only the changes since the previous one are appended to the journal,
+	and when the journal has too many records it is compacted into a new snapshot.
+	The snapshot is written to a temporary file and renamed, so it is never left
+	half-written, and the incomplete records at the end of the journal are ignored.
+	"""
+
+	FORMAT = "cvem-state"
+	""" Key that identifies the snapshot format (the old format has no header) """
+	VERSION = 1
+
+	def __init__(self, data_file, compact_records = 10000):
+		self.data_file = data_file
+		""" Path of the snapshot file """
+		self.journal_file = data_file + ".journal"
+		""" Path of the journal file """
+		self.compact_records = compact_records
+		""" Number of records of the journal to compact it into a new snapshot """
+		self.records = 0
+		""" Number of records in the journal """
+		self.generation = 0
+		""" Number of the current snapshot, the journal is only valid for the snapshot with the same number """
+		self._journal = None
+		self._saved_vms = {}
+		self._saved_migrations = {}
+
+	def load(self):
+		"""
+		Load the data from the snapshot and the journal.
+		It also loads the old format (the pickled dict of VMMonitorData objects
+		followed by the last_migration dict) and converts it to the new one.
+
+		Return: tuple (vm_states, last_migration) with a dict with the state tuple
+		of each VM ID and a dict with the last migration timestamp of each host ID
+		"""
+		vm_states = {}
+		last_migration = {}
+
+		if os.path.isfile(self.data_file):
+			data_file = open(self.data_file, 'rb')
+			try:
+				data = pickle.load(data_file)
+				if isinstance(data, dict) and data.get(self.FORMAT) == self.VERSION:
+					vm_states = data['vm_data']
+					last_migration = data['last_migration']
+					self.generation = data['generation']
+				else:
+					logger.info("Loading data file in the old format: " + self.data_file)
+					vm_states = dict((vm_id, vm_data.get_state()) for vm_id, vm_data in data.items())
+					last_migration = pickle.load(data_file)
+			finally:
+				data_file.close()
+		else:
+			logger.debug("No data file: " + self.data_file)
+
+		if os.path.isfile(self.journal_file):
+			records = 0
+			journal = open(self.journal_file, 'rb')
+			try:
+				while True:
+					try:
+						op, key, value = pickle.load(journal)
+					except EOFError:
+						break
+					except Exception:
+						logger.warn("Incomplete record in the journal file: " + self.journal_file + ". Ignoring the rest of the file.")
+						break
+					if op == 'gen':
+						if key != self.generation:
+							# The journal belongs to a previous snapshot
+							logger.debug("Old journal file: " + self.journal_file + ". Ignoring it.")
+							break
+					else:
+						self._apply(vm_states, last_migration, op, key, value)
+						records += 1
+			finally:
+				journal.close()
+			logger.debug("%d records loaded from the journal file: %s" % (records, self.journal_file))
+
+		# Start with a clean snapshot and an empty journal
+		self.compact(vm_states, last_migration)
+		return vm_states, last_migration
+
+	@staticmethod
+	def _apply(vm_states, last_migration, op, key, value):
+		if op == 'vm':
+			vm_states[key] = value
+		elif op == 'del':
+			vm_states.pop(key, None)
+		elif op == 'mig':
+			last_migration[key] = value
+		elif op == 'delmig':
+			last_migration.pop(key, None)
+
+	def save(self, vm_states, last_migration):
+		"""
+		Save the changes of the data since the previous save
+
+		Args:
+		- vm_states: dict with the state tuple of each VM ID.
+		- last_migration: dict with the last migration timestamp of each host ID.
+
+		Return: number of records appended to the journal
+		"""
+		records = []
+		for vm_id, state in vm_states.iteritems():
+			if self._saved_vms.get(vm_id) != state:
+				records.append(('vm', vm_id, state))
+		for vm_id in self._saved_vms:
+			if vm_id not in vm_states:
+				records.append(('del', vm_id, None))
+		for host_id, timestamp in last_migration.iteritems():
+			if self._saved_migrations.get(host_id) != timestamp:
+				records.append(('mig', host_id, timestamp))
+		for host_id in self._saved_migrations:
+			if host_id not in last_migration:
+				records.append(('delmig', host_id, None))
+
+		if not records:
+			return 0
+
+		if self._journal is None or self.records + len(records) > self.compact_records:
+			self.compact(vm_states, last_migration)
+			return 0
+
+		for record in records:
+			pickle.dump(record, self._journal, pickle.HIGHEST_PROTOCOL)
+			self._apply(self._saved_vms, self._saved_migrations, *record)
+		self._journal.flush()
+		os.fsync(self._journal.fileno())
+		self.records += len(records)
+		return len(records)
+
+	def compact(self, vm_states, last_migration):
+		"""
+		Write a new snapshot with all the data and empty the journal
+		"""
+		generation = self.generation + 1
+		data = {self.FORMAT: self.VERSION, 'generation': generation,
+			'vm_data': dict(vm_states), 'last_migration': dict(last_migration)}
+
+		tmp_file = self.data_file + ".tmp"
+		data_file = open(tmp_file, 'wb')
+		try:
+			pickle.dump(data, data_file, pickle.HIGHEST_PROTOCOL)
+			data_file.flush()
+			os.fsync(data_file.fileno())
+		finally:
+			data_file.close()
+		os.rename(tmp_file, self.data_file)
+
+		if self._journal is not None:
+			self._journal.close()
+		self.generation = generation
+		self._journal = open(self.journal_file, 'wb')
+		pickle.dump(('gen', generation, None), self._journal, pickle.HIGHEST_PROTOCOL)
+		self._journal.flush()
+		self.records = 0
+		self._saved_vms = data['vm_data']
+		self._saved_migrations = data['last_migration']
+		logger.debug("Data file compacted: " + self.data_file)
@@ -0,0 +1,247 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import heapq
+import threading
+from array import array
+
+class RingBuffer:
+	"""
+	Fixed size buffer of samples. Each field is stored in an array of 4 byte integers,
+	so each sample uses a fixed number of bytes (4 per field).
+	When the buffer is full the oldest sample is overwritten.
+	"""
+
+	FIELDS = ('timestamp', 'real_memory', 'total_memory', 'free_memory', 'new_mem')
+	""" Fields of each sample (new_mem is -1 if the memory has not been changed) """
+	TYPECODES = ('I', 'i', 'i', 'i', 'i')
+
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.columns = [array(typecode, [0]) * capacity for typecode in self.TYPECODES]
+		self.size = 0
+		""" Number of samples stored """
+		self.next = 0
+		""" Position to store the next sample """
+
+	def append(self, sample):
+		for column, value in zip(self.columns, sample):
+			column[self.next] = int(value)
+		self.next = (self.next + 1) % self.capacity
+		self.size = min(self.size + 1, self.capacity)
+
+	def set_last(self, field, value):
+		"""
+		Set a field of the last sample stored
+		"""
+		if self.size:
+			self.columns[self.FIELDS.index(field)][(self.next - 1) % self.capacity] = int(value)
+
+	def get_last(self):
+		if not self.size:
+			return None
+		pos = (self.next - 1) % self.capacity
+		return tuple(column[pos] for column in self.columns)
+
+	def get_samples(self, since = 0):
+		"""
+		Get the samples with timestamp >= since, from the oldest to the newest
+
+		Return: list of tuples with the values of the FIELDS
+		"""
+		res = []
+		times = self.columns[0]
+		for i in range(self.size):
+			pos = (self.next - self.size + i) % self.capacity
+			if times[pos] >= since:
+				res.append(tuple(column[pos] for column in self.columns))
+		return res
+
+	def get_bytes(self):
+		return sum(column.itemsize * len(column) for column in self.columns)
+
+class VMSeries:
+	"""
+	Samples of the memory of a VM: the last samples at full resolution, and the older ones
+	downsampled in buckets of downsample_interval secs (the average of the memory values
+	except the free memory, which is the minimum, and the last new_mem of the bucket)
+	"""
+
+	def __init__(self, samples, downsample_interval, downsampled_samples):
+		self.raw = RingBuffer(samples)
+		""" RingBuffer with the samples at full resolution """
+		self.downsampled = RingBuffer(downsampled_samples) if downsampled_samples > 0 else None
+		""" RingBuffer with the downsampled samples """
+		self.downsample_interval = downsample_interval
+		self._bucket = None
+		self._bucket_count = 0
+
+	def add(self, sample):
+		self.raw.append(sample)
+		if self.downsampled is not None:
+			self._add_to_bucket(sample)
+
+	def _add_to_bucket(self, sample):
+		timestamp, real_memory, total_memory, free_memory, new_mem = sample
+		bucket_time = int(timestamp) - int(timestamp) % self.downsample_interval
+		if self._bucket is not None and self._bucket[0] != bucket_time:
+			self._flush_bucket()
+		if self._bucket is None:
+			self._bucket = [bucket_time, 0, 0, free_memory, new_mem]
+			self._bucket_count = 0
+		self._bucket[1] += real_memory
+		self._bucket[2] += total_memory
+		self._bucket[3] = min(self._bucket[3], free_memory)
+		if new_mem >= 0:
+			self._bucket[4] = new_mem
+		self._bucket_count += 1
+
+	def _flush_bucket(self):
+		bucket_time, real_memory, total_memory, free_memory, new_mem = self._bucket
+		count = self._bucket_count
+		self.downsampled.append((bucket_time, real_memory / count, total_memory / count, free_memory, new_mem))
+		self._bucket = None
+
+	def set_new_mem(self, new_mem):
+		self.raw.set_last('new_mem', new_mem)
+		if self._bucket is not None:
+			self._bucket[4] = new_mem
+
+	def get_samples(self, since = 0):
+		"""
+		Get the samples with timestamp >= since: the samples at full resolution
+		and the downsampled ones older than them
+		"""
+		res = self.raw.get_samples(since)
+		if self.downsampled is not None:
+			oldest = res[0][0] if res else None
+			older = [sample for sample in self.downsampled.get_samples(since) if oldest is None or sample[0] < oldest]
+			res = older + res
+		return res
+
+	def get_bytes(self):
+		res = self.raw.get_bytes()
+		if self.downsampled is not None:
+			res += self.downsampled.get_bytes()
+		return res
+
+class TimeSeriesStore:
+	"""
+	Store of the memory samples of each VM in bounded ring buffers.
+	"""
+
+	def __init__(self, samples = 120, downsample_interval = 300, downsampled_samples = 288):
+		self.samples = samples
+		""" Number of samples at full resolution stored per VM """
+		self.downsample_interval = downsample_interval
+		""" Time (in secs) of each bucket of the downsampled samples """
+		self.downsampled_samples = downsampled_samples
+		""" Number of downsampled samples stored per VM """
+		self.series = {}
+		""" Dict with the VMSeries of each VM ID """
+		self._lock = threading.Lock()
+
+	def add_sample(self, vm_id, timestamp, real_memory, total_memory, free_memory, new_mem = -1):
+		"""
+		Add a sample of the memory of a VM.
+		The sample is ignored if it has the same timestamp than the previous one of the VM.
+		"""
+		with self._lock:
+			series = self.series.get(vm_id)
+			if series is None:
+				series = VMSeries(self.samples, self.downsample_interval, self.downsampled_samples)
+				self.series[vm_id] = series
+			last = series.raw.get_last()
+			if last and last[0] == int(timestamp):
+				return
+			series.add((timestamp, real_memory, total_memory, free_memory, new_mem))
+
+	def set_new_mem(self, vm_id, new_mem):
+		"""
+		Set the memory size decided for the VM in its last sample
+		"""
+		with self._lock:
+			if vm_id in self.series:
+				self.series[vm_id].set_new_mem(new_mem)
+
+	def query(self, vm_id, minutes, now):
+		"""
+		Get the samples of the last minutes of a VM
+
+		Args:
+		- vm_id: ID of the VM.
+		- minutes: number of minutes to get.
+		- now: current time.
+
+		Return: list of dicts with the FIELDS of each sample, from the oldest to the newest
+		"""
+		with self._lock:
+			if vm_id not in self.series:
+				return []
+			samples = self.series[vm_id].get_samples(now - minutes * 60)
+		return [dict(zip(RingBuffer.FIELDS, sample)) for sample in samples]
+
+	@staticmethod
+	def get_pressure(sample):
+		"""
+		Get the memory pressure of a sample: the percentage of used memory
+		"""
+		timestamp, real_memory, total_memory, free_memory, new_mem = sample
+		if total_memory <= 0:
+			return 0.0
+		return (total_memory - free_memory) * 100.0 / total_memory
+
+	def top_pressure(self, k, minutes = None, now = None):
+		"""
+		Get the VMs with more memory pressure
+
+		Args:
+		- k: number of VMs to get.
+		- minutes: if set, the average pressure of the last minutes is used instead of the last sample.
+		- now: current time (needed if minutes is set).
+
+		Return: list of tuples (vm_id, pressure) sorted by pressure
+		"""
+		pressures = []
+		with self._lock:
+			for vm_id, series in self.series.iteritems():
+				if minutes is None:
+					last = series.raw.get_last()
+					if last:
+						pressures.append((self.get_pressure(last), vm_id))
+				else:
+					samples = series.get_samples(now - minutes * 60)
+					if samples:
+						pressures.append((sum(self.get_pressure(sample) for sample in samples) / len(samples), vm_id))
+		return [(vm_id, pressure) for pressure, vm_id in heapq.nlargest(k, pressures)]
+
+	def retain(self, vm_ids):
+		"""
+		Delete the VMs that are not in vm_ids
+
+		Args:
+		- vm_ids: set with the IDs of the VMs to keep.
+		"""
+		with self._lock:
+			for vm_id in [vm_id for vm_id in self.series if vm_id not in vm_ids]:
+				del self.series[vm_id]
+
+	def get_bytes(self):
+		"""
+		Get the number of bytes used by the samples
+		"""
+		with self._lock:
+			return sum(series.get_bytes() for series in self.series.itervalues())
@@ -0,0 +1,255 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import json
+import logging
+import logging.handlers
+import random
+import threading
+import time
+import Queue
+from config import Config, logger
+
+class Span(object):
+	"""
+	Timed operation of a trace (a monitor loop, the evaluation of a VM, a call to the CMP, ...)
+	with a set of tags. It is used as a context manager: it is the current span of the thread
+	inside the with block and it is recorded when the block ends.
+	"""
+
+	__slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'start', 'tags')
+
+	def __init__(self, tracer, name, trace_id, parent_id, tags):
+		self.tracer = tracer
+		self.name = name
+		""" Name of the operation """
+		self.trace_id = trace_id
+		""" ID of the trace (the same in all the spans of a monitor loop) """
+		self.span_id = Tracer.new_id()
+		self.parent_id = parent_id
+		""" ID of the parent span (None in the root span of the trace) """
+		self.start = time.time()
+		self.tags = tags
+		""" Dict with the attributes of the span """
+
+	def set_tag(self, key, value):
+		self.tags[key] = value
+
+	def __enter__(self):
+		self.tracer._push(self)
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		if exc_type is not None:
+			self.tags["error"] = str(exc_value) or exc_type.__name__
+		self.tracer._pop(self)
+		self.tracer.record(self, time.time())
+		return False
+
+	def to_zipkin(self, end):
+		"""
+		Get the span in the Zipkin v2 JSON format
+		"""
+		res = {"traceId": self.trace_id, "id": self.span_id, "name": self.name,
+			"timestamp": int(self.start * 1000000), "duration": max(1, int((end - self.start) * 1000000)),
+			"localEndpoint": {"serviceName": self.tracer.service_name},
+			"tags": dict((key, str(value)) for key, value in self.tags.iteritems())}
+		if self.parent_id:
+			res["parentId"] = self.parent_id
+		return res
+
+class NoopSpan(object):
+	""" Span of the traces that are not sampled: it does nothing """
+
+	trace_id = None
+
+	def set_tag(self, key, value):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		return False
+
+NOOP_SPAN = NoopSpan()
+
+class TraceFileHandler(logging.handlers.RotatingFileHandler):
+	""" RotatingFileHandler that raises the errors writing the spans instead of printing them """
+	def handleError(self, record):
+		raise
+
+class TraceWriter(threading.Thread):
+	"""
+	Thread that writes the spans to a rotating file (one JSON span per line).
+	The spans are queued so the monitor threads never wait for the disk,
+	and they are dropped if the queue is full.
+	If a span can not be written the thread stops and the rest of spans are dropped.
+	"""
+
+	def __init__(self, trace_file, max_bytes, backups, queue_size = 10000):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.queue = Queue.Queue(queue_size)
+		self.dropped = 0
+		""" Number of spans dropped because the queue was full """
+		self.failed = False
+		""" A span could not be written, so the writer has stopped """
+		self.handler = TraceFileHandler(trace_file, maxBytes=max_bytes, backupCount=backups)
+		self.handler.setFormatter(logging.Formatter("%(message)s"))
+		self.trace_logger = logging.getLogger('monitor.tracing')
+		self.trace_logger.propagate = False
+		self.trace_logger.setLevel(logging.INFO)
+		self.trace_logger.addHandler(self.handler)
+
+	def write(self, span):
+		if self.failed:
+			return
+		try:
+			self.queue.put_nowait(span)
+		except Queue.Full:
+			self.dropped += 1
+
+	def run(self):
+		while True:
+			span = self.queue.get()
+			try:
+				self.trace_logger.info(json.dumps(span, separators=(',', ':')))
+			except Exception:
+				logger.exception("Error writing the span to the trace file. Disabling the tracing.")
+				self.failed = True
+				try:
+					self.handler.close()
+				except Exception:
+					pass
+				return
+
+class Tracer:
+	"""
+	Create the spans of the monitor loops. A trace is started in each monitor loop
+	and only TRACE_SAMPLE_RATE of them are sampled, the spans of the rest of them are
+	NoopSpans, so the tracing can stay enabled with a low overhead.
+	The new spans are children of the current span of the thread or, if the thread
+	has no span (i.e. the threads of the ThreadPool), of the root span of the active trace.
+	"""
+
+	def __init__(self, sample_rate = 0.0, trace_file = None, max_bytes = 10485760, backups = 3, service_name = "cvem"):
+		self.sample_rate = sample_rate
+		""" Fraction of the traces that are recorded (0-1) """
+		self.trace_file = trace_file
+		self.max_bytes = max_bytes
+		self.backups = backups
+		self.service_name = service_name
+		self.writer = None
+		""" TraceWriter of the spans (created with the first sampled trace) """
+		self.disabled = False
+		""" The trace file could not be written, so no span is recorded """
+		self.active_root = None
+		""" Root span of the active trace """
+		self._local = threading.local()
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def new_id():
+		return "%016x" % random.getrandbits(64)
+
+	def _get_stack(self):
+		stack = getattr(self._local, "stack", None)
+		if stack is None:
+			stack = self._local.stack = []
+		return stack
+
+	def _push(self, span):
+		self._get_stack().append(span)
+		if span.parent_id is None:
+			self.active_root = span
+
+	def _pop(self, span):
+		stack = self._get_stack()
+		if stack and stack[-1] is span:
+			stack.pop()
+		if self.active_root is span:
+			self.active_root = None
+
+	def current(self):
+		"""
+		Get the current span of the thread (or the root span of the active trace)
+		"""
+		stack = getattr(self._local, "stack", None)
+		if stack:
+			return stack[-1]
+		return self.active_root
+
+	def start_trace(self, name, **tags):
+		"""
+		Start a new trace, that is sampled with probability sample_rate
+
+		Return: the root Span of the trace or NOOP_SPAN if it is not sampled
+		"""
+		if self.sample_rate <= 0 or not self.trace_file or random.random() >= self.sample_rate:
+			return NOOP_SPAN
+		return Span(self, name, self.new_id(), None, tags)
+
+	def span(self, name, **tags):
+		"""
+		Create a child span of the current one
+
+		Return: the new Span or NOOP_SPAN if there is no sampled trace active
+		"""
+		parent = self.current()
+		if parent is None:
+			return NOOP_SPAN
+		return Span(self, name, parent.trace_id, parent.span_id, tags)
+
+	def tag(self, key, value):
+		"""
+		Set a tag in the current span of the thread (if any)
+		"""
+		stack = getattr(self._local, "stack", None)
+		if stack:
+			stack[-1].tags[key] = value
+
+	def record(self, span, end):
+		if self.disabled:
+			return
+		if self.writer is None:
+			with self._lock:
+				if self.disabled:
+					return
+				if self.writer is None:
+					try:
+						writer = TraceWriter(self.trace_file, self.max_bytes, self.backups)
+						writer.start()
+						self.writer = writer
+					except Exception:
+						# The rest of spans of the active traces are dropped
+						logger.exception("Error opening the trace file: %s. Disabling the tracing." % self.trace_file)
+						self.disable()
+						return
+		if self.writer.failed:
+			self.disable()
+			return
+		self.writer.write(span.to_zipkin(end))
+
+	def disable(self):
+		"""
+		Stop recording the spans (after an error with the trace file)
+		"""
+		self.disabled = True
+		self.sample_rate = 0
+
+tracer = Tracer(Config.TRACE_SAMPLE_RATE, Config.TRACE_FILE, Config.TRACE_MAX_BYTES, Config.TRACE_BACKUPS)
+""" Tracer of the monitor """
@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import threading
+
+class VMDataStore:
+	"""
+	Container of the monitoring information of the VMs indexed by VM ID.
+	The VMs are split in shards, each one with its own lock, so the threads
+	that monitor different VMs do not block each other (in most of the cases).
+	"""
+
+	def __init__(self, factory, shards = 64):
+		self.factory = factory
+		""" Function to create the monitoring information of a new VM: factory(vm_id) """
+		self._shards = [{} for _ in range(max(1, shards))]
+		self._locks = [threading.RLock() for _ in range(max(1, shards))]
+
+	def _index(self, vm_id):
+		return hash(vm_id) % len(self._shards)
+
+	def lock(self, vm_id):
+		"""
+		Get the lock that protects the monitoring information of the VM
+		"""
+		return self._locks[self._index(vm_id)]
+
+	def get_or_create(self, vm_id):
+		"""
+		Get the monitoring information of the VM, creating it if it does not exist
+		"""
+		index = self._index(vm_id)
+		with self._locks[index]:
+			shard = self._shards[index]
+			if vm_id not in shard:
+				shard[vm_id] = self.factory(vm_id)
+			return shard[vm_id]
+
+	def get(self, vm_id, default = None):
+		return self._shards[self._index(vm_id)].get(vm_id, default)
+
+	def __getitem__(self, vm_id):
+		return self._shards[self._index(vm_id)][vm_id]
+
+	def __setitem__(self, vm_id, vm_data):
+		index = self._index(vm_id)
+		with self._locks[index]:
+			self._shards[index][vm_id] = vm_data
+
+	def __delitem__(self, vm_id):
+		index = self._index(vm_id)
+		with self._locks[index]:
+			del self._shards[index][vm_id]
+
+	def __contains__(self, vm_id):
+		return vm_id in self._shards[self._index(vm_id)]
+
+	def __len__(self):
+		return sum(len(shard) for shard in self._shards)
+
+	def keys(self):
+		res = []
+		for shard in self._shards:
+			res.extend(shard.keys())
+		return res
+
+	def items(self):
+		res = []
+		for shard in self._shards:
+			res.extend(shard.items())
+		return res
+
+	def map(self, function):
+		"""
+		Apply a function to the monitoring information of all the VMs, holding the lock of each shard
+
+		Return: dict with the result of the function for each VM ID
+		"""
+		res = {}
+		for shard, lock in zip(self._shards, self._locks):
+			with lock:
+				for vm_id, vm_data in shard.iteritems():
+					res[vm_id] = function(vm_data)
+		return res
+
+	def retain(self, vm_ids):
+		"""
+		Delete the monitoring information of the VMs that are not in vm_ids
+
+		Args:
+		- vm_ids: set with the IDs of the VMs to keep.
+
+		Return: list with the IDs of the deleted VMs
+		"""
+		removed = []
+		for shard, lock in zip(self._shards, self._locks):
+			with lock:
+				old_ids = [vm_id for vm_id in shard if vm_id not in vm_ids]
+				for vm_id in old_ids:
+					del shard[vm_id]
+				removed.extend(old_ids)
+		return removed
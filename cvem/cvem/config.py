@@ -39,6 +39,9 @@ def parse_options(config, section_name, config_class):
 class Config:
 	CVEM_PATH = os.path.dirname(os.path.realpath(__file__ + "/.."))
 	DATA_FILE = CVEM_PATH + "/cvem.dat"
+	# Number of changes stored in the journal of the DATA_FILE (DATA_FILE.journal)
+	# before compacting them in a new DATA_FILE
+	DATA_COMPACT_RECORDS = 10000
 	# Amount of free Memory reserved by the SO (aprox.) 
 	SYS_MEM_OFFSET = 80000
 	# Minimum amount of memory to assign to a VM.
@@ -49,16 +52,98 @@ class Config:
 	MEM_OVER = 30.0
 	# The Memory Overprovisioning Percentage margin
 	MEM_MARGIN = 5
+	# Policy to size the memory of the VMs (it can be set per VM with the MEM_POLICY attribute):
+	#  reactive: use only the current memory values of the VM
+	#  predictive: also size the VM ahead of the peak of used memory forecasted within PREDICTIVE_HORIZON
+	MEM_POLICY = 'reactive'
+	# Time (in secs) ahead to forecast the used memory in the predictive policy
+	PREDICTIVE_HORIZON = 60.0
+	# Smoothing factors of the level and the trend of the used memory in the predictive policy (0-1)
+	PREDICTIVE_ALPHA = 0.5
+	PREDICTIVE_BETA = 0.3
 	# Cooldown Time (in secs)
 	COOLDOWN = 10.0
 	# Sleep time between each monitor loop (in secs)
 	DELAY = 5
+	# Time (in secs) to evaluate the VMs in each monitor loop (0 to disable it). The VMs are evaluated
+	# in chunks, the ones with less free memory first, and the VMs not evaluated when the time
+	# is over are deferred to the next loop (where they are evaluated before the healthy ones)
+	CYCLE_BUDGET = 0.0
+	# Number of VMs evaluated between two checks of the CYCLE_BUDGET
+	CYCLE_BUDGET_CHUNK = 50
+	# Skip the evaluation of the VMs whose metrics (and the free memory of their host) have not changed
+	# since their last evaluation, if it was in band or with a too small change
+	SKIP_UNCHANGED_VMS = False
+	# Age (in secs) of the metrics published by a VM (its TIMESTAMP) to consider them stale (0 to disable it).
+	# The VMs with stale metrics are evaluated after the ones with fresh metrics
+	STALE_METRICS_AGE = 0.0
+	# Action with the VMs with stale metrics:
+	#  skip: do not evaluate them
+	#  soften: evaluate them but only increase their memory
+	STALE_METRICS_POLICY = 'soften'
+	# Evaluate each VM when it is needed instead of in every monitor loop: soon if its free memory
+	# is near or outside MEM_OVER +- MEM_MARGIN or changing fast, and less often while it is stable
+	ADAPTIVE_SCHEDULER = False
+	# Minimum and maximum time (in secs) between two evaluations of a VM (if ADAPTIVE_SCHEDULER is enabled)
+	SCHEDULER_MIN_INTERVAL = 5.0
+	SCHEDULER_MAX_INTERVAL = 120.0
+	# Factor to increase the time between evaluations of a VM each time it is stable
+	SCHEDULER_BACKOFF = 2.0
+	# Change of the free memory percentage of a VM between two evaluations considered fast
+	# (also the distance to the limits of MEM_OVER +- MEM_MARGIN considered near)
+	SCHEDULER_FAST_CHANGE = 5.0
 	# Cooldown migration time (in secs)
 	MIGRATION_COOLDOWN = 45
 	# Host memory margin (in KB) to migrate VM to another host
 	HOST_MEM_MARGIN = 102400
+	# Time (in secs) to reuse the snapshot of the host pool since the oldest
+	# update made by the CMP (0 to get a new snapshot in every monitor loop)
+	HOST_POOL_TTL = 0.0
+	# Monitor only the VMs affected by the events received (i.e. from the CMP hooks)
+	# instead of all the VMs in every monitor loop
+	EVENT_FEED = False
+	# Address and port to listen for the events
+	EVENT_FEED_ADDRESS = "127.0.0.1"
+	EVENT_FEED_PORT = 8655
+	# Time (in secs) between two full resyncs of all the VMs in the event mode
+	EVENT_RESYNC_INTERVAL = 300.0
+	# Keep the last memory samples of each VM (and the memory size decided) in memory,
+	# and serve them in the metrics server in /timeseries/<vm_id> and /timeseries/top
+	TIMESERIES = False
+	# Number of samples of each VM stored at full resolution
+	TIMESERIES_SAMPLES = 60
+	# Time (in secs) of each downsampled sample of the older samples
+	TIMESERIES_DOWNSAMPLE_INTERVAL = 300
+	# Number of downsampled samples of each VM stored
+	TIMESERIES_DOWNSAMPLED_SAMPLES = 144
+	# Port to serve the metrics of the monitor in the Prometheus format in /metrics (0 to disable it)
+	METRICS_PORT = 0
+	# Address to serve the metrics
+	METRICS_ADDRESS = "127.0.0.1"
+	# Fraction of the monitor loops (0-1) traced with the spans of each VM and each call
+	# to the CMP and to the change memory command (0 to disable the tracing)
+	TRACE_SAMPLE_RATE = 0.0
+	# File to write the spans in the Zipkin v2 JSON format (one span per line)
+	TRACE_FILE = "/var/log/cvem_trace.json"
+	# Maximum size (in bytes) of the TRACE_FILE before rotating it and number of rotated files kept
+	TRACE_MAX_BYTES = 10485760
+	TRACE_BACKUPS = 3
+	# File to record the VMs and hosts of each monitor loop, to replay them in the simulator
+	# (empty to disable it, the loops of the EVENT_FEED mode that only monitor some VMs are not recorded)
+	RECORD_FILE = ""
 	# Maximum number of threads to launch in the monitor
 	MAX_THREADS = 1
+	# Number of shards (each one with its own lock) of the monitoring information of the VMs
+	VM_DATA_SHARDS = 64
+	# Number of worker processes to evaluate the VMs, sharded by host ID (0 to evaluate them in the
+	# monitor process). It is not used with EVENT_FEED or STREAM_VM_LIST.
+	# The migrations are made by the monitor process (see MIGRATION_PLANNER) after all the VMs are evaluated
+	PROCESS_SHARDS = 0
+	# Parse the VM list of the CMP incrementally and monitor the VMs in chunks,
+	# to avoid having all the VMs in memory
+	STREAM_VM_LIST = False
+	# Number of VMs of each chunk when STREAM_VM_LIST is enabled
+	STREAM_CHUNK_SIZE = 100
 	# To filter the VMs by user
 	USER_FILTER = None
 	# Flag to make just a test without modify any VM
@@ -70,10 +155,46 @@ class Config:
 	#  {vmid}: ID of the VM
 	#  {newmemory}: Amount of memory to assign to the VM
 	CHANGE_MEMORY_CMD = "virsh -c 'qemu+ssh://{hostname}/system' setmem one-{vmid} {newmemory}"
+	# Backend used to change the memory of the VMs:
+	#  command: execute the CHANGE_MEMORY_CMD command
+	#  libvirt: use the libvirt API keeping one connection open to each host
+	CHANGE_MEMORY_BACKEND = 'command'
+	# URI to connect with libvirt to each host, parameters:
+	#  {hostname}: hostname where the VM is allocated
+	LIBVIRT_URI = "qemu+ssh://{hostname}/system"
+	# Name of the libvirt domain of the VMs, parameters:
+	#  {vmid}: ID of the VM
+	LIBVIRT_DOMAIN = "one-{vmid}"
+	# Compute the new memory size of all the VMs of each monitor loop in one vectorized pass
+	# (it requires NumPy, otherwise the VMs are computed one by one) and only use the threads for the actuation
+	BATCH_SIZING = False
+	# Apply the memory changes at the end of each monitor loop, sending all the changes
+	# of each host together
+	BATCH_ACTUATION = False
+	# Command to change the memory of a set of VMs of a host in one session,
+	# it receives a script with one CHANGE_MEMORY_BATCH_LINE per VM in the stdin, parameters:
+	#  {hostname}: hostname where the VMs are allocated
+	# If it is empty CHANGE_MEMORY_CMD is executed for each VM
+	CHANGE_MEMORY_BATCH_CMD = ""
+	# Line of the script to change the memory of each VM, parameters:
+	#  {vmid}: ID of the VM
+	#  {newmemory}: Amount of memory to assign to the VM
+	CHANGE_MEMORY_BATCH_LINE = "virsh setmem one-{vmid} {newmemory}"
+	# Apply the memory changes at the end of each monitor loop running all the commands of the
+	# command backend concurrently from one thread, without blocking the monitor threads
+	# (one CHANGE_MEMORY_BATCH_CMD per host or, if it is empty, one CHANGE_MEMORY_CMD per VM)
+	ASYNC_ACTUATION = False
+	# Maximum number of commands running at the same time (if ASYNC_ACTUATION is enabled)
+	ACTUATION_CONCURRENCY = 100
+	# Time (in secs) to kill a command that has not finished (if ASYNC_ACTUATION is enabled, 0 to disable it)
+	ACTUATION_TIMEOUT = 60.0
 	# Class child of cvem Monitor to be executed
 	MONITOR_CLASS = 'connectors.one.OpenNebula.MonitorONE'
 	# Enable the migration of the VMs in case of the host has not enough free memory
 	MIGRATION = True
+	# Plan the migrations of all the VMs that can not grow together at the end of each monitor loop,
+	# instead of migrating a VM as soon as another one can not grow
+	MIGRATION_PLANNER = False
 	# In case MIGRATION is disabled force increasing the memory of the VM
 	# although the host has not enough free memory
 	FORCE_INCREASE_MEMORY = False
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+"""
+Replay a recording of the monitor (see RECORD_FILE) with different Config values.
+Each KEY=VALUE[,VALUE...] argument sets the values of a Config key, and all the
+combinations are simulated in parallel. The results are printed in JSON in the stdout
+(and a summary in the stderr).
+The VMs start the simulation with their original memory (the one allocated by the CMP),
+and the memory saved is computed with respect to it, so the changes made by the monitor
+that made the recording are not counted as saved.
+
+Usage: cvemsim.py [--processes N] [--output FILE] record_file [KEY=VALUE[,VALUE...] ...]
+Example: cvemsim.py /var/log/cvem_record.gz MEM_OVER=20,30,40 COOLDOWN=10,60
+"""
+
+import sys
+import json
+import logging
+from optparse import OptionParser
+from cvem.config import Config, logger
+from cvem.Simulator import run_sweep
+
+def parse_value(key, value):
+	"""
+	Convert a value to the type of the Config key
+	"""
+	default = getattr(Config, key)
+	if isinstance(default, bool):
+		return value.lower() in ["1", "yes", "true", "on"]
+	elif isinstance(default, float):
+		return float(value)
+	elif isinstance(default, int):
+		return int(value)
+	else:
+		return value
+
+if __name__ == "__main__":
+	parser = OptionParser(usage="%prog [options] record_file [KEY=VALUE[,VALUE...] ...]")
+	parser.add_option("--processes", type="int", default=None, help="number of processes (by default the number of CPUs)")
+	parser.add_option("--output", default=None, help="file to write the JSON results")
+	parser.add_option("--log-level", default="WARNING", help="level of the monitor log during the simulations")
+	(options, args) = parser.parse_args()
+	if not args:
+		parser.error("The recording file is needed")
+
+	sweep = {}
+	for arg in args[1:]:
+		if "=" not in arg:
+			parser.error("Invalid argument: %s" % arg)
+		key, values = arg.split("=", 1)
+		key = key.upper()
+		if not hasattr(Config, key):
+			parser.error("Unknown Config key: %s" % key)
+		sweep[key] = [parse_value(key, value) for value in values.split(",")]
+
+	logger.setLevel(getattr(logging, options.log_level.upper()))
+	results = run_sweep(args[0], sweep, options.processes)
+
+	sys.stderr.write("%-40s %8s %8s %10s %8s %8s %14s %9s\n" % ("params", "resizes", "migr.", "near OOM", "OOM", "saved %", "saved (KB)", "speedup"))
+	for res in results:
+		params = " ".join("%s=%s" % item for item in sorted(res['params'].items()))
+		if 'error' in res:
+			sys.stderr.write("%-40s error: %s\n" % (params, res['error']))
+		else:
+			sys.stderr.write("%-40s %8d %8d %10d %8d %8.2f %14d %9.1f\n" % (params, res['resizes'], res['migrations'],
+					res['near_oom'], res['oom'], res['memory_saved_pct'], res['memory_saved'], res['speedup']))
+
+	out = json.dumps(results, indent=1, sort_keys=True)
+	if options.output:
+		with open(options.output, "w") as f:
+			f.write(out + "\n")
+	print out
@@ -33,7 +33,7 @@ setup(name="CVEM", version="0.2.1",
 	author_email='micafer1@upv.es',
 	url='https://github.com/grycap/cloudvamp',
 	packages=['cvem', 'connectors', 'connectors.one'],
-	scripts=["cvemd.py"],
+	scripts=["cvemd.py", "cvemsim.py"],
 	data_files=datafiles,
 	license="Apache License, Version 2.0, https://www.apache.org/licenses/LICENSE-2.0",
 	long_description="",
@@ -0,0 +1,147 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import sys
+import types
+import unittest
+from cvem.CMPInfo import HostInfo
+from cvem.Actuator import LibvirtActuator
+from test.test_monitor import ConfigTestCase
+
+try:
+	import libvirt
+except ImportError:
+	libvirt = None
+
+class FakeLibvirtError(Exception):
+	pass
+
+class FakeDomain:
+	def __init__(self, conn):
+		self.conn = conn
+
+	def setMemory(self, memory):
+		if self.conn.broken:
+			raise FakeLibvirtError("Cannot write data: Broken pipe")
+		if memory > self.conn.max_memory:
+			raise FakeLibvirtError("invalid argument: cannot set memory higher than max memory")
+		self.conn.memory = memory
+
+class FakeConnection:
+	def __init__(self, uri, broken):
+		self.uri = uri
+		self.broken = broken
+		self.closed = False
+		self.max_memory = 4194304
+		self.memory = None
+
+	def lookupByName(self, name):
+		return FakeDomain(self)
+
+	def isAlive(self):
+		return not self.broken
+
+	def close(self):
+		self.closed = True
+
+class FakeLibvirt(types.ModuleType):
+	""" libvirt module whose first connections are broken """
+	def __init__(self, broken = 0):
+		types.ModuleType.__init__(self, "libvirt")
+		self.libvirtError = FakeLibvirtError
+		self.broken = broken
+		self.connections = []
+
+	def open(self, uri):
+		conn = FakeConnection(uri, len(self.connections) < self.broken)
+		self.connections.append(conn)
+		return conn
+
+class TestLibvirtActuatorReconnect(ConfigTestCase):
+
+	def setUp(self):
+		ConfigTestCase.setUp(self)
+		self.set_config(LIBVIRT_URI = "qemu+ssh://{hostname}/system", LIBVIRT_DOMAIN = "one-{vmid}")
+		self._libvirt = sys.modules.get("libvirt")
+
+	def tearDown(self):
+		if self._libvirt is None:
+			sys.modules.pop("libvirt", None)
+		else:
+			sys.modules["libvirt"] = self._libvirt
+		ConfigTestCase.tearDown(self)
+
+	def create_actuator(self, broken):
+		fake = FakeLibvirt(broken)
+		sys.modules["libvirt"] = fake
+		return fake, LibvirtActuator()
+
+	def test_reconnect_once(self):
+		fake, actuator = self.create_actuator(1)
+
+		self.assertTrue(actuator.change_memory(1, HostInfo(0, "host-0"), 2097152))
+
+		self.assertEqual(len(fake.connections), 2)
+		self.assertTrue(fake.connections[0].closed)
+		self.assertEqual(fake.connections[1].uri, "qemu+ssh://host-0/system")
+		self.assertEqual(fake.connections[1].memory, 2097152)
+
+	def test_reconnect_fails(self):
+		fake, actuator = self.create_actuator(2)
+
+		self.assertFalse(actuator.change_memory(1, HostInfo(0, "host-0"), 2097152))
+
+		# Only one reconnection per change
+		self.assertEqual(len(fake.connections), 2)
+		self.assertTrue(actuator.change_memory(1, HostInfo(0, "host-0"), 2097152))
+		self.assertEqual(len(fake.connections), 3)
+
+	def test_error_without_reconnect(self):
+		fake, actuator = self.create_actuator(0)
+
+		res = actuator.change_memory_batch(HostInfo(0, "host-0"), [(1, 8388608), (2, 1048576)])
+
+		# The connection is alive, so the error is not retried
+		self.assertEqual(res, {1: False, 2: True})
+		self.assertEqual(len(fake.connections), 1)
+		self.assertFalse(fake.connections[0].closed)
+
+@unittest.skipIf(libvirt is None, "The libvirt python bindings are not installed")
+class TestLibvirtActuator(ConfigTestCase):
+
+	def setUp(self):
+		ConfigTestCase.setUp(self)
+		self.set_config(LIBVIRT_URI = "test:///default", LIBVIRT_DOMAIN = "test")
+		self.actuator = LibvirtActuator()
+		self.host = HostInfo(0, "host-0")
+
+	def get_memory(self):
+		return self.actuator.connections[self.host.name].lookupByName("test").info()[2]
+
+	def test_change_memory(self):
+		self.assertTrue(self.actuator.change_memory(1, self.host, 2097152))
+		self.assertEqual(self.get_memory(), 2097152)
+
+	def test_change_memory_batch(self):
+		res = self.actuator.change_memory_batch(self.host, [(1, 1048576), (2, 3145728)])
+
+		self.assertEqual(res, {1: True, 2: True})
+		# All the VMs are the same test domain
+		self.assertEqual(self.get_memory(), 3145728)
+		self.assertFalse(self.actuator.change_memory(1, self.host, 1 << 40))
+
+if __name__ == '__main__':
+	unittest.main()
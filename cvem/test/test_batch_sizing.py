@@ -0,0 +1,98 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import unittest
+from cvem import BatchSizing
+from test.test_monitor import ConfigTestCase
+
+NOW = 1500000000.0
+
+class TestSizeVMs(ConfigTestCase):
+
+	def setUp(self):
+		ConfigTestCase.setUp(self)
+		self.set_config(MEM_OVER = 30.0, MEM_MARGIN = 5, COOLDOWN = 10.0, MEM_MIN = 262144,
+					MIN_FREE_MEMORY = 20000, MEM_DIFF_TO_CHANGE = 1024)
+
+	def get_inputs(self, free, total, real = None, allocated = 4194304, min_free = 20000, mem_over = 30.0,
+				mem_diff = None, last_set_mem = None, original_mem = None, count = 0, forecast = None):
+		if real is None:
+			real = total + 10240
+		return (free, total, real, allocated, min_free, mem_over, mem_diff, last_set_mem, original_mem, count, forecast)
+
+	def get_cases(self):
+		modified = dict(mem_diff = 10240, last_set_mem = NOW - 60, original_mem = 4194304)
+		return [
+			# In the band
+			self.get_inputs(629145, 2097152),
+			# Never modified (None values) with too much free memory
+			self.get_inputs(1572864, 2097152),
+			# In the cooldown period
+			self.get_inputs(1572864, 2097152, mem_diff = 10240, last_set_mem = NOW - 1, original_mem = 4194304),
+			# Modified long ago with a stale mem_diff
+			self.get_inputs(1572864, 2097152, mem_diff = 51200, last_set_mem = NOW - 86400, original_mem = 4194304),
+			# Exponential backoff without free memory
+			self.get_inputs(10000, 2097152, count = 0, **modified),
+			self.get_inputs(10000, 2097152, count = 1, **modified),
+			self.get_inputs(10000, 2097152, count = 2, **modified),
+			# Specific min free memory and mem over ratio of the VM
+			self.get_inputs(40000, 2097152, min_free = 50000, mem_over = 45.5, **modified),
+			self.get_inputs(1048576, 2097152, min_free = 50000, mem_over = 45.5, **modified),
+			# Clamped to MEM_MIN
+			self.get_inputs(2000000, 2097152, **modified),
+			# Clamped to the original memory
+			self.get_inputs(102400, 4194304, **modified),
+			self.get_inputs(102400, 4194304, mem_over = 60.0, **modified),
+			# Too small difference to change (it is already at the original memory)
+			self.get_inputs(102400, 2097152, mem_diff = 10240, last_set_mem = NOW - 60, original_mem = 2107392),
+			# Predictive policy: the forecasted usage makes it grow or limits the shrink
+			self.get_inputs(629145, 2097152, forecast = 1900000, **modified),
+			self.get_inputs(1572864, 2097152, forecast = 1048576, **modified),
+			self.get_inputs(1572864, 2097152, forecast = 100000, **modified),
+			self.get_inputs(1572864, 2097152, forecast = 1048576),
+			# Not valid values
+			self.get_inputs(0, 0),
+			self.get_inputs(1572864, 2097152, mem_over = 100.0, **modified),
+		]
+
+	def test_same_decisions(self):
+		inputs = self.get_cases()
+
+		decisions = BatchSizing.size_vms(inputs, NOW)
+
+		self.assertEqual(len(decisions), len(inputs))
+		for i, vm_inputs in enumerate(inputs):
+			try:
+				expected = BatchSizing.size_vm(vm_inputs, NOW)
+			except Exception:
+				expected = None
+			self.assertEqual(decisions[i], expected, "Different decision of the VM %d: %s" % (i, vm_inputs))
+
+	def test_cases(self):
+		decisions = [BatchSizing.size_vm(vm_inputs, NOW) for vm_inputs in self.get_cases()[:-2]]
+
+		self.assertFalse(decisions[0].out_of_band)
+		self.assertTrue(decisions[1].init_state and decisions[1].in_cooldown)
+		self.assertTrue(decisions[2].in_cooldown)
+		self.assertEqual([decision.no_free_memory_count for decision in decisions[4:7]], [1, 2, 0])
+		self.assertEqual(decisions[6].new_mem, 4194304)
+		self.assertEqual(decisions[9].new_mem, 262144 + 10240)
+		self.assertEqual(decisions[11].new_mem, 4194304)
+		self.assertFalse(decisions[12].change)
+		self.assertTrue(decisions[13].out_of_band and decisions[13].new_mem > 2097152 + 10240)
+
+if __name__ == '__main__':
+	unittest.main()
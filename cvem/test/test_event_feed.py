@@ -0,0 +1,99 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import unittest
+from cvem.CMPInfo import VirtualMachineInfo, HostInfo
+from cvem.Monitor import SerialPool
+from cvem.EventFeed import EventFeed, EventPublisher
+from test.test_monitor import FakeCMP, FakeMonitor, ConfigTestCase
+
+class EventCMP(FakeCMP):
+	def get_vm_info(self, vm_id):
+		for vm in self.vms:
+			if vm.id == vm_id:
+				return vm
+		return None
+
+class EventMonitor(FakeMonitor):
+	""" Monitor that records the VMs evaluated """
+	def __init__(self, cmp):
+		FakeMonitor.__init__(self, cmp)
+		self.evaluated = []
+
+	def get_host_vms(self, host_info, all_vms):
+		return [vm for vm in self.cmp.vms if vm.host.id == host_info.id]
+
+	def monitor_vm(self, vm, all_vms, decision = None, now = None):
+		self.evaluated.append(vm.id)
+		FakeMonitor.monitor_vm(self, vm, all_vms, decision, now)
+
+class TestEventFeed(unittest.TestCase):
+
+	def setUp(self):
+		self.feed = EventFeed("127.0.0.1", 0)
+		self.feed.start()
+		self.publisher = EventPublisher("127.0.0.1", self.feed.port)
+
+	def tearDown(self):
+		self.feed.stop()
+
+	def wait_events(self, received):
+		deadline = time.time() + 5
+		while self.feed.received < received and time.time() < deadline:
+			time.sleep(0.01)
+
+	def test_coalesce_events(self):
+		self.publisher.publish([("VM", 1), ("HOST", 0), ("VM", "one"), ("VM", 1)])
+		self.publisher.publish([("DISK", 3), ("vm", 5), ("RESYNC", None), ("HOST", 0)])
+		self.wait_events(6)
+
+		self.assertEqual(self.feed.get_events(0), (set([1, 5]), set([0]), True))
+		self.assertEqual(self.feed.received, 6)
+		self.assertEqual(self.feed.get_events(0.01), (set(), set(), False))
+
+	def test_invalid_events(self):
+		for line in ["", "VM", "VM 1 2", "HOST x", "RESYNC 1"]:
+			self.assertFalse(self.feed.add_event(line))
+		self.assertEqual(self.feed.received, 0)
+
+class TestMonitorEventVMs(ConfigTestCase):
+
+	def test_affected_vms(self):
+		self.set_config(ADAPTIVE_SCHEDULER = False, SKIP_UNCHANGED_VMS = False, STALE_METRICS_AGE = 0.0,
+					CYCLE_BUDGET = 0.0, BATCH_ACTUATION = False, ASYNC_ACTUATION = False,
+					MIGRATION_PLANNER = False, USER_FILTER = None, ONLY_TEST = True)
+		hosts = [HostInfo(host_id, "host-%d" % host_id) for host_id in range(2)]
+		for host in hosts:
+			host.free_memory = 16777216
+		vms = []
+		for vm_id, host_id in enumerate([0, 1, 0, 0, 1, 1]):
+			vm = VirtualMachineInfo(vm_id, hosts[host_id], 2097152)
+			vm.set_memory_values(2097152, 2097152, 1048576)
+			vm.timestamp = time.time()
+			vms.append(vm)
+		vms[3].active = False
+		vms[5].active = False
+		monitor = EventMonitor(EventCMP(hosts, vms))
+
+		# The VMs of the host 0 and the VMs 4 and 5 of the host 1
+		monitored = monitor.monitor_event_vms(SerialPool(), set([4, 5]), set([0]))
+
+		self.assertEqual(sorted(monitored), [0, 2, 4])
+		self.assertEqual(sorted(monitor.evaluated), [0, 2, 4])
+
+if __name__ == '__main__':
+	unittest.main()
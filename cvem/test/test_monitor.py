@@ -0,0 +1,152 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import unittest
+import threading
+from cvem.config import Config
+from cvem.CMPInfo import CMPInfo, VirtualMachineInfo, HostInfo
+from cvem.Monitor import Monitor, SerialPool
+
+class FakeCMP(CMPInfo):
+	def __init__(self, hosts = None, vms = None):
+		self.hosts = hosts or []
+		self.vms = vms or []
+
+	def get_vm_list(self):
+		return self.vms
+
+	def get_host_list(self):
+		return self.hosts
+
+	def get_host_info(self, host_id):
+		for host in self.hosts:
+			if host.id == host_id:
+				return host
+		return None
+
+class FakeMonitor(Monitor):
+	""" Monitor that does not store the data """
+	def load_data(self):
+		pass
+
+	def save_data(self):
+		pass
+
+	@staticmethod
+	def host_has_memory_free(host_info, free_memory):
+		return host_info.free_memory - free_memory > Config.HOST_MEM_MARGIN
+
+class ConfigTestCase(unittest.TestCase):
+	""" Test case that restores the Config values set with set_config """
+	def setUp(self):
+		self._old_config = {}
+
+	def tearDown(self):
+		for key, value in self._old_config.items():
+			setattr(Config, key, value)
+
+	def set_config(self, **values):
+		for key, value in values.items():
+			if key not in self._old_config:
+				self._old_config[key] = getattr(Config, key)
+			setattr(Config, key, value)
+
+def create_vm(vm_id, host, timestamp = None):
+	vm = VirtualMachineInfo(vm_id, host, 1048576)
+	vm.set_memory_values(1048576, 1048576, 524288)
+	vm.timestamp = timestamp
+	return vm
+
+class TestStaleVMs(ConfigTestCase):
+
+	def test_skipped_stale_vm_is_rescheduled(self):
+		self.set_config(ADAPTIVE_SCHEDULER = True, STALE_METRICS_AGE = 60.0, STALE_METRICS_POLICY = "skip",
+					SKIP_UNCHANGED_VMS = False, ONLY_TEST = True, DELAY = 5)
+		host = HostInfo(0, "host-0")
+		monitor = FakeMonitor(FakeCMP([host]))
+		now = time.time()
+		vm = create_vm(1, host, now - 3600)
+		# The VM was due before its publisher died
+		monitor.scheduler.schedule(vm.id, 50.0, Config.MEM_OVER, Config.MEM_MARGIN, now - 1000)
+		self.assertEqual(monitor.get_delay(), 0)
+
+		monitor.evaluate_due_vms(SerialPool(), [vm], None)
+
+		self.assertEqual(monitor.stale_vms, 1)
+		self.assertEqual(monitor.evaluated_vms, 0)
+		self.assertFalse(monitor.scheduler.is_due(vm.id, time.time()))
+		self.assertTrue(monitor.get_delay() > 0)
+
+class LockCheckMonitor(FakeMonitor):
+	""" Monitor that records if the monitoring information of the VM is locked in the memory changes """
+	def __init__(self, cmp):
+		FakeMonitor.__init__(self, cmp)
+		self.locked = []
+
+	def request_memory_change(self, vm_id, vm_host, new_mem, reserved = 0):
+		acquired = []
+		lock = self.vm_data.lock(vm_id)
+		def try_lock():
+			if lock.acquire(False):
+				acquired.append(True)
+				lock.release()
+		thread = threading.Thread(target=try_lock)
+		thread.start()
+		thread.join()
+		self.locked.append(not acquired)
+
+class TestMonitorVM(ConfigTestCase):
+
+	def test_memory_change_without_lock(self):
+		self.set_config(ADAPTIVE_SCHEDULER = False, STALE_METRICS_AGE = 0.0, SKIP_UNCHANGED_VMS = False,
+					ONLY_TEST = True, COOLDOWN = 0)
+		host = HostInfo(0, "host-0")
+		host.free_memory = 16777216
+		monitor = LockCheckMonitor(FakeCMP([host]))
+		monitor.update_host_pool()
+		vm = VirtualMachineInfo(1, host, 2097152)
+		# The VM is out of memory, so it grows to its allocated memory
+		vm.set_memory_values(1048576, 1048576, 0)
+		vm.timestamp = time.time()
+
+		monitor.monitor_vm(vm, None)
+
+		self.assertEqual(monitor.locked, [False])
+
+class TestMigration(ConfigTestCase):
+
+	def create_host(self, host_id, free_memory, free_cpus = 4):
+		host = HostInfo(host_id, "host-%d" % host_id)
+		host.free_memory = free_memory
+		host.free_cpus = free_cpus
+		return host
+
+	def test_reserve_host_to_migrate(self):
+		hosts = [self.create_host(0, 4194304), self.create_host(1, 3145728), self.create_host(2, 8388608, 0)]
+		monitor = FakeMonitor(FakeCMP(hosts))
+		monitor.update_host_pool()
+		# The memory increases of the loop are in the ledger, not in the host pool snapshot
+		monitor.host_ledger.debit(hosts[0], 2097152)
+
+		host = monitor.reserve_host_to_migrate(1048576, 1)
+
+		self.assertEqual(host.id, 1)
+		self.assertEqual(monitor.host_ledger.get_free_memory(hosts[1]), 2097152)
+		self.assertEqual(monitor.reserve_host_to_migrate(4194304, 1), None)
+
+if __name__ == '__main__':
+	unittest.main()
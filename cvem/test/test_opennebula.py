@@ -0,0 +1,64 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import unittest
+from contextlib import contextmanager
+from connectors.one.OpenNebula import OpenNebula
+
+class FakeServer:
+	""" XML-RPC server of ONE that fails updating some VMs """
+	def __init__(self, errors, failures, updated):
+		self.one = self
+		self.vm = self
+		self.errors = errors
+		self.failures = failures
+		self.updated = updated
+
+	def update(self, session, vm_id, template, update_type):
+		if vm_id in self.errors:
+			raise IOError("Connection reset by peer")
+		self.updated.append(vm_id)
+		return (vm_id not in self.failures, "Error", 0)
+
+class FakeServerPool:
+	def __init__(self, errors, failures):
+		self.errors = errors
+		self.failures = failures
+		self.updated = []
+
+	@contextmanager
+	def server(self):
+		yield FakeServer(self.errors, self.failures, self.updated)
+
+class TestUpdateUserTemplates(unittest.TestCase):
+
+	def setUp(self):
+		self._get_server_pool = OpenNebula._get_server_pool
+
+	def tearDown(self):
+		OpenNebula._get_server_pool = self._get_server_pool
+
+	def test_continue_after_error(self):
+		pool = FakeServerPool([2], [4])
+		OpenNebula._get_server_pool = staticmethod(lambda: pool)
+
+		failed = OpenNebula._update_user_templates([(vm_id, "MEM_OVER = 10.00\n") for vm_id in range(1, 6)])
+
+		self.assertEqual(failed, [2, 4])
+		self.assertEqual(pool.updated, [1, 3, 4, 5])
+
+if __name__ == '__main__':
+	unittest.main()
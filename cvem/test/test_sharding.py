@@ -0,0 +1,119 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import unittest
+from cvem.config import Config
+from cvem.CMPInfo import VirtualMachineInfo, HostInfo
+from cvem.Monitor import SerialPool
+from test.test_monitor import FakeCMP, FakeMonitor, ConfigTestCase
+
+class MigrationMonitor(FakeMonitor):
+	""" Monitor that records the migrations requested """
+	def __init__(self, cmp):
+		FakeMonitor.__init__(self, cmp)
+		self.migrated = []
+		self.planned = []
+
+	def migrate_vm(self, vm_id, host_info, all_vms):
+		self.migrated.append(vm_id)
+		return True
+
+	def plan_migrations(self, all_vms):
+		self.planned.extend(request.vm.id for request in self.migration_requests)
+		self.migration_requests = []
+		return 0
+
+class TestShardedCycle(ConfigTestCase):
+
+	def setUp(self):
+		ConfigTestCase.setUp(self)
+		self.set_config(PROCESS_SHARDS = 2, TIMESERIES = True, EVENT_FEED = False, STREAM_VM_LIST = False,
+					ADAPTIVE_SCHEDULER = False, SKIP_UNCHANGED_VMS = False, STALE_METRICS_AGE = 0.0,
+					CYCLE_BUDGET = 0.0, BATCH_ACTUATION = False, ASYNC_ACTUATION = False,
+					RECORD_FILE = "", ONLY_TEST = True, COOLDOWN = 0)
+		self.monitor = None
+
+	def tearDown(self):
+		if self.monitor is not None and self.monitor.shard_pool is not None:
+			self.monitor.shard_pool.stop()
+		ConfigTestCase.tearDown(self)
+
+	def test_timeseries(self):
+		hosts = []
+		vms = []
+		for host_id in range(4):
+			host = HostInfo(host_id, "host-%d" % host_id)
+			host.free_memory = 16777216
+			host.free_cpus = 8
+			hosts.append(host)
+			vm = VirtualMachineInfo(host_id, host, 2097152)
+			# The VMs with an odd ID are almost out of memory, the rest of them have a lot of free memory
+			vm.set_memory_values(2097152, 2097152, 102400 if host_id % 2 else 1572864)
+			vm.timestamp = time.time()
+			vms.append(vm)
+		self.monitor = FakeMonitor(FakeCMP(hosts, vms))
+		self.monitor.start_shard_pool()
+
+		self.monitor.run_cycle(SerialPool())
+
+		self.assertEqual(self.monitor.evaluated_vms, 4)
+		now = time.time()
+		for vm in vms:
+			samples = self.monitor.timeseries.query(vm.id, 10, now)
+			self.assertEqual([(sample['real_memory'], sample['free_memory']) for sample in samples],
+							[(vm.real_memory, vm.free_memory)])
+		# The memory decided in the coordinator is set in the samples
+		self.assertTrue(self.monitor.timeseries.query(0, 10, now)[0]['new_mem'] < 2097152)
+		self.assertEqual([vm_id for vm_id, _ in self.monitor.timeseries.top_pressure(2)], [3, 1])
+
+	def create_full_host(self):
+		host = HostInfo(0, "host-0")
+		host.free_memory = 0
+		host.free_cpus = 8
+		vms = []
+		for vm_id in range(2):
+			# The VMs are almost out of memory and they can grow up to the allocated memory
+			vm = VirtualMachineInfo(vm_id, host, 4194304)
+			vm.set_memory_values(2097152, 2097152, 102400)
+			vm.timestamp = time.time()
+			vms.append(vm)
+		return FakeCMP([host], vms)
+
+	def test_inline_migrations(self):
+		self.set_config(MIGRATION = True, MIGRATION_PLANNER = False, MIGRATION_COOLDOWN = 60)
+		self.monitor = MigrationMonitor(self.create_full_host())
+		self.monitor.start_shard_pool()
+
+		self.monitor.run_cycle(SerialPool())
+
+		# Only one VM is migrated out of the host per cooldown period
+		self.assertEqual(len(self.monitor.migrated), 1)
+		self.assertEqual(self.monitor.planned, [])
+		self.assertTrue(0 in self.monitor.last_migration)
+
+	def test_planned_migrations(self):
+		self.set_config(MIGRATION = True, MIGRATION_PLANNER = True, MIGRATION_COOLDOWN = 60)
+		self.monitor = MigrationMonitor(self.create_full_host())
+		self.monitor.start_shard_pool()
+
+		self.monitor.run_cycle(SerialPool())
+
+		self.assertEqual(self.monitor.migrated, [])
+		self.assertEqual(sorted(self.monitor.planned), [0, 1])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,47 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import unittest
+from cvem.CMPInfo import VirtualMachineInfo, HostInfo
+from cvem.SharedSnapshot import SnapshotWriter, SnapshotReader
+
+class TestSharedSnapshot(unittest.TestCase):
+
+	def setUp(self):
+		self.writer = SnapshotWriter(2)
+		self.reader = SnapshotReader(self.writer.path)
+
+	def tearDown(self):
+		self.reader.close()
+		self.writer.close()
+
+	def test_long_host_names(self):
+		names = [u"host-0", u"n\u00f2de-" * 20 + u"1.example.org", u""]
+		hosts = [HostInfo(host_id, name) for host_id, name in enumerate(names)]
+		hosts[0].free_memory = 1048576
+		vms_by_shard = [[VirtualMachineInfo(1, hosts[1], 524288)], [VirtualMachineInfo(2, hosts[0], 524288)]]
+		self.writer.write(hosts, vms_by_shard)
+
+		_, read_hosts, vms = self.reader.read_shard(0)
+
+		self.assertEqual([host.name for host in read_hosts], names)
+		self.assertEqual(read_hosts[0].free_memory, 1048576)
+		self.assertEqual([(vm.id, vm.host.name, vm.allocated_memory) for vm in vms], [(1, names[1], 524288)])
+		_, _, vms = self.reader.read_shard(1)
+		self.assertEqual([(vm.id, vm.host.id) for vm in vms], [(2, 0)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,53 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import unittest
+from cvem.CMPInfo import VirtualMachineInfo, HostInfo
+from cvem.Recording import Snapshot, vm_to_tuple, host_to_tuple
+from cvem.Simulator import SimulatedCMP
+
+class TestSimulatedCMP(unittest.TestCase):
+
+	def create_snapshot(self, timestamp, real_memory):
+		host = HostInfo(0, "host-0")
+		host.free_memory = 8388608
+		vm = VirtualMachineInfo(1, host, 4194304)
+		# The used memory of the VM is 1 GB
+		vm.real_memory = vm.total_memory = real_memory
+		vm.free_memory = real_memory - 1048576
+		vm.timestamp = timestamp
+		return Snapshot(timestamp, [vm_to_tuple(vm)], [host_to_tuple(host)])
+
+	def test_memory_saved_baseline(self):
+		cmp = SimulatedCMP()
+		# The monitor that made the recording had already shrunk the VM
+		cmp.load(self.create_snapshot(1000, 2097152))
+
+		vm = cmp.get_vm_info(1)
+		self.assertEqual(vm.real_memory, 4194304)
+		self.assertEqual(vm.free_memory, 3145728)
+		self.assertEqual(cmp.get_host_info(0).free_memory, 8388608 + 2097152 - 4194304)
+		self.assertEqual(cmp.stats.to_dict()['memory_saved'], 0)
+
+		cmp.set_memory(1, 3145728)
+		cmp.load(self.create_snapshot(1010, 2097152))
+
+		self.assertEqual(cmp.get_vm_info(1).real_memory, 3145728)
+		self.assertEqual(cmp.stats.to_dict()['memory_saved'], 1048576 / 2)
+		self.assertEqual(cmp.stats.to_dict()['memory_saved_pct'], 12.5)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import time
+import json
+import unittest
+import urllib2
+from cvem.TimeSeries import TimeSeriesStore
+from cvem.Metrics import MetricsRegistry, MetricsServer
+
+BASE_TIME = 1500000000 - 1500000000 % 300
+
+class TestTimeSeries(unittest.TestCase):
+
+	def setUp(self):
+		self.store = TimeSeriesStore(samples = 2, downsample_interval = 300, downsampled_samples = 10)
+		# The first bucket is only downsampled, as the last 2 samples are at full resolution
+		for offset, real_memory, free_memory in ((0, 1000, 500), (100, 2000, 200), (200, 3000, 400),
+												(300, 4000, 100), (400, 5000, 300)):
+			self.store.add_sample(1, BASE_TIME + offset, real_memory, 4096, free_memory)
+		self.store.add_sample(2, BASE_TIME + 400, 4096, 4096, 2048)
+
+	def test_query_downsampled(self):
+		samples = self.store.query(1, 10, BASE_TIME + 400)
+
+		self.assertEqual([sample['timestamp'] - BASE_TIME for sample in samples], [0, 300, 400])
+		# The average of the memory values and the minimum of the free memory of the bucket
+		self.assertEqual(samples[0]['real_memory'], 2000)
+		self.assertEqual(samples[0]['total_memory'], 4096)
+		self.assertEqual(samples[0]['free_memory'], 200)
+		self.assertEqual(samples[1]['free_memory'], 100)
+
+	def test_query_last_minutes(self):
+		samples = self.store.query(1, 2, BASE_TIME + 400)
+
+		self.assertEqual([sample['timestamp'] - BASE_TIME for sample in samples], [300, 400])
+		self.assertEqual(self.store.query(3, 2, BASE_TIME + 400), [])
+
+	def test_server(self):
+		server = MetricsServer(MetricsRegistry(), timeseries = self.store)
+		server.start()
+		try:
+			url = "http://127.0.0.1:%d/timeseries/" % server.port
+			opener = urllib2.build_opener(urllib2.ProxyHandler({}))
+			top = json.load(opener.open(url + "top?k=1"))
+			self.assertEqual([item['vm_id'] for item in top], [1])
+			samples = json.load(opener.open(url + "1?minutes=%d" % ((time.time() - BASE_TIME) / 60 + 10)))
+			self.assertEqual(len(samples), 3)
+			self.assertRaises(urllib2.HTTPError, opener.open, url + "other")
+		finally:
+			server.stop()
+
+if __name__ == '__main__':
+	unittest.main()
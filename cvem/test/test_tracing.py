@@ -0,0 +1,73 @@
+# -------------------------------------------------------------------------- #
+# Copyright 2015, Universitat Politecnica de Valencia                        #
+#                                                                            #
+# Licensed under the Apache License, Version 2.0 (the "License"); you may    #
+# not use this file except in compliance with the License. You may obtain    #
+# a copy of the License at                                                   #
+#                                                                            #
+# http://www.apache.org/licenses/LICENSE-2.0                                 #
+#                                                                            #
+# Unless required by applicable law or agreed to in writing, software        #
+# distributed under the License is distributed on an "AS IS" BASIS,          #
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.   #
+# See the License for the specific language governing permissions and        #
+# limitations under the License.                                             #
+#--------------------------------------------------------------------------- #
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from cvem.config import logger
+from cvem.Tracing import Tracer, NOOP_SPAN
+
+class ErrorCounter(logging.Handler):
+	def __init__(self):
+		logging.Handler.__init__(self, logging.ERROR)
+		self.count = 0
+
+	def emit(self, record):
+		self.count += 1
+
+class TestTracer(unittest.TestCase):
+
+	def setUp(self):
+		self.errors = ErrorCounter()
+		logger.addHandler(self.errors)
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		logger.removeHandler(self.errors)
+		shutil.rmtree(self.directory)
+
+	def test_trace_file_error(self):
+		tracer = Tracer(1.0, os.path.join(self.directory, "missing", "trace.json"))
+		with tracer.start_trace("loop"):
+			for _ in range(10):
+				with tracer.span("vm"):
+					pass
+
+		self.assertEqual(self.errors.count, 1)
+		self.assertTrue(tracer.disabled)
+		self.assertTrue(tracer.start_trace("loop") is NOOP_SPAN)
+
+	def test_trace_write_error(self):
+		tracer = Tracer(1.0, os.path.join(self.directory, "trace.json"))
+		with tracer.start_trace("loop"):
+			pass
+		# The file can not be written anymore
+		tracer.writer.handler.stream.close()
+		for _ in range(10):
+			with tracer.start_trace("loop"):
+				pass
+		tracer.writer.join(5)
+
+		self.assertEqual(self.errors.count, 1)
+		self.assertTrue(tracer.writer.failed)
+		with tracer.start_trace("loop"):
+			pass
+		self.assertTrue(tracer.disabled)
+
+if __name__ == '__main__':
+	unittest.main()